@@ -1,64 +1,20 @@
 #Imports das funcionalidades que serão utilizadas
-import requests
+import gravacao
 import oracledb
-import time
+import os
+import servicos
+from banco import conectar_banco, criar_pool
+from cep import base_cep, cache_cep, cliente_viacep
+from instrumentacao import medir
+from repositorio import ERROS_BANCO
 
 
-#Conexão com o banco de dados
-def conectar_banco():
-    try:
-        with open('credenciais.txt', 'r') as arquivo:
-            credenciais = [linha.strip() for linha in arquivo.readlines()]
-
-        if len(credenciais) != 3:
-            print('O arquivo de credencial deve ter somente 3 linhas!')
-
-        user, password, dsn = credenciais
-
-        conn = oracledb.connect(user=user, password=password, dsn=dsn)
-        return conn
-    except FileNotFoundError:
-        print("Arquivo de credenciais não encontrado.")
-        return None
-    except ValueError as e:
-        print(f"Erro no formato do arquivo de credenciais: {e}")
-        return None
-    except oracledb.DatabaseError as e:
-        print(f'Erro ao conectar ao banco de dados: {e}')
-        return None
-
 #Receber o CEP do usuário
 def obter_cep():
     cep = input('CEP: (ex. 01.310-100): ')
     cep = cep.replace('.', '').replace('-', '')
     return cep
 
-#Validar formato do CEP
-def validar_cep(cep):
-    return len(cep) == 8
-
-#Consultar os dados da API
-def consultar_api_viacep(cep):
-    url = f'https://viacep.com.br/ws/{cep}/json/'
-    requisicao = requests.get(url)
-    if requisicao.status_code == 200:
-        return requisicao.json()
-    else:
-        print('Erro ao requerir o CEP!')
-        return None
-
-#Pegar os dados consultados da API e guardar em um dicionário
-def extrair_dados(resposta):
-    if resposta:
-        return {
-            'cep': resposta.get('cep').replace('-', ''),
-            'uf': resposta.get('uf'),
-            'cidade': resposta.get('localidade'),
-            'rua': resposta.get('logradouro'),
-            'bairro': resposta.get('bairro')
-        }
-    return None
-
 #Variável global para armazenar o usuário atual logado, definido como none (nenhum usuário). Será alterada quando for feito login para algum usuário
 usuario_logado = None
 
@@ -93,76 +49,72 @@ def criar_conta(conn):
     email = input('Digite o email: ')
     
     #Verificar se o email já existe
-    with conn.cursor() as cur:
-        cur.execute("SELECT * FROM usuarios WHERE email = :email", email=email)
-        if cur.fetchone():
-            print('Já existe um usuário com este email cadastrado!')
-            return
+    if servicos.email_cadastrado(conn, email):
+        print('Já existe um usuário com este email cadastrado!')
+        return
 
     senha = input('Digite a senha: ')
     nome = input('Digite o seu nome completo: ')
     
     cep = obter_cep()
-    if validar_cep(cep):
-        resposta = consultar_api_viacep(cep)
-        dados = extrair_dados(resposta)
-        if dados:
-            dados['nome'] = nome
-            dados['email'] = email
-            dados['senha'] = senha
-            
-            #Try para tratamento de erro
-            try:
-                with conn.cursor() as cur:
-                    sql = """
-                        INSERT INTO usuarios (nome, email, senha, cep, uf, cidade, rua, bairro)
-                        VALUES (:nome, :email, :senha, :cep, :uf, :cidade, :rua, :bairro)
-                    """
-                    cur.execute(sql, dados)
-                    conn.commit()
-                    print('Conta criada com sucesso!')
-            except oracledb.DatabaseError as e:
-                print(f'Erro ao inserir dados no banco de dados: {e}')
-        else:
-            print('Erro ao obter dados do CEP.')
-    else:
-        print('CEP inválido!')
     
-    input('Pressione Enter para voltar ao menu principal...')
-
-#Função para listar contas registradas
-def listar_contas(conn):
+    #Try para tratamento de erro
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, nome, email, cep, uf, cidade, rua, bairro FROM usuarios")
-            contas = cur.fetchall()
-            
-            for conta in contas:
-                print('======================================================')
-                print(f'ID: {conta[0]}')
-                print(f"Nome: {conta[1]}")
-                print(f"Email: {conta[2]}")
-                print(f"CEP: {conta[3]}")
-                print(f"UF: {conta[4]}")
-                print(f"Cidade: {conta[5]}")
-                print(f"Rua: {conta[6]}")
-                print(f"Bairro: {conta[7]}")
-                
-                #Buscar e imprimir veículos associados a esta conta
-                cur.execute("SELECT marca, modelo, placa FROM veiculos WHERE id_usuario = :id", id=conta[0])
-                veiculos = cur.fetchall()
-                
-                if veiculos:
-                    print("Veículos registrados:")
-                    for veiculo in veiculos:
-                        print(f"- {veiculo[0]} {veiculo[1]}, placa: {veiculo[2]}")
-                
-                print('======================================================')
+        servicos.criar_conta(conn, nome, email, senha, cep)
+        print('Conta criada com sucesso!')
+    except servicos.ErroServico as e:
+        print(e)
     except oracledb.DatabaseError as e:
-        print(f'Erro ao listar contas: {e}')
+        print(f'Erro ao inserir dados no banco de dados: {e}')
+    
+    input('Pressione Enter para voltar ao menu principal...')
+
+#Quantidade de contas exibidas por página na listagem
+TAMANHO_PAGINA_CONTAS = 50
+
+#Imprimir os dados de uma conta e os veículos dela
+def imprimir_conta(conta):
+    print('======================================================')
+    print(f'ID: {conta["id"]}')
+    print(f"Nome: {conta['nome']}")
+    print(f"Email: {conta['email']}")
+    print(f"CEP: {conta['cep']}")
+    print(f"UF: {conta['uf']}")
+    print(f"Cidade: {conta['cidade']}")
+    print(f"Rua: {conta['rua']}")
+    print(f"Bairro: {conta['bairro']}")
+    
+    if conta['veiculos']:
+        print("Veículos registrados:")
+        for veiculo in conta['veiculos']:
+            print(f"- {veiculo['marca']} {veiculo['modelo']}, placa: {veiculo['placa']}")
     
-    #Tempo para ler a mensagem
-    time.sleep(5)
+    print('======================================================')
+
+#Função para listar contas registradas
+#As contas são buscadas por páginas (a partir do último ID exibido), já com os veículos em uma única consulta
+def listar_contas(conn, tamanho_pagina=TAMANHO_PAGINA_CONTAS):
+    ultimo_id = 0
+    while True:
+        contas_na_pagina = 0
+        try:
+            #As contas são impressas conforme chegam do banco
+            for conta in servicos.iterar_contas(conn, ultimo_id, tamanho_pagina):
+                imprimir_conta(conta)
+                ultimo_id = conta['id']
+                contas_na_pagina += 1
+        except oracledb.DatabaseError as e:
+            print(f'Erro ao listar contas: {e}')
+            break
+
+        if contas_na_pagina < tamanho_pagina:
+            break
+
+        continuar = input('Pressione Enter para ver mais contas ou digite S para parar: ')
+        if continuar.strip().upper() == 'S':
+            break
+
+    input('Pressione Enter para continuar...')
 
 #Função de login
 def login(conn):
@@ -189,44 +141,44 @@ def login(conn):
         senha_inserida = input('Digite a senha: ')
         
         try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT id, nome, email FROM usuarios WHERE email = :email AND senha = :senha", 
-                            email=email_inserido, senha=senha_inserida)
-                conta = cur.fetchone()
-                
-                if conta:
-                    usuario_logado = {'id': conta[0], 'nome': conta[1], 'email': conta[2]}
-                    print(f'Login realizado com sucesso! Bem-vindo, {usuario_logado["nome"]}.')
-                else:
-                    print('Email ou senha incorretos!')
+            conta = servicos.autenticar(conn, email_inserido, senha_inserida)
+            
+            if conta:
+                usuario_logado = conta
+                print(f'Login realizado com sucesso! Bem-vindo, {usuario_logado["nome"]}.')
+            else:
+                print('Email ou senha incorretos!')
         except oracledb.DatabaseError as e:
             print(f'Erro ao realizar login: {e}')
         
         input('Pressione Enter para voltar ao menu principal...')
 
-#Função para apagar contas
-def apagar_conta(conn):
-    listar_contas(conn)
-    
+#Função para apagar contas. Só a conta logada pode ser apagada. Retorna True se ela foi apagada
+def apagar_conta(conn, usuario_logado):
+    #O ID pode ser consultado em "Visualizar contas"; a tabela não é listada inteira a cada exclusão
     id_conta = ler_opcao('Digite o ID da conta a ser deletada: ')
+    if id_conta != usuario_logado['id']:
+        print('Por questões de segurança, você só pode apagar a conta em que está logado.')
+        input('Pressione Enter para voltar ao menu principal...')
+        return False
+    confirmacao = input(f'A conta ID {id_conta}, os veículos e os problemas dela serão apagados. Confirma? (S/N): ')
+    if confirmacao.strip().upper() != 'S':
+        print('Exclusão cancelada.')
+        input('Pressione Enter para voltar ao menu principal...')
+        return False
 
+    apagada = False
     try:
-        with conn.cursor() as cur:
-            #Deletar os veículos associados à conta
-            cur.execute("DELETE FROM veiculos WHERE id_usuario = :id", id=id_conta)
-            
-            # Deletar a conta
-            cur.execute("DELETE FROM usuarios WHERE id = :id", id=id_conta)
-            
-            if cur.rowcount > 0:
-                conn.commit()
-                print(f'Conta ID {id_conta} removida com sucesso!')
-            else:
-                print(f'Conta ID {id_conta} não encontrada!')
-    except oracledb.DatabaseError as e:
+        apagada = servicos.apagar_conta(conn, id_conta)
+        if apagada:
+            print(f'Conta ID {id_conta} removida com sucesso! Você saiu da conta.')
+        else:
+            print(f'Conta ID {id_conta} não encontrada!')
+    except ERROS_BANCO as e:
         print(f'Erro ao apagar conta: {e}')
 
     input('Pressione Enter para voltar ao menu principal...')
+    return apagada
 
 #Função para alterar informações das contas
 def alterar_informacoes(conn, usuario_logado):
@@ -239,45 +191,28 @@ def alterar_informacoes(conn, usuario_logado):
     if opcao == 1:
         novo_nome = input('Digite o novo nome: ')
         try:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE usuarios SET nome = :nome WHERE id = :id", 
-                            nome=novo_nome, id=usuario_logado['id'])
-                conn.commit()
-                usuario_logado['nome'] = novo_nome
-                print(f'Nome alterado com sucesso para {novo_nome}')
+            servicos.alterar_nome(conn, usuario_logado['id'], novo_nome)
+            usuario_logado['nome'] = novo_nome
+            print(f'Nome alterado com sucesso para {novo_nome}')
         except oracledb.DatabaseError as e:
             print(f'Erro ao alterar nome: {e}')
     elif opcao == 2:
         cep = obter_cep()
-        if validar_cep(cep):
-            resposta = consultar_api_viacep(cep)
-            dados = extrair_dados(resposta)
-            if dados:
-                try:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            UPDATE usuarios 
-                            SET cep = :cep, uf = :uf, cidade = :cidade, rua = :rua, bairro = :bairro 
-                            WHERE id = :id
-                        """, cep=dados['cep'], uf=dados['uf'], cidade=dados['cidade'], 
-                             rua=dados['rua'], bairro=dados['bairro'], id=usuario_logado['id'])
-                        conn.commit()
-                        print('Endereço atualizado com sucesso!')
-                except oracledb.DatabaseError as e:
-                    print(f'Erro ao atualizar endereço: {e}')
-            else:
-                print('Erro ao obter dados do CEP.')
-        else:
-            print('CEP inválido!')
+        try:
+            servicos.alterar_endereco(conn, usuario_logado['id'], cep)
+            print('Endereço atualizado com sucesso!')
+        except servicos.ErroServico as e:
+            print(e)
+        except oracledb.DatabaseError as e:
+            print(f'Erro ao atualizar endereço: {e}')
     elif opcao == 3:
         novo_email = input('Digite o novo email: ')
         try:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE usuarios SET email = :email WHERE id = :id", 
-                            email=novo_email, id=usuario_logado['id'])
-                conn.commit()
-                usuario_logado['email'] = novo_email
-                print(f'Email alterado com sucesso para {novo_email}')
+            servicos.alterar_email(conn, usuario_logado['id'], novo_email)
+            usuario_logado['email'] = novo_email
+            print(f'Email alterado com sucesso para {novo_email}')
+        except servicos.ErroServico as e:
+            print(e)
         except oracledb.DatabaseError as e:
             print(f'Erro ao alterar email: {e}')
     
@@ -306,6 +241,7 @@ def sub_informacoes_conta(conn):
 
 #Submenu de gerenciamento de contas
 def gerenciar_contas(conn):
+    global usuario_logado
     print('======== GERENCIAMENTO DE CONTAS ========')
     print('[1] - Visualizar contas')
     print('[2] - Apagar uma conta')
@@ -317,7 +253,9 @@ def gerenciar_contas(conn):
         case 1:
             listar_contas(conn)
         case 2:
-            apagar_conta(conn)
+            #A conta apagada era a logada: a sessão dela já foi encerrada
+            if apagar_conta(conn, usuario_logado):
+                usuario_logado = None
         case 3:
             sub_informacoes_conta(conn)
         case 4:
@@ -333,54 +271,48 @@ def registrar_veiculo(conn):
     print(f'Você está logado como {usuario_logado["nome"]}. O carro registrado estará ligado a este usuário.')
     
     chassi = input('Por favor, informe o número do chassi do carro: ')
+    analise = servicos.analisar_chassi(chassi)
     
-    if len(chassi) == 17:
+    if analise['valido']:
+        if analise['fabricante']:
+            print(f"Fabricante identificado pelo chassi: {analise['fabricante']}")
         marca = input('Por favor, informe a marca do carro: ')
         modelo = input('Por favor, informe o modelo do carro: ')
         cor = input('Por favor, informe a cor do carro: ')
         placa = input('Por favor, informe a placa do carro (ABC1D23) ou (ABC-1234): ')
         
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO veiculos (id_usuario, chassi, marca, modelo, cor, placa)
-                    VALUES (:id_usuario, :chassi, :marca, :modelo, :cor, :placa)
-                """, id_usuario=usuario_logado['id'], chassi=chassi, marca=marca, 
-                     modelo=modelo, cor=cor, placa=placa)
-                conn.commit()
-                print(f"Veículo {marca} {modelo} registrado com sucesso para {usuario_logado['nome']}!")
+            servicos.registrar_veiculo(conn, usuario_logado['id'], chassi, marca, modelo, cor, placa)
+            print(f"Veículo {marca} {modelo} registrado com sucesso para {usuario_logado['nome']}!")
+        except servicos.ErroServico as e:
+            print(e)
         except oracledb.DatabaseError as e:
             print(f'Erro ao registrar veículo: {e}')
     else:
-        print('Número do chassi inválido! Verifique a quantidade de caracteres...')
+        print(analise['erros'][0])
     
     input('Pressione Enter para retornar ao menu principal...')
 
 #Função para visualizar os veículos cadastrados
 def visualizar_veiculos(conn):
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, marca, modelo, cor, placa, chassi 
-                FROM veiculos 
-                WHERE id_usuario = :id_usuario
-            """, id_usuario=usuario_logado['id'])
-            veiculos = cur.fetchall()
-            
-            if veiculos:
-                #Imprimir as informações do veículo
-                print(f'Veículos cadastrados por {usuario_logado["nome"]}:')
-                for veiculo in veiculos:
-                    print('=============================================')
-                    print(f"ID: {veiculo[0]}")
-                    print(f"Marca: {veiculo[1]}")
-                    print(f"Modelo: {veiculo[2]}")
-                    print(f"Cor: {veiculo[3]}")
-                    print(f"Placa: {veiculo[4]}")
-                    print(f"Chassi: {veiculo[5]}")
-                    print('=============================================')
-            else:
-                print('Você não tem veículos cadastrados.')
+        veiculos = servicos.listar_veiculos(conn, usuario_logado['id'])
+        
+        if veiculos:
+            #Imprimir as informações do veículo
+            print(f'Veículos cadastrados por {usuario_logado["nome"]}:')
+            for veiculo in veiculos:
+                print('=============================================')
+                print(f"ID: {veiculo['id']}")
+                print(f"Marca: {veiculo['marca']}")
+                print(f"Modelo: {veiculo['modelo']}")
+                print(f"Cor: {veiculo['cor']}")
+                print(f"Placa: {veiculo['placa']}")
+                print(f"Chassi: {veiculo['chassi']}")
+                print(f"Problemas em aberto: {veiculo['problemas_abertos']}")
+                print('=============================================')
+        else:
+            print('Você não tem veículos cadastrados.')
     except oracledb.DatabaseError as e:
         print(f'Erro ao visualizar veículos: {e}')
 
@@ -392,14 +324,10 @@ def apagar_veiculo(conn):
     id_veiculo = ler_opcao('Informe o ID do veículo que deseja remover: ')
     
     try:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM veiculos WHERE id = :id AND id_usuario = :id_usuario", 
-                        id=id_veiculo, id_usuario=usuario_logado['id'])
-            if cur.rowcount > 0:
-                conn.commit()
-                print(f'Veículo ID {id_veiculo} removido com sucesso!')
-            else:
-                print('Veículo não encontrado ou não pertence a este usuário.')
+        if servicos.apagar_veiculo(conn, id_veiculo, usuario_logado['id']):
+            print(f'Veículo ID {id_veiculo} removido com sucesso!')
+        else:
+            print('Veículo não encontrado ou não pertence a este usuário.')
     except oracledb.DatabaseError as e:
         print(f'Erro ao apagar veículo: {e}')
     
@@ -411,43 +339,87 @@ def alterar_informacoes_veiculo(conn):
     id_veiculo = ler_opcao('Informe o ID do veículo que deseja alterar: ')
     
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT marca, modelo, cor, placa 
-                FROM veiculos 
-                WHERE id = :id AND id_usuario = :id_usuario
-            """, id=id_veiculo, id_usuario=usuario_logado['id'])
-            veiculo = cur.fetchone()
+        veiculo = servicos.obter_veiculo(conn, id_veiculo, usuario_logado['id'])
+        
+        if veiculo:
+            print(f"Alterando informações do veículo {veiculo['marca']} {veiculo['modelo']}:")
+            nova_marca = input(f"Informe a nova marca (atual: {veiculo['marca']}): ") 
+            novo_modelo = input(f"Informe o novo modelo (atual: {veiculo['modelo']}): ") 
+            nova_cor = input(f"Informe a nova cor (atual: {veiculo['cor']}): ") 
+            nova_placa = input(f"Informe a nova placa (atual: {veiculo['placa']}): ") 
             
-            if veiculo:
-                print(f'Alterando informações do veículo {veiculo[0]} {veiculo[1]}:')
-                nova_marca = input(f'Informe a nova marca (atual: {veiculo[0]}): ') 
-                novo_modelo = input(f'Informe o novo modelo (atual: {veiculo[1]}): ') 
-                nova_cor = input(f'Informe a nova cor (atual: {veiculo[2]}): ') 
-                nova_placa = input(f'Informe a nova placa (atual: {veiculo[3]}): ') 
-                
-                cur.execute("""
-                    UPDATE veiculos 
-                    SET marca = :marca, modelo = :modelo, cor = :cor, placa = :placa 
-                    WHERE id = :id AND id_usuario = :id_usuario
-                """, marca=nova_marca, modelo=novo_modelo, cor=nova_cor, placa=nova_placa, 
-                     id=id_veiculo, id_usuario=usuario_logado['id'])
-                conn.commit()
+            if servicos.alterar_veiculo(conn, id_veiculo, usuario_logado['id'],
+                                        nova_marca, novo_modelo, nova_cor, nova_placa):
                 print('Informações alteradas com sucesso!')
             else:
                 print('Veículo não encontrado ou não pertence a este usuário.')
+        else:
+            print('Veículo não encontrado ou não pertence a este usuário.')
+    except servicos.ErroServico as e:
+        print(e)
     except oracledb.DatabaseError as e:
         print(f'Erro ao alterar informações do veículo: {e}')
     
     input('Pressione Enter para voltar ao menu...')
 
+#Quantidade de veículos exibidos por página na busca
+TAMANHO_PAGINA_BUSCA = 20
+
+#Buscar veículos de todos os usuários pela placa, chassi, marca ou modelo
+def buscar_veiculos(conn, tamanho_pagina=TAMANHO_PAGINA_BUSCA):
+    print('============ BUSCA DE VEÍCULOS ============')
+    print('Preencha um ou mais campos (Enter para ignorar).')
+    placa = input('Placa (ABC1D23) ou (ABC-1234): ')
+    chassi = input('Chassi: ')
+    marca = input('Marca (ou o começo dela): ')
+    modelo = input('Modelo (ou o começo dele): ')
+    aproximado = False
+    if marca.strip() or modelo.strip():
+        aproximado = input('Incluir nomes parecidos (erros de digitação)? (S/N): ').strip().upper() == 'S'
+
+    ultimo_id = 0
+    encontrados = 0
+    while True:
+        try:
+            veiculos = servicos.buscar_veiculos(conn, placa, chassi, marca, modelo, aproximado,
+                                                ultimo_id, tamanho_pagina)
+        except servicos.ErroServico as e:
+            print(e)
+            break
+        except oracledb.DatabaseError as e:
+            print(f'Erro ao buscar veículos: {e}')
+            break
+
+        for veiculo in veiculos:
+            print('=============================================')
+            print(f"ID: {veiculo['id']} (usuário ID {veiculo['id_usuario']})")
+            print(f"Marca: {veiculo['marca']}")
+            print(f"Modelo: {veiculo['modelo']}")
+            print(f"Cor: {veiculo['cor']}")
+            print(f"Placa: {veiculo['placa']}")
+            print(f"Chassi: {veiculo['chassi']}")
+        encontrados += len(veiculos)
+
+        if len(veiculos) < tamanho_pagina:
+            if not encontrados:
+                print('Nenhum veículo encontrado.')
+            break
+
+        ultimo_id = veiculos[-1]['id']
+        continuar = input('Pressione Enter para ver mais veículos ou digite S para parar: ')
+        if continuar.strip().upper() == 'S':
+            break
+
+    input('Pressione Enter para voltar ao menu...')
+
 #Submenu de gerenciamento de veículos
 def gerenciar_veiculos(conn):
     print('======== GERENCIAMENTO DE VEÍCULOS ========')
     print('[1] - Visualizar veículos')
     print('[2] - Apagar um veículo')
     print('[3] - Alterar informações de um veículo')
-    print('[4] - Voltar ao menu principal')
+    print('[4] - Buscar veículos (placa, chassi, marca ou modelo)')
+    print('[5] - Voltar ao menu principal')
     print('===========================================')
     opcao = ler_opcao('Escolha uma opção: ')
     match opcao:
@@ -458,6 +430,8 @@ def gerenciar_veiculos(conn):
         case 3:
             alterar_informacoes_veiculo(conn)
         case 4:
+            buscar_veiculos(conn)
+        case 5:
             return
         case _:
             print('Opção inválida!')
@@ -466,97 +440,109 @@ def gerenciar_veiculos(conn):
 #Função para registrar um problema, em um veículo do usuário logado
 def registrar_problema(conn):
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, marca, modelo, placa 
-                FROM veiculos 
-                WHERE id_usuario = :id_usuario
-            """, id_usuario=usuario_logado['id'])
-            veiculos = cur.fetchall()
-            
-            if not veiculos:
-                print('Você não tem veículos cadastrados.')
-                input('Pressione Enter para voltar ao menu...')
-                return
+        veiculos = servicos.listar_veiculos(conn, usuario_logado['id'])
+        
+        if not veiculos:
+            print('Você não tem veículos cadastrados.')
+            input('Pressione Enter para voltar ao menu...')
+            return
 
-            print(f"Veículos cadastrados por {usuario_logado['nome']}:")
-            for i, veiculo in enumerate(veiculos, 1):
-                print(f"[{i}] {veiculo[1]} {veiculo[2]}, placa: {veiculo[3]}")
+        print(f"Veículos cadastrados por {usuario_logado['nome']}:")
+        for i, veiculo in enumerate(veiculos, 1):
+            print(f"[{i}] {veiculo['marca']} {veiculo['modelo']}, placa: {veiculo['placa']}")
 
-            opcao = ler_opcao('Escolha o número do veículo para registrar o problema: ')
+        opcao = ler_opcao('Escolha o número do veículo para registrar o problema: ')
 
-            if 1 <= opcao <= len(veiculos):
-                veiculo_escolhido = veiculos[opcao - 1]
-                problema = input('Por favor, informe o problema encontrado no veículo: ')
+        if 1 <= opcao <= len(veiculos):
+            veiculo_escolhido = veiculos[opcao - 1]
+            problema = input('Por favor, informe o problema encontrado no veículo: ')
+            urgencia = input('Urgência: [1] Alta, [2] Normal, [3] Baixa (Enter para Normal): ').strip()
+            prioridade = int(urgencia) if urgencia in ('1', '2', '3') else 2
 
-                cur.execute("""
-                    INSERT INTO problemas (id_veiculo, descricao)
-                    VALUES (:id_veiculo, :descricao)
-                """, id_veiculo=veiculo_escolhido[0], descricao=problema)
-                conn.commit()
+            servicos.registrar_problema(conn, usuario_logado['id'], veiculo_escolhido['id'], problema, prioridade)
 
-                print(f"Problema de '{problema}' no carro {veiculo_escolhido[1]} {veiculo_escolhido[2]} "
-                      f"de {usuario_logado['nome']} registrado, e será verificado para um diagnóstico.")
-            else:
-                print('Opção inválida!')
+            print(f"Problema de '{problema}' no carro {veiculo_escolhido['marca']} {veiculo_escolhido['modelo']} "
+                  f"de {usuario_logado['nome']} registrado, e será verificado para um diagnóstico.")
+        else:
+            print('Opção inválida!')
+    except servicos.ErroServico as e:
+        print(e)
     except oracledb.DatabaseError as e:
         print(f'Erro ao registrar problema: {e}')
 
     input('Pressione Enter para voltar ao menu...')
 
+#Nome de cada opção do menu principal, usado nas métricas
+NOMES_OPCOES = {1: 'criar_conta', 2: 'login', 3: 'gerenciar_contas', 4: 'registrar_veiculo',
+                5: 'gerenciar_veiculos', 6: 'registrar_problema', 7: 'integrantes', 8: 'sair'}
+
 #Lógica principal do programa
 def main():
-    conn = conectar_banco()
+    #Com LINKCAR_POOL=1 as funções usam um pool de conexões, senão uma única conexão
+    if os.environ.get('LINKCAR_POOL') == '1':
+        conn = criar_pool()
+    else:
+        conn = conectar_banco()
     if not conn:
         print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
         return
+    #Com LINKCAR_GRAVACAO_ADIADA=1 os problemas e a auditoria são gravados em lotes, em segundo plano
+    gravacao.iniciar(conn)
 
     while True:
         menu()
         opcao = ler_opcao('Escolha uma opção: ')
-        match opcao:
-            case 1:
-                criar_conta(conn)
-            case 2:
-                login(conn)
-            case 3:
-                if usuario_logado:
-                    gerenciar_contas(conn)
-                else:
-                    print('Você não está logado!')
-                    input('Pressione Enter para retornar...')
-            case 4:
-                if usuario_logado:
-                    registrar_veiculo(conn)
-                else:
-                    print('Você não está logado!')
-                    input('Pressione Enter para retornar...')
-            case 5:
-                if usuario_logado:
-                    gerenciar_veiculos(conn)
-                else:
-                    print('Você não está logado!')
-                    input('Pressione Enter para retornar...')
-            case 6:
-                if usuario_logado:
-                    registrar_problema(conn)
-                else:
-                    print('Você não está logado!')
-                    input('Pressione Enter para retornar...')
-            case 7:
-                print('================================== INTEGRANTES ==================================')
-                print('Renato de Freitas David Campiteli - RM555627 - https://github.com/renatofdavidc')
-                print('Pedro Lucas de Oliveira Bezerra - RM558439 - https://github.com/PedrinDev1447')
-                print('Gabriel Santos Jablonski - RM555425 - https://github.com/Jablonski17')
-                print('=================================================================================')
-                input('Pressione Enter para voltar ao menu principal...')
-            case 8:
-                print('Saindo...')
-                break
-            case _:
-                print('Opção inválida!')
-
+        #Mede o tempo de cada ação do menu quando as métricas estão ativas
+        with medir('menu', NOMES_OPCOES.get(opcao, 'invalida')):
+            match opcao:
+                case 1:
+                    criar_conta(conn)
+                case 2:
+                    login(conn)
+                case 3:
+                    if usuario_logado:
+                        gerenciar_contas(conn)
+                    else:
+                        print('Você não está logado!')
+                        input('Pressione Enter para retornar...')
+                case 4:
+                    if usuario_logado:
+                        registrar_veiculo(conn)
+                    else:
+                        print('Você não está logado!')
+                        input('Pressione Enter para retornar...')
+                case 5:
+                    if usuario_logado:
+                        gerenciar_veiculos(conn)
+                    else:
+                        print('Você não está logado!')
+                        input('Pressione Enter para retornar...')
+                case 6:
+                    if usuario_logado:
+                        registrar_problema(conn)
+                    else:
+                        print('Você não está logado!')
+                        input('Pressione Enter para retornar...')
+                case 7:
+                    print('================================== INTEGRANTES ==================================')
+                    print('Renato de Freitas David Campiteli - RM555627 - https://github.com/renatofdavidc')
+                    print('Pedro Lucas de Oliveira Bezerra - RM558439 - https://github.com/PedrinDev1447')
+                    print('Gabriel Santos Jablonski - RM555425 - https://github.com/Jablonski17')
+                    print('=================================================================================')
+                    input('Pressione Enter para voltar ao menu principal...')
+                case 8:
+                    print('Saindo...')
+                    break
+                case _:
+                    print('Opção inválida!')
+
+    gravacao.encerrar()
     conn.close()
-
-#Executa o programa
-main()
\ No newline at end of file
+    cache_cep.fechar()
+    cliente_viacep.fechar()
+    if base_cep is not None:
+        base_cep.fechar()
+
+#Executa o programa, somente quando o arquivo é rodado diretamente (permite importar as funções)
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,371 @@
+#API HTTP/JSON do Link Car, para uso sem o menu do terminal
+#Um único processo atende vários clientes ao mesmo tempo: as conexões HTTP são tratadas com asyncio,
+#e as chamadas ao Oracle (bloqueantes) rodam em um pool de threads, usando o pool de conexões do banco
+import argparse
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+import gravacao
+import relatorios
+import servicos
+from banco import POOL_MAX, criar_pool
+from repositorio import ERROS_BANCO, PERIODOS_RELATORIO, PRIORIDADE_NORMAL, RepositorioSqlite
+
+TAMANHO_MAXIMO_CORPO = 1024 * 1024
+TIMEOUT_LEITURA = 30
+
+MENSAGENS_STATUS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+                    404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+#Erro que vira uma resposta HTTP com o status e a mensagem informados
+class ErroHttp(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+def _campo(corpo, nome):
+    valor = corpo.get(nome)
+    if valor is None or str(valor).strip() == '':
+        raise ErroHttp(400, f'Campo obrigatório: {nome}')
+    return str(valor).strip()
+
+
+#Rotas da API: cada função recebe o pool, os parâmetros da URL, a query string, o corpo JSON e o usuário da
+#sessão (None nas rotas públicas), e roda dentro de uma thread, então pode chamar os serviços diretamente
+def criar_conta(pool, parametros, query, corpo, usuario):
+    id_usuario = servicos.criar_conta(pool, _campo(corpo, 'nome'), _campo(corpo, 'email'),
+                                      _campo(corpo, 'senha'), _campo(corpo, 'cep'))
+    return 201, {'id': id_usuario}
+
+
+def login(pool, parametros, query, corpo, usuario):
+    conta = servicos.autenticar(pool, _campo(corpo, 'email'), _campo(corpo, 'senha'))
+    if not conta:
+        raise ErroHttp(401, 'Email ou senha incorretos!')
+    return 200, conta
+
+
+def logout(pool, parametros, query, corpo, usuario):
+    servicos.encerrar_sessao(usuario['token'])
+    return 200, {'id': usuario['id']}
+
+
+def listar_contas(pool, parametros, query, corpo, usuario):
+    ultimo_id = int(query.get('ultimo_id', 0))
+    limite = min(int(query.get('limite', 50)), 500)
+    contas = list(servicos.iterar_contas(pool, ultimo_id, limite))
+    proximo = contas[-1]['id'] if len(contas) == limite else None
+    return 200, {'contas': contas, 'proximo_ultimo_id': proximo}
+
+
+def alterar_conta(pool, parametros, query, corpo, usuario):
+    id_usuario = parametros['id_usuario']
+    resposta = {}
+    if corpo.get('nome'):
+        servicos.alterar_nome(pool, id_usuario, corpo['nome'])
+        resposta['nome'] = corpo['nome']
+    if corpo.get('email'):
+        servicos.alterar_email(pool, id_usuario, corpo['email'])
+        resposta['email'] = corpo['email']
+    if corpo.get('cep'):
+        resposta.update(servicos.alterar_endereco(pool, id_usuario, str(corpo['cep'])))
+    if not resposta:
+        raise ErroHttp(400, 'Informe nome, email ou cep para alterar.')
+    return 200, resposta
+
+
+def apagar_conta(pool, parametros, query, corpo, usuario):
+    if not servicos.apagar_conta(pool, parametros['id_usuario']):
+        raise ErroHttp(404, f"Conta ID {parametros['id_usuario']} não encontrada!")
+    return 200, {'id': parametros['id_usuario']}
+
+
+def listar_veiculos(pool, parametros, query, corpo, usuario):
+    return 200, {'veiculos': servicos.listar_veiculos(pool, parametros['id_usuario'])}
+
+
+def registrar_veiculo(pool, parametros, query, corpo, usuario):
+    id_veiculo = servicos.registrar_veiculo(pool, parametros['id_usuario'], _campo(corpo, 'chassi'),
+                                            _campo(corpo, 'marca'), _campo(corpo, 'modelo'),
+                                            _campo(corpo, 'cor'), _campo(corpo, 'placa'))
+    return 201, {'id': id_veiculo}
+
+
+def obter_veiculo(pool, parametros, query, corpo, usuario):
+    veiculo = servicos.obter_veiculo(pool, parametros['id_veiculo'], parametros['id_usuario'])
+    if not veiculo:
+        raise ErroHttp(404, 'Veículo não encontrado ou não pertence a este usuário.')
+    return 200, veiculo
+
+
+def alterar_veiculo(pool, parametros, query, corpo, usuario):
+    veiculo = servicos.obter_veiculo(pool, parametros['id_veiculo'], parametros['id_usuario'])
+    if not veiculo:
+        raise ErroHttp(404, 'Veículo não encontrado ou não pertence a este usuário.')
+    for campo in ('marca', 'modelo', 'cor', 'placa'):
+        if corpo.get(campo):
+            veiculo[campo] = corpo[campo]
+    #O veículo pode ter sido apagado entre a leitura e a alteração
+    if not servicos.alterar_veiculo(pool, parametros['id_veiculo'], parametros['id_usuario'],
+                                    veiculo['marca'], veiculo['modelo'], veiculo['cor'], veiculo['placa']):
+        raise ErroHttp(404, 'Veículo não encontrado ou não pertence a este usuário.')
+    return 200, veiculo
+
+
+def apagar_veiculo(pool, parametros, query, corpo, usuario):
+    if not servicos.apagar_veiculo(pool, parametros['id_veiculo'], parametros['id_usuario']):
+        raise ErroHttp(404, 'Veículo não encontrado ou não pertence a este usuário.')
+    return 200, {'id': parametros['id_veiculo']}
+
+
+def buscar_veiculos(pool, parametros, query, corpo, usuario):
+    ultimo_id = int(query.get('ultimo_id', 0))
+    limite = min(int(query.get('limite', 20)), 500)
+    veiculos = servicos.buscar_veiculos(pool, query.get('placa'), query.get('chassi'), query.get('marca'),
+                                        query.get('modelo'), query.get('aproximado') == '1', ultimo_id, limite)
+    proximo = veiculos[-1]['id'] if len(veiculos) == limite else None
+    return 200, {'veiculos': veiculos, 'proximo_ultimo_id': proximo}
+
+
+def registrar_problema(pool, parametros, query, corpo, usuario):
+    servicos.registrar_problema(pool, parametros['id_usuario'], parametros['id_veiculo'],
+                                _campo(corpo, 'descricao'), int(corpo.get('prioridade', PRIORIDADE_NORMAL)))
+    return 201, {'id_veiculo': parametros['id_veiculo']}
+
+
+#Corpo: {"veiculos": [{"chassi": ..., "placa": ...}, ...]}. Nada é gravado, só validado
+def validar_veiculos(pool, parametros, query, corpo, usuario):
+    veiculos = corpo.get('veiculos')
+    if not isinstance(veiculos, list) or not all(isinstance(veiculo, dict) for veiculo in veiculos):
+        raise ErroHttp(400, 'Informe a lista "veiculos", cada um com chassi e placa.')
+    if len(veiculos) > 10000:
+        raise ErroHttp(400, 'Envie no máximo 10000 veículos por vez.')
+    return 200, {'resultados': servicos.validar_veiculos(pool, veiculos)}
+
+
+#Com a gravação adiada ligada, inclui os problemas e eventos que ainda não chegaram ao banco
+def estatisticas_fila(pool, parametros, query, corpo, usuario):
+    estatisticas = servicos.estatisticas_fila(pool)
+    if gravacao.gravacao_adiada is not None:
+        estatisticas['gravacao_adiada'] = gravacao.gravacao_adiada.estatisticas()
+    return 200, estatisticas
+
+
+#Relatórios da frota, em cache (ver relatorios.py)
+def relatorio_regioes(pool, parametros, query, corpo, usuario):
+    return 200, {'regioes': relatorios.veiculos_por_regiao(pool, query.get('por_cidade') == '1')}
+
+
+def relatorio_marcas(pool, parametros, query, corpo, usuario):
+    return 200, {'marcas': relatorios.marcas_mais_comuns(pool, min(int(query.get('limite', 10)), 500))}
+
+
+def relatorio_modelos(pool, parametros, query, corpo, usuario):
+    return 200, {'modelos': relatorios.problemas_por_modelo(pool, int(query.get('minimo_veiculos', 1)))}
+
+
+def relatorio_cadastros(pool, parametros, query, corpo, usuario):
+    periodo = query.get('periodo', 'mes')
+    if periodo not in PERIODOS_RELATORIO:
+        raise ErroHttp(400, f"Período inválido. Use {', '.join(PERIODOS_RELATORIO)}.")
+    return 200, {'cadastros': relatorios.cadastros_por_periodo(pool, periodo)}
+
+
+#Tabela de rotas: (método, padrão da URL, função, exige sessão)
+#Nas rotas com id_usuario, a sessão precisa ser do próprio usuário
+ROTAS = [
+    ('POST', r'/contas', criar_conta, False),
+    ('GET', r'/contas', listar_contas, True),
+    ('POST', r'/login', login, False),
+    ('POST', r'/logout', logout, True),
+    ('GET', r'/veiculos', buscar_veiculos, True),
+    ('POST', r'/veiculos/validar', validar_veiculos, True),
+    ('GET', r'/problemas/fila', estatisticas_fila, True),
+    ('GET', r'/relatorios/regioes', relatorio_regioes, True),
+    ('GET', r'/relatorios/marcas', relatorio_marcas, True),
+    ('GET', r'/relatorios/modelos', relatorio_modelos, True),
+    ('GET', r'/relatorios/cadastros', relatorio_cadastros, True),
+    ('PATCH', r'/contas/(?P<id_usuario>\d+)', alterar_conta, True),
+    ('DELETE', r'/contas/(?P<id_usuario>\d+)', apagar_conta, True),
+    ('GET', r'/contas/(?P<id_usuario>\d+)/veiculos', listar_veiculos, True),
+    ('POST', r'/contas/(?P<id_usuario>\d+)/veiculos', registrar_veiculo, True),
+    ('GET', r'/contas/(?P<id_usuario>\d+)/veiculos/(?P<id_veiculo>\d+)', obter_veiculo, True),
+    ('PATCH', r'/contas/(?P<id_usuario>\d+)/veiculos/(?P<id_veiculo>\d+)', alterar_veiculo, True),
+    ('DELETE', r'/contas/(?P<id_usuario>\d+)/veiculos/(?P<id_veiculo>\d+)', apagar_veiculo, True),
+    ('POST', r'/contas/(?P<id_usuario>\d+)/veiculos/(?P<id_veiculo>\d+)/problemas', registrar_problema, True),
+]
+ROTAS = [(metodo, re.compile(padrao + '/?$'), funcao, exige_sessao) for metodo, padrao, funcao, exige_sessao in ROTAS]
+
+
+def encontrar_rota(metodo, caminho):
+    caminho_existe = False
+    for metodo_rota, padrao, funcao, exige_sessao in ROTAS:
+        encontrado = padrao.match(caminho)
+        if encontrado:
+            caminho_existe = True
+            if metodo_rota == metodo:
+                return funcao, {nome: int(valor) for nome, valor in encontrado.groupdict().items()}, exige_sessao
+    raise ErroHttp(405 if caminho_existe else 404, 'Rota não encontrada.')
+
+
+#Confere o token (cabeçalho Authorization: Bearer <token>) só em memória, sem ir ao banco
+def autorizar(cabecalhos, parametros):
+    autorizacao = cabecalhos.get('authorization', '')
+    token = autorizacao[7:].strip() if autorizacao.lower().startswith('bearer ') else ''
+    usuario = servicos.validar_sessao(token) if token else None
+    if not usuario:
+        raise ErroHttp(401, 'Sessão inválida ou expirada. Faça login novamente.')
+    if 'id_usuario' in parametros and parametros['id_usuario'] != usuario['id']:
+        raise ErroHttp(403, 'Você só pode acessar a sua própria conta.')
+    usuario['token'] = token
+    return usuario
+
+
+class ServidorApi:
+    def __init__(self, pool, trabalhadores=POOL_MAX):
+        self.pool = pool
+        #O número de threads acompanha o tamanho do pool, para nenhuma thread ficar esperando conexão
+        self.executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='linkcar-api')
+
+    async def executar(self, metodo, alvo, cabecalhos, corpo):
+        url = urlsplit(alvo)
+        query = {nome: valores[-1] for nome, valores in parse_qs(url.query).items()}
+        funcao, parametros, exige_sessao = encontrar_rota(metodo, url.path)
+        usuario = autorizar(cabecalhos, parametros) if exige_sessao else None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor,
+                                              partial(funcao, self.pool, parametros, query, corpo, usuario))
+        except servicos.ErroServico as e:
+            raise ErroHttp(400, str(e))
+        except ValueError:
+            raise ErroHttp(400, 'Parâmetro inválido.')
+        except ERROS_BANCO as e:
+            print(f'Erro no banco de dados: {e}')
+            raise ErroHttp(500, 'Erro no banco de dados.')
+        except ErroHttp:
+            raise
+        #Qualquer outro erro (ex. um campo do JSON com tipo inesperado) vira um 500, sem derrubar a conexão
+        except Exception as e:
+            print(f'Erro em {metodo} {url.path}: {e!r}')
+            raise ErroHttp(500, 'Erro interno no servidor.')
+
+    #Trata uma conexão HTTP/1.1, atendendo várias requisições seguidas (keep-alive)
+    async def atender(self, leitor, escritor):
+        try:
+            while True:
+                try:
+                    linha = await asyncio.wait_for(leitor.readline(), TIMEOUT_LEITURA)
+                except asyncio.TimeoutError:
+                    break
+                if not linha.strip():
+                    break
+                try:
+                    metodo, alvo, versao = linha.decode('latin-1').split()
+                except ValueError:
+                    await self.responder(escritor, 400, {'erro': 'Requisição inválida.'}, False)
+                    break
+
+                #Um cliente que para no meio da requisição não prende a conexão para sempre
+                try:
+                    cabecalhos = await asyncio.wait_for(self.ler_cabecalhos(leitor), TIMEOUT_LEITURA)
+                except asyncio.TimeoutError:
+                    break
+
+                manter = cabecalhos.get('connection', '').lower() != 'close' and versao == 'HTTP/1.1'
+                try:
+                    tamanho = int(cabecalhos.get('content-length') or 0)
+                except ValueError:
+                    tamanho = -1
+                #Sem um tamanho válido não dá para saber onde o corpo termina, então a conexão é fechada
+                if tamanho < 0:
+                    await self.responder(escritor, 400, {'erro': 'Content-Length inválido.'}, False)
+                    break
+                if tamanho > TAMANHO_MAXIMO_CORPO:
+                    await self.responder(escritor, 413, {'erro': 'Corpo da requisição muito grande.'}, False)
+                    break
+
+                try:
+                    dados = await asyncio.wait_for(leitor.readexactly(tamanho), TIMEOUT_LEITURA) if tamanho else b''
+                except asyncio.TimeoutError:
+                    break
+                try:
+                    corpo = json.loads(dados) if dados else {}
+                    if not isinstance(corpo, dict):
+                        raise ErroHttp(400, 'O corpo da requisição deve ser um objeto JSON.')
+                    status, resposta = await self.executar(metodo.upper(), alvo, cabecalhos, corpo)
+                except ErroHttp as e:
+                    status, resposta = e.status, {'erro': e.mensagem}
+                except json.JSONDecodeError:
+                    status, resposta = 400, {'erro': 'JSON inválido.'}
+
+                await self.responder(escritor, status, resposta, manter)
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def ler_cabecalhos(self, leitor):
+        cabecalhos = {}
+        while True:
+            linha = await leitor.readline()
+            if linha in (b'\r\n', b'\n', b''):
+                return cabecalhos
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+
+    async def responder(self, escritor, status, resposta, manter):
+        corpo = json.dumps(resposta, ensure_ascii=False, default=str).encode('utf-8')
+        cabecalho = (f'HTTP/1.1 {status} {MENSAGENS_STATUS.get(status, "")}\r\n'
+                     f'Content-Type: application/json; charset=utf-8\r\n'
+                     f'Content-Length: {len(corpo)}\r\n'
+                     f'Connection: {"keep-alive" if manter else "close"}\r\n\r\n')
+        escritor.write(cabecalho.encode('latin-1') + corpo)
+        await escritor.drain()
+
+    async def servir(self, host, porta):
+        servidor = await asyncio.start_server(self.atender, host, porta)
+        print(f'API do Link Car ouvindo em http://{host}:{porta}')
+        async with servidor:
+            await servidor.serve_forever()
+
+    def fechar(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API HTTP/JSON do Link Car.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--sqlite', metavar='ARQUIVO',
+                        help="Usa um banco SQLite (':memory:' para memória) em vez do Oracle, para testes locais")
+    args = parser.parse_args()
+
+    pool = RepositorioSqlite(args.sqlite) if args.sqlite else criar_pool()
+    if not pool:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        return
+
+    gravacao.iniciar(pool)
+    servidor = ServidorApi(pool)
+    try:
+        asyncio.run(servidor.servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        print('Encerrando...')
+    finally:
+        servidor.fechar()
+        gravacao.encerrar()
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
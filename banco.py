@@ -0,0 +1,94 @@
+#Acesso ao banco de dados Oracle: leitura das credenciais e pool de conexões
+import os
+from contextlib import contextmanager
+
+import oracledb
+
+from instrumentacao import instrumentar_conexao
+
+ARQUIVO_CREDENCIAIS = 'credenciais.txt'
+
+#Tamanho do pool, pode ser ajustado pelas variáveis de ambiente LINKCAR_POOL_MIN e LINKCAR_POOL_MAX
+POOL_MIN = int(os.environ.get('LINKCAR_POOL_MIN', 1))
+POOL_MAX = int(os.environ.get('LINKCAR_POOL_MAX', 8))
+#Quantidade de comandos SQL preparados guardados por conexão
+CACHE_COMANDOS = 40
+#Intervalo (segundos) sem uso depois do qual a conexão é testada (ping) antes de ser entregue
+INTERVALO_PING = 60
+
+
+#Ler o usuário, a senha e o dsn do arquivo de credenciais
+def ler_credenciais(arquivo=ARQUIVO_CREDENCIAIS):
+    with open(arquivo, 'r') as arquivo_credenciais:
+        credenciais = [linha.strip() for linha in arquivo_credenciais.readlines()]
+
+    if len(credenciais) != 3:
+        print('O arquivo de credencial deve ter somente 3 linhas!')
+
+    user, password, dsn = credenciais
+    return user, password, dsn
+
+
+#Conexão com o banco de dados
+def conectar_banco():
+    try:
+        user, password, dsn = ler_credenciais()
+
+        conn = oracledb.connect(user=user, password=password, dsn=dsn)
+        return conn
+    except FileNotFoundError:
+        print("Arquivo de credenciais não encontrado.")
+        return None
+    except ValueError as e:
+        print(f"Erro no formato do arquivo de credenciais: {e}")
+        return None
+    except oracledb.DatabaseError as e:
+        print(f'Erro ao conectar ao banco de dados: {e}')
+        return None
+
+
+#Criar um pool de conexões, compartilhado entre funções, threads ou trabalhadores
+def criar_pool(minimo=POOL_MIN, maximo=POOL_MAX, cache_comandos=CACHE_COMANDOS, intervalo_ping=INTERVALO_PING):
+    try:
+        user, password, dsn = ler_credenciais()
+        return oracledb.create_pool(user=user, password=password, dsn=dsn,
+                                    min=minimo, max=maximo, increment=1,
+                                    stmtcachesize=cache_comandos, ping_interval=intervalo_ping,
+                                    getmode=oracledb.POOL_GETMODE_WAIT)
+    except FileNotFoundError:
+        print("Arquivo de credenciais não encontrado.")
+        return None
+    except ValueError as e:
+        print(f"Erro no formato do arquivo de credenciais: {e}")
+        return None
+    except oracledb.DatabaseError as e:
+        print(f'Erro ao criar o pool de conexões: {e}')
+        return None
+
+
+#Entrega uma conexão para uso. Aceita tanto um pool quanto uma conexão única (que é apenas repassada)
+#Com as métricas ativas (instrumentacao.py), a conexão entregue mede cada comando SQL
+#Conexões do pool são devolvidas no final, e descartadas se tiverem caído, para que o próximo uso pegue uma nova
+#Uma conexão que já chega caída do pool é trocada por outra antes de ser entregue, sem chegar a falhar no uso
+@contextmanager
+def emprestar_conexao(origem):
+    if not isinstance(origem, oracledb.ConnectionPool):
+        yield instrumentar_conexao(origem)
+        return
+
+    conn = origem.acquire()
+    if not conn.is_healthy():
+        origem.drop(conn)
+        conn = origem.acquire()
+    try:
+        yield instrumentar_conexao(conn)
+    except oracledb.DatabaseError:
+        if conn.is_healthy():
+            origem.release(conn)
+        else:
+            origem.drop(conn)
+        conn = None
+        raise
+    finally:
+        if conn is not None:
+            origem.release(conn)
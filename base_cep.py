@@ -0,0 +1,198 @@
+#Base offline de CEPs: um arquivo de índice, aberto com mmap, que responde como a ViaCEP sem acessar a rede
+#O arquivo é gerado a partir de dumps no formato da ViaCEP (CSV ou JSON por linha) com "python base_cep.py construir"
+#
+#Formato do arquivo (inteiros de 32 bits little-endian):
+#  cabeçalho: MAGICO, quantidade de CEPs, quantidade de textos
+#  CEPs: os CEPs como números, em ordem crescente (busca binária)
+#  registros: um por CEP, na mesma ordem: uf (2 bytes), 2 bytes livres e os índices de cidade, rua e bairro
+#  textos: posições de início de cada texto (quantidade + 1) seguidas dos textos em UTF-8, sem repetições
+import argparse
+import bisect
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+
+ARQUIVO_BASE_PADRAO = os.environ.get('LINKCAR_BASE_CEP', 'base_cep.idx')
+MAGICO = b'LCEPIDX1'
+CABECALHO = struct.Struct('<8sII')
+REGISTRO = struct.Struct('<2s2xIII')
+INTEIRO = struct.Struct('<I')
+
+#Nomes de colunas aceitos nos dumps para cada campo (ViaCEP e nomes usados no banco)
+ALIASES = {
+    'cep': ('cep',),
+    'uf': ('uf', 'estado'),
+    'cidade': ('localidade', 'cidade', 'municipio'),
+    'rua': ('logradouro', 'rua', 'endereco'),
+    'bairro': ('bairro',),
+}
+
+
+class BaseCep:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with open(caminho, 'rb') as arquivo:
+            self.mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, self.quantidade, quantidade_textos = CABECALHO.unpack_from(self.mapa, 0)
+        if magico != MAGICO:
+            self.mapa.close()
+            raise ValueError(f'{caminho} não é uma base de CEPs do Link Car.')
+
+        inicio_ceps = CABECALHO.size
+        self.inicio_registros = inicio_ceps + 4 * self.quantidade
+        inicio_textos = self.inicio_registros + REGISTRO.size * self.quantidade
+        self.inicio_blob = inicio_textos + 4 * (quantidade_textos + 1)
+        #Nas máquinas little-endian (quase todas), os CEPs são lidos direto do arquivo mapeado, sem cópia,
+        #e a busca binária do bisect roda em C sobre eles
+        if sys.byteorder == 'little':
+            visao = memoryview(self.mapa)
+            self.ceps = visao[inicio_ceps:self.inicio_registros].cast('I')
+            self.posicoes = visao[inicio_textos:self.inicio_blob].cast('I')
+        else:
+            self.ceps = [valor for valor, in INTEIRO.iter_unpack(self.mapa[inicio_ceps:self.inicio_registros])]
+            self.posicoes = [valor for valor, in INTEIRO.iter_unpack(self.mapa[inicio_textos:self.inicio_blob])]
+
+    #Abre a base se o arquivo existir, senão retorna None (sem base offline)
+    @classmethod
+    def abrir(cls, caminho=ARQUIVO_BASE_PADRAO):
+        if not caminho or not os.path.exists(caminho):
+            return None
+        try:
+            return cls(caminho)
+        except (OSError, ValueError, struct.error) as e:
+            print(f'Base offline de CEPs indisponível: {e}')
+            return None
+
+    def _texto(self, indice):
+        return self.mapa[self.inicio_blob + self.posicoes[indice]:self.inicio_blob + self.posicoes[indice + 1]] \
+            .decode('utf-8')
+
+    #Mesmo formato de resposta da ViaCEP, ou None se o CEP não estiver na base
+    def consultar(self, cep):
+        try:
+            valor = int(cep)
+        except ValueError:
+            return None
+        posicao = bisect.bisect_left(self.ceps, valor)
+        if posicao == self.quantidade or self.ceps[posicao] != valor:
+            return None
+        uf, cidade, rua, bairro = REGISTRO.unpack_from(self.mapa, self.inicio_registros + REGISTRO.size * posicao)
+        cep = f'{valor:08d}'
+        return {'cep': f'{cep[:5]}-{cep[5:]}', 'uf': uf.decode('ascii').strip(), 'localidade': self._texto(cidade),
+                'logradouro': self._texto(rua), 'bairro': self._texto(bairro)}
+
+    def __len__(self):
+        return self.quantidade
+
+    def fechar(self):
+        if isinstance(self.ceps, memoryview):
+            self.ceps.release()
+            self.posicoes.release()
+        self.mapa.close()
+
+
+def _campo(linha, campo):
+    for nome in ALIASES[campo]:
+        valor = linha.get(nome)
+        if valor is not None:
+            return str(valor).strip()
+    return ''
+
+
+#Lê um dump (CSV com cabeçalho, separado por vírgula ou ponto e vírgula, ou JSON por linha) e devolve dicionários
+def ler_dump(caminho):
+    with open(caminho, 'r', encoding='utf-8', newline='') as arquivo:
+        if caminho.lower().endswith(('.json', '.jsonl')):
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+            return
+        cabecalho = arquivo.readline()
+        arquivo.seek(0)
+        separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+        yield from csv.DictReader(arquivo, delimiter=separador)
+
+
+#Gera o arquivo de índice a partir dos dumps. Se um CEP aparece mais de uma vez, vale o último
+#O arquivo novo é gravado ao lado e trocado de uma vez, então quem está lendo a base antiga não é afetado
+def construir(dumps, saida=ARQUIVO_BASE_PADRAO):
+    registros = {}
+    ignorados = 0
+    for caminho in dumps:
+        for linha in ler_dump(caminho):
+            cep = _campo(linha, 'cep').replace('-', '').replace('.', '')
+            if len(cep) != 8 or not cep.isdigit() or linha.get('erro'):
+                ignorados += 1
+                continue
+            registros[int(cep)] = (_campo(linha, 'uf').upper()[:2], _campo(linha, 'cidade'),
+                                   _campo(linha, 'rua'), _campo(linha, 'bairro'))
+
+    #Cidades, ruas e bairros se repetem muito: cada texto é guardado uma única vez
+    indices = {}
+    textos = []
+
+    def indice(texto):
+        if texto not in indices:
+            indices[texto] = len(textos)
+            textos.append(texto.encode('utf-8'))
+        return indices[texto]
+
+    ceps = sorted(registros)
+    linhas = [(uf, indice(cidade), indice(rua), indice(bairro)) for uf, cidade, rua, bairro in
+              (registros[cep] for cep in ceps)]
+
+    temporario = f'{saida}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(CABECALHO.pack(MAGICO, len(ceps), len(textos)))
+        arquivo.write(struct.pack(f'<{len(ceps)}I', *ceps))
+        for uf, cidade, rua, bairro in linhas:
+            arquivo.write(REGISTRO.pack(uf.encode('ascii', 'replace'), cidade, rua, bairro))
+        posicao = 0
+        posicoes = [0]
+        for texto in textos:
+            posicao += len(texto)
+            posicoes.append(posicao)
+        arquivo.write(struct.pack(f'<{len(posicoes)}I', *posicoes))
+        for texto in textos:
+            arquivo.write(texto)
+    try:
+        os.replace(temporario, saida)
+    except PermissionError:
+        #No Windows, um arquivo aberto com mmap não pode ser substituído
+        raise SystemExit(f'Não foi possível substituir {saida}: feche o programa que está usando a base '
+                         f'e renomeie {temporario} para {saida}.')
+    return {'ceps': len(ceps), 'textos': len(textos), 'ignorados': ignorados, 'bytes': os.path.getsize(saida)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Base offline de CEPs (índice com mmap).')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    construcao = subcomandos.add_parser('construir', help='Gera ou atualiza o índice a partir de dumps de CEPs')
+    construcao.add_argument('dumps', nargs='+', help='Arquivos CSV ou JSON por linha, no formato da ViaCEP')
+    construcao.add_argument('--saida', default=ARQUIVO_BASE_PADRAO)
+
+    consulta = subcomandos.add_parser('consultar', help='Consulta CEPs na base')
+    consulta.add_argument('ceps', nargs='+')
+    consulta.add_argument('--base', default=ARQUIVO_BASE_PADRAO)
+    args = parser.parse_args()
+
+    if args.comando == 'construir':
+        resumo = construir(args.dumps, args.saida)
+        print(f"{resumo['ceps']} CEPs e {resumo['textos']} textos gravados em {args.saida} "
+              f"({resumo['bytes'] / 1024 / 1024:.1f} MB, {resumo['ignorados']} linhas ignoradas).")
+    else:
+        base = BaseCep.abrir(args.base)
+        if base is None:
+            print(f'Base {args.base} não encontrada.')
+            return
+        for cep in args.ceps:
+            print(json.dumps(base.consultar(cep.replace('-', '').replace('.', '')), ensure_ascii=False))
+        base.fechar()
+
+
+if __name__ == '__main__':
+    main()
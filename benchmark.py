@@ -0,0 +1,319 @@
+#Benchmark dos fluxos principais do Link Car (cadastro com CEP, login, veículos e problemas)
+#Roda contra um servidor local que imita a ViaCEP e um banco local (SQLite) ou o Oracle, e salva os resultados em JSON
+import argparse
+import json
+import platform
+import random
+import statistics
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cep
+import gravacao
+import servicos
+from banco import criar_pool
+from cache_cep import CacheCep
+from repositorio import RepositorioSqlite, obter_repositorio
+from seguranca import gerar_hash_senha
+from validacao import digito_verificador
+
+UFS = ['SP', 'RJ', 'MG', 'PR', 'RS', 'BA', 'PE', 'SC']
+MARCAS = {'Fiat': ['Uno', 'Argo', 'Mobi'], 'Volkswagen': ['Gol', 'Polo', 'T-Cross'],
+          'Chevrolet': ['Onix', 'Tracker'], 'Toyota': ['Corolla', 'Yaris'], 'Honda': ['Civic', 'HR-V']}
+CORES = ['Preto', 'Branco', 'Prata', 'Vermelho', 'Azul']
+
+
+#Servidor HTTP local com as mesmas respostas da ViaCEP, para não depender da rede
+class ServidorCepFalso:
+    def __init__(self, latencia=0):
+        latencia_segundos = latencia / 1000
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if latencia_segundos:
+                    time.sleep(latencia_segundos)
+                partes = [parte for parte in self.path.split('/') if parte]
+                numero = partes[-2] if len(partes) >= 2 else ''
+                if len(numero) != 8 or not numero.isdigit():
+                    corpo, status = b'', 400
+                elif numero.startswith('99'):
+                    corpo, status = json.dumps({'erro': True}).encode(), 200
+                else:
+                    corpo = json.dumps({
+                        'cep': f'{numero[:5]}-{numero[5:]}',
+                        'logradouro': f'Rua {numero}',
+                        'bairro': f'Bairro {numero[:3]}',
+                        'localidade': f'Cidade {numero[:2]}',
+                        'uf': UFS[int(numero[0]) % len(UFS)],
+                    }).encode()
+                    status = 200
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manipulador)
+        self.url_base = f'http://127.0.0.1:{self.servidor.server_address[1]}/ws'
+        self.thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    def iniciar(self):
+        self.thread.start()
+        return self
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+#Conta os comandos SQL enviados ao banco (idas ao banco). Só disponível no SQLite
+class ContadorComandos:
+    def __init__(self, repositorio):
+        self.total = 0
+        self.trava = threading.Lock()
+        self.disponivel = isinstance(repositorio, RepositorioSqlite)
+        if self.disponivel:
+            repositorio.conn.set_trace_callback(self._contar)
+
+    def _contar(self, comando):
+        with self.trava:
+            self.total += 1
+
+
+def _texto_aleatorio(tamanho, caracteres=string.ascii_uppercase + string.digits):
+    return ''.join(random.choices(caracteres, k=tamanho))
+
+
+def _placa():
+    return _texto_aleatorio(3, string.ascii_uppercase) + random.choice(string.digits) + \
+        random.choice(string.ascii_uppercase) + _texto_aleatorio(2, string.digits)
+
+
+#Chassi válido de um fabricante nacional, com o dígito verificador calculado
+def _chassi():
+    chassi = random.choice(['9BW', '9BG', '9BD', '9BR', '93H']) + \
+        _texto_aleatorio(14, 'ABCDEFGHJKLMNPRSTUVWXYZ0123456789')
+    return chassi[:8] + digito_verificador(chassi) + chassi[9:]
+
+
+def _dados_veiculo():
+    marca = random.choice(list(MARCAS))
+    return {'chassi': _chassi(), 'marca': marca,
+            'modelo': random.choice(MARCAS[marca]), 'cor': random.choice(CORES), 'placa': _placa()}
+
+
+#Cria a massa de dados sintética: usuarios contas com veiculos_por_usuario veículos cada
+def popular(repositorio, usuarios, veiculos_por_usuario):
+    contas = []
+    #Todas as contas usam a mesma senha, então o hash é calculado uma única vez
+    hash_senha = gerar_hash_senha('senha123')
+    for i in range(usuarios):
+        numero_cep = f'{random.randint(10000000, 89999999)}'
+        dados = {'nome': f'Usuário {i}', 'email': f'seed{i}.{_texto_aleatorio(6)}@linkcar.test', 'senha': hash_senha,
+                 'cep': numero_cep, 'uf': random.choice(UFS), 'cidade': 'Cidade', 'rua': 'Rua', 'bairro': 'Bairro'}
+        id_usuario = repositorio.inserir_usuario(dados)
+        veiculos = [repositorio.inserir_veiculo(id_usuario, _dados_veiculo()) for _ in range(veiculos_por_usuario)]
+        contas.append({'id': id_usuario, 'email': dados['email'], 'senha': 'senha123', 'veiculos': veiculos})
+    return contas
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+#Executa operacao(i) operacoes vezes, com concorrencia threads, e mede latência, vazão e idas ao banco
+def medir(nome, operacao, operacoes, concorrencia, contador):
+    latencias = []
+    erros = 0
+    trava = threading.Lock()
+
+    def executar(i):
+        nonlocal erros
+        inicio = time.perf_counter()
+        try:
+            operacao(i)
+            sucesso = True
+        except Exception:
+            sucesso = False
+        duracao = (time.perf_counter() - inicio) * 1000
+        with trava:
+            if sucesso:
+                latencias.append(duracao)
+            else:
+                erros += 1
+
+    comandos_antes = contador.total
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(executar, range(operacoes)))
+    tempo_total = time.perf_counter() - inicio
+    comandos = contador.total - comandos_antes
+
+    resultado = {
+        'operacao': nome,
+        'operacoes': operacoes,
+        'erros': erros,
+        'concorrencia': concorrencia,
+        'tempo_total_s': round(tempo_total, 4),
+        'vazao_ops_s': round(operacoes / tempo_total, 2) if tempo_total else None,
+        'latencia_ms': {
+            'media': round(statistics.fmean(latencias), 3) if latencias else None,
+            'p50': round(percentil(latencias, 50), 3) if latencias else None,
+            'p95': round(percentil(latencias, 95), 3) if latencias else None,
+            'p99': round(percentil(latencias, 99), 3) if latencias else None,
+            'max': round(max(latencias), 3) if latencias else None,
+        },
+        'idas_ao_banco_por_operacao': round(comandos / operacoes, 2) if contador.disponivel and operacoes else None,
+    }
+    print(f"{nome:<22} {resultado['vazao_ops_s'] or 0:>10.1f} ops/s  "
+          f"p50 {resultado['latencia_ms']['p50'] or 0:>8.3f} ms  p95 {resultado['latencia_ms']['p95'] or 0:>8.3f} ms  "
+          f"p99 {resultado['latencia_ms']['p99'] or 0:>8.3f} ms  erros {erros}")
+    return resultado
+
+
+def executar_benchmark(repositorio, operacoes=500, concorrencia=1, usuarios=1000, veiculos_por_usuario=2,
+                       ceps_distintos=200, semente=42):
+    random.seed(semente)
+    contador = ContadorComandos(repositorio)
+    contas = popular(repositorio, usuarios, veiculos_por_usuario)
+    ceps = [f'{random.randint(10000000, 89999999)}' for _ in range(ceps_distintos)]
+    prefixo = _texto_aleatorio(6).lower()
+
+    #Veículos criados durante o benchmark, usados depois pelas operações de alterar e apagar
+    novos_veiculos = []
+    #Token da sessão de cada conta que fez login (id -> token), usados depois para validar as sessões
+    tokens = {}
+    trava = threading.Lock()
+
+    def cadastro(i):
+        servicos.criar_conta(repositorio, f'Bench {i}', f'bench{i}.{prefixo}@linkcar.test', 'senha123',
+                             random.choice(ceps))
+
+    def login(i):
+        conta = contas[i % len(contas)]
+        usuario = servicos.autenticar(repositorio, conta['email'], conta['senha'])
+        if not usuario:
+            raise RuntimeError('Login falhou')
+        with trava:
+            tokens[conta['id']] = usuario['token']
+
+    def validar_sessao(i):
+        if not servicos.validar_sessao(lista_tokens[i % len(lista_tokens)]):
+            raise RuntimeError('Sessão inválida')
+
+    def registrar_veiculo(i):
+        conta = contas[i % len(contas)]
+        dados = _dados_veiculo()
+        id_veiculo = servicos.registrar_veiculo(repositorio, conta['id'], dados['chassi'], dados['marca'],
+                                                dados['modelo'], dados['cor'], dados['placa'])
+        with trava:
+            novos_veiculos.append((conta['id'], id_veiculo))
+
+    def listar_veiculos(i):
+        servicos.listar_veiculos(repositorio, contas[i % len(contas)]['id'])
+
+    def alterar_veiculo(i):
+        id_usuario, id_veiculo = novos_veiculos[i % len(novos_veiculos)]
+        dados = _dados_veiculo()
+        servicos.alterar_veiculo(repositorio, id_veiculo, id_usuario, dados['marca'], dados['modelo'],
+                                 dados['cor'], dados['placa'])
+
+    #Os problemas são registrados nos veículos da massa inicial, que não são apagados
+    def registrar_problema(i):
+        conta = contas[i % len(contas)]
+        id_usuario, id_veiculo = conta['id'], random.choice(conta['veiculos'])
+        servicos.registrar_problema(repositorio, id_usuario, id_veiculo, f'Barulho na suspensão {i}')
+
+    def apagar_veiculo(i):
+        id_usuario, id_veiculo = novos_veiculos[i]
+        if not servicos.apagar_veiculo(repositorio, id_veiculo, id_usuario):
+            raise RuntimeError('Veículo não encontrado')
+
+    def listar_contas(i):
+        list(servicos.iterar_contas(repositorio, random.randint(0, max(0, len(contas) - 50)), 50))
+
+    #O login confere o hash da senha no banco; depois dele, cada requisição só valida o token da sessão, em memória
+    fluxos = [('cadastro_com_cep', cadastro), ('login', login), ('validar_sessao', validar_sessao),
+              ('registrar_veiculo', registrar_veiculo), ('listar_veiculos', listar_veiculos), ('alterar_veiculo', alterar_veiculo),
+              ('registrar_problema', registrar_problema), ('listar_contas', listar_contas),
+              ('apagar_veiculo', apagar_veiculo)]
+
+    resultados = []
+    lista_tokens = []
+    for nome, operacao in fluxos:
+        if operacao is validar_sessao:
+            lista_tokens = list(tokens.values())
+        resultados.append(medir(nome, operacao, operacoes, concorrencia, contador))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos fluxos do Link Car.')
+    parser.add_argument('--operacoes', type=int, default=500, help='Operações por fluxo')
+    parser.add_argument('--concorrencia', type=int, default=1, help='Threads executando ao mesmo tempo')
+    parser.add_argument('--usuarios', type=int, default=1000, help='Contas criadas antes de medir')
+    parser.add_argument('--veiculos-por-usuario', type=int, default=2)
+    parser.add_argument('--ceps-distintos', type=int, default=200, help='CEPs diferentes usados nos cadastros')
+    parser.add_argument('--latencia-cep', type=float, default=0, help='Atraso (ms) do servidor falso da ViaCEP')
+    parser.add_argument('--sem-cache-cep', action='store_true', help='Consulta a ViaCEP falsa em todo cadastro')
+    parser.add_argument('--sqlite', default=':memory:', help="Arquivo SQLite usado (padrão ':memory:')")
+    parser.add_argument('--oracle', action='store_true', help='Usa o Oracle (credenciais.txt) em vez do SQLite')
+    parser.add_argument('--gravacao-adiada', action='store_true',
+                        help='Grava problemas e auditoria em lotes, em segundo plano (ver gravacao.py)')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', default='benchmark_resultados.json')
+    args = parser.parse_args()
+
+    servidor_cep = ServidorCepFalso(args.latencia_cep).iniciar()
+    cep.cliente_viacep.url_base = servidor_cep.url_base
+    #Cache só em memória, para não misturar com o cache em disco de uso normal
+    cep.cache_cep = CacheCep(arquivo=None, capacidade=0 if args.sem_cache_cep else 10000)
+
+    banco = criar_pool() if args.oracle else RepositorioSqlite(args.sqlite)
+    if banco is None:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        servidor_cep.parar()
+        return
+    repositorio = obter_repositorio(banco)
+    if args.gravacao_adiada:
+        #Spool separado do de uso normal
+        gravacao.gravacao_adiada = gravacao.GravacaoAdiada(banco, arquivo='benchmark_gravacao.spool')
+        gravacao.gravacao_adiada.iniciar()
+
+    try:
+        resultados = executar_benchmark(repositorio, args.operacoes, args.concorrencia, args.usuarios,
+                                        args.veiculos_por_usuario, args.ceps_distintos, args.semente)
+    finally:
+        servidor_cep.parar()
+        gravacao.encerrar()
+        banco.close()
+
+    relatorio = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'banco': 'oracle' if args.oracle else 'sqlite',
+        'parametros': vars(args),
+        'estatisticas_cache_cep': cep.cache_cep.estatisticas(),
+        'resultados': resultados,
+    }
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f'Resultados salvos em {args.saida}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#Cache local dos CEPs consultados na ViaCEP
+#Camada em memória (LRU) na frente de um arquivo SQLite persistente, com expiração por TTL
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+#Valores padrão do cache
+ARQUIVO_CACHE_PADRAO = 'cache_cep.sqlite3'
+TTL_PADRAO = 30 * 24 * 60 * 60 #CEPs válidos mudam pouco, 30 dias
+TTL_NEGATIVO_PADRAO = 24 * 60 * 60 #CEPs inválidos são guardados por menos tempo, 1 dia
+CAPACIDADE_MEMORIA_PADRAO = 10000
+#Vários processos (ex. tarefas.py) usam o mesmo arquivo: quanto esperar, em segundos, quando outro está gravando
+ESPERA_ARQUIVO = 10
+
+#Marcador para diferenciar "não está no cache" de "CEP inválido guardado no cache"
+AUSENTE = object()
+
+
+class CacheCep:
+    def __init__(self, arquivo=ARQUIVO_CACHE_PADRAO, ttl=TTL_PADRAO, ttl_negativo=TTL_NEGATIVO_PADRAO,
+                 capacidade=CAPACIDADE_MEMORIA_PADRAO):
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.capacidade = capacidade
+        self.memoria = OrderedDict() #cep -> (expira_em, dados)
+        self.trava = threading.Lock()
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+
+        self.banco = None
+        if arquivo:
+            try:
+                self.banco = sqlite3.connect(arquivo, timeout=ESPERA_ARQUIVO, check_same_thread=False)
+                #WAL: as leituras não esperam as gravações dos outros processos
+                self.banco.execute("PRAGMA journal_mode=WAL")
+                self.banco.execute("""
+                    CREATE TABLE IF NOT EXISTS cep_cache (
+                        cep TEXT PRIMARY KEY,
+                        dados TEXT,
+                        expira_em REAL NOT NULL
+                    )
+                """)
+                self.banco.commit()
+            except sqlite3.Error as e:
+                print(f'Cache de CEP em disco indisponível, usando apenas memória: {e}')
+                self.banco = None
+
+    #Retorna os dados do CEP, None para CEP inválido guardado, ou AUSENTE se não estiver no cache
+    def obter(self, cep):
+        agora = time.time()
+        with self.trava:
+            item = self.memoria.get(cep)
+            if item is not None:
+                expira_em, dados = item
+                if expira_em > agora:
+                    self.memoria.move_to_end(cep)
+                    self.acertos_memoria += 1
+                    return dict(dados) if dados else None
+                del self.memoria[cep]
+
+            if self.banco is not None:
+                try:
+                    linha = self.banco.execute(
+                        "SELECT dados, expira_em FROM cep_cache WHERE cep = ?", (cep,)).fetchone()
+                except sqlite3.Error:
+                    #Arquivo travado ou com problema: o CEP é consultado como se não estivesse no cache
+                    linha = None
+                if linha and linha[1] > agora:
+                    dados = json.loads(linha[0]) if linha[0] else None
+                    self._guardar_memoria(cep, linha[1], dados)
+                    self.acertos_disco += 1
+                    return dict(dados) if dados else None
+
+            self.falhas += 1
+            return AUSENTE
+
+    #Guarda os dados extraídos do CEP. dados=None registra o CEP como inválido (cache negativo)
+    def guardar(self, cep, dados):
+        expira_em = time.time() + (self.ttl if dados else self.ttl_negativo)
+        dados = dict(dados) if dados else None
+        with self.trava:
+            self._guardar_memoria(cep, expira_em, dados)
+            if self.banco is not None:
+                try:
+                    self.banco.execute(
+                        "INSERT OR REPLACE INTO cep_cache (cep, dados, expira_em) VALUES (?, ?, ?)",
+                        (cep, json.dumps(dados) if dados else None, expira_em))
+                    self.banco.commit()
+                except sqlite3.Error as e:
+                    print(f'Erro ao gravar CEP no cache: {e}')
+
+    def _guardar_memoria(self, cep, expira_em, dados):
+        self.memoria[cep] = (expira_em, dados)
+        self.memoria.move_to_end(cep)
+        while len(self.memoria) > self.capacidade:
+            self.memoria.popitem(last=False)
+
+    #Remove do disco as entradas já expiradas
+    def limpar_expirados(self):
+        if self.banco is None:
+            return 0
+        with self.trava:
+            cur = self.banco.execute("DELETE FROM cep_cache WHERE expira_em <= ?", (time.time(),))
+            self.banco.commit()
+            return cur.rowcount
+
+    def estatisticas(self):
+        with self.trava:
+            return {
+                'acertos_memoria': self.acertos_memoria,
+                'acertos_disco': self.acertos_disco,
+                'falhas': self.falhas,
+                'itens_memoria': len(self.memoria),
+            }
+
+    def fechar(self):
+        with self.trava:
+            if self.banco is not None:
+                self.banco.close()
+                self.banco = None
@@ -0,0 +1,67 @@
+#Consulta de CEPs: validação, API da ViaCEP, base offline e cache local
+from base_cep import BaseCep
+from cache_cep import CacheCep, AUSENTE
+from cliente_cep import ClienteViaCep, ViaCepIndisponivel
+from instrumentacao import medir_funcao
+
+
+#Validar formato do CEP: 8 dígitos, sem pontos e traço
+def validar_cep(cep):
+    return len(cep) == 8 and cep.isdigit()
+
+#Cliente HTTP da ViaCEP, com conexões reaproveitadas, timeout e novas tentativas
+cliente_viacep = ClienteViaCep()
+
+#Consultar os dados da API
+@medir_funcao('http', 'viacep', resultado_erro=lambda resposta: resposta is None)
+def consultar_api_viacep(cep):
+    try:
+        resposta = cliente_viacep.consultar(cep)
+    except ViaCepIndisponivel as e:
+        print(e)
+        return None
+    if resposta is None:
+        print('Erro ao requerir o CEP!')
+    return resposta
+
+#Pegar os dados consultados da API e guardar em um dicionário
+def extrair_dados(resposta):
+    if resposta and not resposta.get('erro'):
+        return {
+            'cep': resposta.get('cep').replace('-', ''),
+            'uf': resposta.get('uf'),
+            'cidade': resposta.get('localidade'),
+            'rua': resposta.get('logradouro'),
+            'bairro': resposta.get('bairro')
+        }
+    return None
+
+#Cache local dos CEPs já consultados, para não repetir a requisição na ViaCEP
+cache_cep = CacheCep()
+
+#Base offline de CEPs (base_cep.py), usada quando o arquivo de índice existe. None sem a base
+base_cep = BaseCep.abrir()
+
+#Buscar os dados do CEP, consultando o cache, depois a base offline e, só se o CEP não estiver nela, a API
+def buscar_endereco(cep):
+    #Um CEP com formato inválido não existe: nem o cache nem a API são consultados
+    if not validar_cep(cep):
+        return None
+
+    dados = cache_cep.obter(cep)
+    if dados is not AUSENTE:
+        return dados
+
+    if base_cep is not None:
+        resposta = base_cep.consultar(cep)
+        if resposta is not None:
+            return extrair_dados(resposta)
+
+    resposta = consultar_api_viacep(cep)
+    if resposta is None:
+        #Falha na requisição, não guarda no cache para tentar novamente depois
+        return None
+
+    dados = extrair_dados(resposta)
+    cache_cep.guardar(cep, dados)
+    return dados
@@ -0,0 +1,113 @@
+#Cliente HTTP para a API da ViaCEP
+#Reaproveita as conexões (keep-alive), aplica timeout, novas tentativas e um disjuntor (circuit breaker)
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+#Configurações padrão, a URL base pode ser trocada pela variável de ambiente VIACEP_URL (ex. servidor local de testes)
+URL_BASE_PADRAO = os.environ.get('VIACEP_URL', 'https://viacep.com.br/ws')
+TIMEOUT_CONEXAO = 3
+TIMEOUT_LEITURA = 5
+TENTATIVAS_PADRAO = 3
+ESPERA_BASE = 0.2
+ESPERA_MAXIMA = 3
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+#A ViaCEP responde 400 para um CEP com formato inválido: a resposta é a mesma do CEP não encontrado
+RESPOSTA_CEP_INVALIDO = {'erro': True}
+
+
+#Erro lançado quando o disjuntor está aberto e a ViaCEP não deve ser chamada
+class ViaCepIndisponivel(Exception):
+    pass
+
+
+#Disjuntor: depois de várias falhas seguidas, para de chamar a API por um tempo
+class Disjuntor:
+    def __init__(self, limite_falhas=5, tempo_aberto=30):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0
+        self.trava = threading.Lock()
+
+    #Retorna True se a chamada pode ser feita. Depois do tempo aberto, libera uma chamada de teste (meio aberto)
+    def permitir(self):
+        with self.trava:
+            if self.falhas_seguidas < self.limite_falhas:
+                return True
+            if time.monotonic() >= self.aberto_ate:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+                return True
+            return False
+
+    def registrar_sucesso(self):
+        with self.trava:
+            self.falhas_seguidas = 0
+            self.aberto_ate = 0
+
+    def registrar_falha(self):
+        with self.trava:
+            self.falhas_seguidas += 1
+            if self.falhas_seguidas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+    def aberto(self):
+        with self.trava:
+            return self.falhas_seguidas >= self.limite_falhas and time.monotonic() < self.aberto_ate
+
+
+class ClienteViaCep:
+    def __init__(self, url_base=URL_BASE_PADRAO, timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA),
+                 tentativas=TENTATIVAS_PADRAO, tamanho_pool=10, disjuntor=None):
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.disjuntor = disjuntor or Disjuntor()
+
+        #Sessão com pool de conexões, evita um novo handshake TCP/TLS a cada consulta
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=tamanho_pool, pool_maxsize=tamanho_pool)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+    #Tempo de espera exponencial com jitter entre as tentativas
+    def _espera(self, tentativa):
+        return random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * (2 ** tentativa)))
+
+    #Retorna o JSON da ViaCEP ({'erro': True} para CEP inexistente ou recusado com 400), ou None em caso de erro
+    #Lança ViaCepIndisponivel se o disjuntor estiver aberto
+    def consultar(self, cep):
+        if not self.disjuntor.permitir():
+            raise ViaCepIndisponivel('ViaCEP indisponível no momento, tente novamente mais tarde.')
+
+        url = f'{self.url_base}/{cep}/json/'
+        for tentativa in range(self.tentativas):
+            try:
+                requisicao = self.sessao.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                requisicao = None
+
+            if requisicao is not None and requisicao.status_code not in STATUS_REPETIR:
+                #A API respondeu: o serviço está saudável, mesmo que o CEP seja inválido (400)
+                self.disjuntor.registrar_sucesso()
+                if requisicao.status_code == 200:
+                    try:
+                        return requisicao.json()
+                    except ValueError:
+                        return None
+                if requisicao.status_code == 400:
+                    return dict(RESPOSTA_CEP_INVALIDO)
+                return None
+
+            if tentativa < self.tentativas - 1:
+                time.sleep(self._espera(tentativa))
+
+        self.disjuntor.registrar_falha()
+        return None
+
+    def fechar(self):
+        self.sessao.close()
@@ -0,0 +1,147 @@
+#Trabalhadores de diagnóstico: consomem a fila de problemas registrados pelos usuários
+#Vários processos (na mesma máquina ou em várias) podem rodar ao mesmo tempo: cada um reserva um lote de
+#problemas com SELECT ... FOR UPDATE SKIP LOCKED, então nunca dois trabalhadores pegam o mesmo problema
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import time
+import unicodedata
+
+import servicos
+from banco import conectar_banco
+from instrumentacao import medir
+from repositorio import ERROS_BANCO, RepositorioSqlite
+
+TAMANHO_LOTE = 20
+#Espera (segundos) antes de olhar a fila de novo quando ela está vazia
+INTERVALO_FILA_VAZIA = 2
+#Reservas mais antigas que isso (segundos) voltam para a fila, ex. de um trabalhador que caiu no meio do lote
+TEMPO_RESERVA = 300
+INTERVALO_ESTATISTICAS = 30
+
+#Palavras da descrição -> diagnóstico inicial. O primeiro grupo encontrado define o diagnóstico
+DIAGNOSTICOS = (
+    (('freio', 'freiar', 'pastilha', 'disco'), 'Sistema de freios: verificar pastilhas, discos e fluido.'),
+    (('motor', 'fumaca', 'superaquec', 'oleo', 'falhando'), 'Motor: verificar arrefecimento, óleo e ignição.'),
+    (('bateria', 'eletric', 'farol', 'luz', 'partida'), 'Sistema elétrico: verificar bateria, alternador e fusíveis.'),
+    (('pneu', 'calibr', 'furado', 'roda'), 'Pneus e rodas: verificar calibragem, desgaste e alinhamento.'),
+    (('suspens', 'barulho', 'amortecedor', 'batendo'), 'Suspensão: verificar amortecedores, buchas e pivôs.'),
+    (('cambio', 'marcha', 'embreagem'), 'Transmissão: verificar embreagem e câmbio.'),
+    (('ar condicionado', 'ar-condicionado', 'ventilacao'), 'Climatização: verificar gás e compressor do ar.'),
+)
+DIAGNOSTICO_PADRAO = 'Sem diagnóstico automático: encaminhado para avaliação de um mecânico.'
+
+
+def _sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+#Diagnóstico inicial a partir da descrição do problema
+def diagnosticar(problema):
+    descricao = _sem_acentos(problema['descricao'] or '')
+    for palavras, diagnostico in DIAGNOSTICOS:
+        if any(palavra in descricao for palavra in palavras):
+            return diagnostico
+    return DIAGNOSTICO_PADRAO
+
+
+def _abrir_banco(sqlite):
+    return RepositorioSqlite(sqlite) if sqlite else conectar_banco()
+
+
+#Laço de um trabalhador: reserva um lote, diagnostica e conclui o lote inteiro com um único commit
+#Com ate_esvaziar=True, termina quando não houver mais problemas pendentes
+def trabalhar(nome, tamanho_lote=TAMANHO_LOTE, ate_esvaziar=False, sqlite=None):
+    conn = _abrir_banco(sqlite)
+    if not conn:
+        return 0
+    concluidos = 0
+    ultima_limpeza = 0
+    lote = []
+    try:
+        while True:
+            if time.monotonic() - ultima_limpeza > TEMPO_RESERVA / 2:
+                devolvidas = servicos.devolver_reservas_expiradas(conn, TEMPO_RESERVA)
+                if devolvidas:
+                    print(f'[{nome}] {devolvidas} reservas expiradas voltaram para a fila.')
+                ultima_limpeza = time.monotonic()
+
+            lote = servicos.reservar_problemas(conn, nome, tamanho_lote)
+            if not lote:
+                if ate_esvaziar:
+                    break
+                time.sleep(INTERVALO_FILA_VAZIA)
+                continue
+
+            with medir('fila', 'diagnostico_lote'):
+                resultados = [(problema['id'], diagnosticar(problema)) for problema in lote]
+                concluidos += servicos.concluir_problemas(conn, nome, resultados)
+            lote = []
+    except KeyboardInterrupt:
+        pass
+    except ERROS_BANCO as e:
+        print(f'[{nome}] Erro no banco de dados: {e}')
+    finally:
+        #Um lote interrompido volta para a fila na hora, sem esperar a reserva expirar
+        if lote:
+            try:
+                servicos.devolver_problemas(conn, nome, [problema['id'] for problema in lote])
+            except ERROS_BANCO as e:
+                print(f'[{nome}] Erro ao devolver o lote: {e}')
+        conn.close()
+    return concluidos
+
+
+def _processo(nome, tamanho_lote, ate_esvaziar, sqlite):
+    concluidos = trabalhar(nome, tamanho_lote, ate_esvaziar, sqlite)
+    print(f'[{nome}] {concluidos} problemas diagnosticados.')
+
+
+def imprimir_estatisticas(conn):
+    print(json.dumps(servicos.estatisticas_fila(conn), ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trabalhadores da fila de diagnóstico de problemas.')
+    parser.add_argument('--trabalhadores', type=int, default=os.cpu_count() or 1,
+                        help='Quantidade de processos trabalhadores nesta máquina')
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Problemas reservados por vez')
+    parser.add_argument('--ate-esvaziar', action='store_true', help='Termina quando a fila ficar vazia')
+    parser.add_argument('--estatisticas', action='store_true', help='Só mostra o tamanho e os tempos da fila')
+    parser.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite em vez do Oracle')
+    args = parser.parse_args()
+
+    conn = _abrir_banco(args.sqlite)
+    if not conn:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        return
+    if args.estatisticas:
+        imprimir_estatisticas(conn)
+        conn.close()
+        return
+
+    #O nome identifica quem reservou cada problema (máquina:pid:número)
+    prefixo = f'{socket.gethostname()}:{os.getpid()}'
+    processos = [multiprocessing.Process(target=_processo, daemon=True,
+                                         args=(f'{prefixo}:{i}', args.lote, args.ate_esvaziar, args.sqlite))
+                 for i in range(args.trabalhadores)]
+    for processo in processos:
+        processo.start()
+    #Enquanto os trabalhadores rodam, mostra o tamanho da fila e os tempos de espera/diagnóstico
+    try:
+        while any(processo.is_alive() for processo in processos):
+            for processo in processos:
+                processo.join(INTERVALO_ESTATISTICAS / len(processos))
+            imprimir_estatisticas(conn)
+    except KeyboardInterrupt:
+        #O Ctrl+C chega também aos trabalhadores, que devolvem o lote atual para a fila e terminam
+        print('Encerrando os trabalhadores...')
+        for processo in processos:
+            processo.join()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
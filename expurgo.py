@@ -0,0 +1,63 @@
+#Expurgo em lote de contas, com os veículos e problemas delas
+#As contas são escolhidas pelos IDs (na linha de comando ou em um arquivo, um por linha) ou pela data do
+#último acesso, e apagadas em lotes, cada um em uma transação, sem listar a tabela inteira antes
+import argparse
+import time
+from datetime import datetime
+
+import gravacao
+import servicos
+from banco import conectar_banco
+from repositorio import ERROS_BANCO, RepositorioSqlite
+
+
+#IDs do arquivo, lidos aos poucos. Linhas vazias são ignoradas
+def ler_ids(caminho):
+    with open(caminho, 'r', encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                yield int(linha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apaga contas em lote, com os veículos e problemas delas.')
+    selecao = parser.add_mutually_exclusive_group(required=True)
+    selecao.add_argument('--ids', type=int, nargs='+', help='IDs das contas')
+    selecao.add_argument('--arquivo', help='Arquivo com um ID de conta por linha')
+    selecao.add_argument('--inativas-desde', type=datetime.fromisoformat, metavar='AAAA-MM-DD',
+                         help='Contas sem login desde a data (as que nunca entraram contam a partir da criação)')
+    parser.add_argument('--lote', type=int, default=500, help='Contas apagadas por transação (máximo 1000)')
+    parser.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite em vez do Oracle')
+    args = parser.parse_args()
+
+    conn = RepositorioSqlite(args.sqlite) if args.sqlite else conectar_banco()
+    if not conn:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        return
+
+    gravacao.iniciar(conn)
+    ids = args.ids or (ler_ids(args.arquivo) if args.arquivo else None)
+    inicio = time.perf_counter()
+    totais = None
+    try:
+        for totais in servicos.expurgar_contas(conn, ids, args.inativas_desde, args.lote):
+            print(f"Lote {totais['lotes']}: {totais['usuarios']} contas, {totais['veiculos']} veículos e "
+                  f"{totais['problemas']} problemas apagados ({time.perf_counter() - inicio:.1f} s)")
+    except ValueError as e:
+        print(f'ID inválido no arquivo: {e}')
+    except ERROS_BANCO as e:
+        #Os lotes anteriores já foram gravados; o lote com erro foi desfeito por inteiro
+        print(f'Erro ao apagar as contas: {e}')
+    finally:
+        gravacao.encerrar()
+        conn.close()
+
+    if totais:
+        print(f"Total: {totais['usuarios']} contas, {totais['veiculos']} veículos e {totais['problemas']} "
+              f"problemas apagados em {totais['lotes']} lotes.")
+    else:
+        print('Nenhuma conta encontrada para apagar.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#Gravação adiada (write-behind) dos problemas registrados e da trilha de auditoria
+#Desligada por padrão. Com LINKCAR_GRAVACAO_ADIADA=1, registrar um problema ou alterar uma conta/veículo só
+#anota o evento em um arquivo local (spool) e em memória; uma thread grava os eventos no banco em lotes
+#(executemany, um commit por lote) quando juntam TAMANHO_LOTE eventos ou passam INTERVALO_GRAVACAO segundos
+#
+#Nada se perde se o programa cair: cada evento é gravado no spool antes de ser aceito. Ao fechar um lote, o spool
+#é renomeado para um arquivo .lote, apagado só depois do commit; na próxima execução, os arquivos que sobraram
+#são gravados primeiro. O ID do lote é gravado na mesma transação, então um lote nunca é gravado duas vezes
+#Com o banco lento ou fora do ar, os eventos se acumulam até MAXIMO_PENDENTES; a partir daí, quem registra
+#espera o banco (contrapressão) e, depois de ESPERA_MAXIMA segundos, recebe FilaCheia
+#Eventos que o banco recusa (ex. problema de um veículo que já foi apagado) não travam a fila: o lote é gravado
+#um evento por vez e os recusados vão para o arquivo de rejeitados (spool + '.rejeitados'), com o erro
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+import oracledb
+
+from banco import conectar_banco
+from repositorio import ERROS_BANCO, erro_nos_dados, obter_repositorio
+
+ATIVA = os.environ.get('LINKCAR_GRAVACAO_ADIADA') == '1'
+ARQUIVO_SPOOL = os.environ.get('LINKCAR_GRAVACAO_SPOOL', 'linkcar_gravacao.spool')
+#Com LINKCAR_GRAVACAO_FSYNC=1, cada evento é forçado para o disco (resiste também a uma queda de energia)
+FSYNC = os.environ.get('LINKCAR_GRAVACAO_FSYNC') == '1'
+TAMANHO_LOTE = int(os.environ.get('LINKCAR_GRAVACAO_LOTE', 500))
+INTERVALO_GRAVACAO = float(os.environ.get('LINKCAR_GRAVACAO_INTERVALO', 1))
+MAXIMO_PENDENTES = int(os.environ.get('LINKCAR_GRAVACAO_MAXIMO', 20000))
+ESPERA_MAXIMA = 10
+#Espera (segundos) antes de tentar de novo quando o banco falha, dobrando a cada falha até o máximo
+ESPERA_ERRO_INICIAL = 1
+ESPERA_ERRO_MAXIMA = 30
+#Os IDs dos lotes gravados são guardados por alguns dias, e apagados a cada hora
+DIAS_LOTES_GRAVADOS = 7
+INTERVALO_LIMPEZA = 3600
+
+
+#Muitos eventos ainda não gravados: o banco não está dando conta
+class FilaCheia(Exception):
+    pass
+
+
+#Data e hora do evento (UTC), no formato aceito pelo Oracle (datetime.fromisoformat) e pelo SQLite
+def _agora():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def evento_problema(id_usuario, id_veiculo, descricao, prioridade):
+    return {'tipo': 'problema', 'id_usuario': id_usuario, 'id_veiculo': id_veiculo, 'descricao': descricao,
+            'prioridade': prioridade}
+
+
+#entidade: 'conta' ou 'veiculo'; acao: 'criar', 'alterar' ou 'apagar'; detalhes: campos alterados
+def evento_auditoria(id_usuario, entidade, id_entidade, acao, detalhes=None):
+    return {'tipo': 'auditoria', 'ocorrido_em': _agora(), 'id_usuario': id_usuario, 'entidade': entidade,
+            'id_entidade': id_entidade, 'acao': acao,
+            'detalhes': json.dumps(detalhes, ensure_ascii=False, default=str) if detalhes else None}
+
+
+#Um erro que pode passar sozinho (conexão caída, banco fora do ar): o lote é tentado de novo mais tarde
+#Os demais (dados recusados pelo banco, evento com um campo inválido) se repetiriam a cada tentativa
+def _erro_transitorio(erro):
+    return isinstance(erro, ERROS_BANCO) and not erro_nos_dados(erro)
+
+
+#Eventos de um arquivo de spool, e as linhas que não puderam ser lidas: (eventos, [(linha, erro)])
+#Só a última linha pode ter ficado incompleta (queda no meio da escrita, sem o '\n'), e ela é descartada; uma linha
+#ruim em qualquer outro ponto é um arquivo corrompido, e é devolvida para ir ao arquivo de rejeitados
+def _ler_eventos(caminho):
+    eventos, corrompidas = [], []
+    with open(caminho, 'r', encoding='utf-8', errors='replace') as arquivo:
+        linhas = arquivo.readlines()
+    for numero, linha in enumerate(linhas, 1):
+        try:
+            eventos.append(json.loads(linha))
+        except json.JSONDecodeError as e:
+            if numero == len(linhas) and not linha.endswith('\n'):
+                print(f'Linha incompleta ignorada em {caminho}.')
+            else:
+                corrompidas.append((linha, e))
+    return eventos, corrompidas
+
+
+class GravacaoAdiada:
+    def __init__(self, conn, arquivo=ARQUIVO_SPOOL, tamanho_lote=TAMANHO_LOTE, intervalo=INTERVALO_GRAVACAO,
+                 maximo_pendentes=MAXIMO_PENDENTES):
+        #Uma conexão única do Oracle não é dividida com a thread de gravação (um commit dela gravaria junto o que
+        #o programa estivesse no meio de fazer): a thread abre a sua. Pool e SQLite são usados direto
+        self.conexao_propria = conectar_banco() if isinstance(conn, oracledb.Connection) else None
+        self.repositorio = obter_repositorio(self.conexao_propria or conn)
+        self.arquivo = arquivo
+        self.arquivo_rejeitados = f'{arquivo}.rejeitados'
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.maximo_pendentes = maximo_pendentes
+        self.condicao = threading.Condition()
+        self.spool = None
+        self.pendentes = [] #eventos do spool atual, ainda sem lote
+        self.primeiro_em = 0 #quando chegou o evento mais antigo de pendentes
+        self.lotes = deque() #(caminho do arquivo .lote, eventos), na ordem em que devem ser gravados
+        self.em_lotes = 0 #quantidade de eventos em lotes
+        self.encerrando = False
+        self.gravados = 0
+        self.falhas = 0
+        self.rejeitados = 0
+        self.thread = None
+
+    #Recupera os eventos que ficaram da execução anterior e inicia a thread de gravação
+    def iniciar(self):
+        if os.path.exists(self.arquivo):
+            os.replace(self.arquivo, self._novo_lote())
+        #Os nomes começam pela hora em que o lote foi fechado: em ordem, os mais antigos são gravados primeiro
+        for caminho in sorted(glob.glob(f'{glob.escape(self.arquivo)}.*.lote')):
+            eventos, corrompidas = _ler_eventos(caminho)
+            for linha, erro in corrompidas:
+                self._rejeitar(self._id_lote(caminho), {'linha': linha}, erro)
+            self.lotes.append((caminho, eventos))
+            self.em_lotes += len(eventos)
+        if self.lotes:
+            print(f'{self.em_lotes} eventos não gravados na execução anterior serão gravados agora.')
+        self.thread = threading.Thread(target=self._trabalhar, daemon=True, name='linkcar-gravacao')
+        self.thread.start()
+
+    #Anota o evento no spool e na fila. Com a fila cheia, espera até ESPERA_MAXIMA segundos por espaço
+    def enfileirar(self, evento):
+        linha = json.dumps(evento, ensure_ascii=False) + '\n'
+        with self.condicao:
+            if not self.condicao.wait_for(lambda: len(self.pendentes) + self.em_lotes < self.maximo_pendentes,
+                                          ESPERA_MAXIMA):
+                raise FilaCheia('Muitos registros aguardando gravação no banco. Tente novamente em instantes.')
+            if self.spool is None:
+                self.spool = open(self.arquivo, 'a', encoding='utf-8')
+            self.spool.write(linha)
+            self.spool.flush()
+            if FSYNC:
+                os.fsync(self.spool.fileno())
+            if not self.pendentes:
+                self.primeiro_em = time.monotonic()
+            self.pendentes.append(evento)
+            if len(self.pendentes) == 1 or len(self.pendentes) >= self.tamanho_lote:
+                self.condicao.notify_all()
+
+    def _novo_lote(self):
+        return f'{self.arquivo}.{time.time_ns()}-{uuid.uuid4().hex}.lote'
+
+    #O ID do lote, gravado junto com ele, é o meio do nome do arquivo (hora-uuid)
+    def _id_lote(self, caminho):
+        return caminho[len(self.arquivo) + 1:-len('.lote')]
+
+    #Transforma o spool atual, com os eventos pendentes, em um lote. Chamado com a trava
+    def _fechar_lote(self):
+        self.spool.close()
+        self.spool = None
+        caminho = self._novo_lote()
+        os.replace(self.arquivo, caminho)
+        self.lotes.append((caminho, self.pendentes))
+        self.em_lotes += len(self.pendentes)
+        self.pendentes = []
+
+    #Segundos até o lote atual precisar ser fechado (0 se já precisa), ou None se não há eventos pendentes
+    def _tempo_para_lote(self):
+        if not self.pendentes:
+            return None
+        if len(self.pendentes) >= self.tamanho_lote or self.encerrando:
+            return 0
+        return max(0, self.primeiro_em + self.intervalo - time.monotonic())
+
+    def _trabalhar(self):
+        espera_erro = ESPERA_ERRO_INICIAL
+        proxima_limpeza = time.monotonic()
+        while True:
+            with self.condicao:
+                while not self.lotes and self._tempo_para_lote() != 0:
+                    if self.encerrando and not self.pendentes:
+                        return
+                    self.condicao.wait(self._tempo_para_lote())
+                if not self.lotes:
+                    self._fechar_lote()
+                caminho, eventos = self.lotes[0]
+
+            try:
+                rejeitados = self._gravar(self._id_lote(caminho), eventos)
+                if time.monotonic() >= proxima_limpeza:
+                    self.repositorio.esquecer_lotes(DIAS_LOTES_GRAVADOS)
+                    proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+            #Qualquer erro aqui deixa o lote no começo da fila para uma nova tentativa, sem encerrar a thread
+            except Exception as e:
+                self.falhas += 1
+                print(f'Erro ao gravar {len(eventos)} eventos no banco (nova tentativa em {espera_erro} s): {e!r}')
+                with self.condicao:
+                    self.condicao.wait_for(lambda: self.encerrando, espera_erro)
+                    if self.encerrando:
+                        #Sem banco, o lote fica no arquivo e é gravado na próxima execução
+                        return
+                espera_erro = min(espera_erro * 2, ESPERA_ERRO_MAXIMA)
+                continue
+            espera_erro = ESPERA_ERRO_INICIAL
+            os.remove(caminho)
+            with self.condicao:
+                self.lotes.popleft()
+                self.em_lotes -= len(eventos)
+                self.gravados += len(eventos) - rejeitados
+                self.condicao.notify_all()
+
+    #Grava um lote. Um lote que já estava no banco (queda entre o commit e a remoção do arquivo) não é gravado de
+    #novo. Se o banco recusar o lote por causa dos dados, cada evento é gravado sozinho (com um ID derivado do ID
+    #do lote, para também não ser repetido) e os recusados são separados. Erros transitórios são repassados
+    #Retorna quantos eventos foram recusados
+    def _gravar(self, id_lote, eventos):
+        try:
+            self.repositorio.gravar_lote(id_lote, eventos)
+            return 0
+        except Exception as e:
+            if _erro_transitorio(e):
+                raise
+            print(f'Lote com {len(eventos)} eventos não gravado ({e!r}); gravando um evento por vez.')
+        rejeitados = 0
+        for indice, evento in enumerate(eventos):
+            try:
+                self.repositorio.gravar_lote(f'{id_lote}.{indice}', [evento])
+            except Exception as e:
+                if _erro_transitorio(e):
+                    raise
+                self._rejeitar(id_lote, evento, e)
+                rejeitados += 1
+        return rejeitados
+
+    #Separa um evento recusado pelo banco no arquivo de rejeitados, para ser conferido (e corrigido) depois
+    def _rejeitar(self, id_lote, evento, erro):
+        registro = {'lote': id_lote, 'rejeitado_em': _agora(), 'erro': repr(erro), 'evento': evento}
+        with open(self.arquivo_rejeitados, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        print(f"Evento não gravado, separado em {self.arquivo_rejeitados}: {erro!r}")
+        with self.condicao:
+            self.rejeitados += 1
+
+    #Espera até todos os eventos aceitos até agora estarem no banco. Retorna False se o tempo acabar antes
+    def descarregar(self, tempo_maximo=ESPERA_MAXIMA):
+        with self.condicao:
+            self.primeiro_em = 0
+            self.condicao.notify_all()
+            return self.condicao.wait_for(lambda: not self.pendentes and not self.lotes, tempo_maximo)
+
+    #Grava o que falta (se o banco responder) e para a thread. O que não for gravado fica nos arquivos
+    def encerrar(self, tempo_maximo=ESPERA_MAXIMA):
+        with self.condicao:
+            self.encerrando = True
+            self.condicao.notify_all()
+        self.thread.join(tempo_maximo)
+        with self.condicao:
+            if self.spool is not None:
+                self.spool.close()
+                self.spool = None
+            restantes = len(self.pendentes) + self.em_lotes
+        if restantes:
+            print(f'{restantes} eventos ainda não gravados ficaram em {self.arquivo}* e serão gravados na '
+                  f'próxima execução.')
+        if self.conexao_propria is not None:
+            self.conexao_propria.close()
+
+    def estatisticas(self):
+        with self.condicao:
+            return {'pendentes': len(self.pendentes) + self.em_lotes, 'lotes': len(self.lotes),
+                    'gravados': self.gravados, 'falhas': self.falhas, 'rejeitados': self.rejeitados}
+
+
+gravacao_adiada = None
+
+
+#Liga a gravação adiada (se LINKCAR_GRAVACAO_ADIADA=1) usando conn para gravar. Chamado no início dos programas
+def iniciar(conn):
+    global gravacao_adiada
+    if ATIVA and gravacao_adiada is None:
+        gravacao_adiada = GravacaoAdiada(conn)
+        gravacao_adiada.iniciar()
+        atexit.register(encerrar)
+    return gravacao_adiada
+
+
+def encerrar():
+    global gravacao_adiada
+    if gravacao_adiada is not None:
+        gravacao_adiada.encerrar()
+        gravacao_adiada = None
+
+
+#Entrega o evento para a gravação adiada. Retorna False se ela estiver desligada (o evento deve ser gravado já)
+def enfileirar(evento):
+    if gravacao_adiada is None:
+        return False
+    gravacao_adiada.enfileirar(evento)
+    return True
@@ -0,0 +1,292 @@
+#Importação e exportação em lote de contas, veículos e problemas (CSV ou Parquet)
+#Os arquivos são lidos e gravados aos poucos, sem carregar a tabela ou o arquivo inteiro na memória
+import argparse
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import oracledb
+
+from banco import conectar_banco, emprestar_conexao
+from cep import validar_cep
+from repositorio import MAXIMO_IDS_POR_COMANDO
+from resolvedor_cep import FALHA, resolver_todos
+from seguranca import gerar_hash_senha
+from servicos import contas_importadas, validar_veiculos, veiculos_importados
+from validacao import identificadores_veiculos
+
+TAMANHO_LOTE_PADRAO = 1000
+
+#Colunas exportadas de cada tabela
+COLUNAS_EXPORTACAO = {
+    'usuarios': ['id', 'nome', 'email', 'cep', 'uf', 'cidade', 'rua', 'bairro', 'criado_em'],
+    'veiculos': ['id', 'id_usuario', 'chassi', 'marca', 'modelo', 'cor', 'placa'],
+    'problemas': ['id', 'id_veiculo', 'descricao', 'status', 'prioridade', 'criado_em'],
+}
+
+
+def _eh_parquet(caminho):
+    return caminho.lower().endswith('.parquet')
+
+
+#Importa o pyarrow somente quando um arquivo Parquet é usado
+def _importar_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise SystemExit('Para usar arquivos Parquet é necessário instalar o pyarrow (pip install pyarrow).')
+
+
+#Lê o arquivo linha a linha, devolvendo (número da linha, dicionário com os campos)
+def ler_linhas(caminho, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    if _eh_parquet(caminho):
+        pyarrow = _importar_pyarrow()
+        arquivo = pyarrow.parquet.ParquetFile(caminho)
+        numero = 0
+        for lote in arquivo.iter_batches(batch_size=tamanho_lote):
+            for linha in lote.to_pylist():
+                numero += 1
+                yield numero, linha
+    else:
+        with open(caminho, 'r', newline='', encoding='utf-8') as arquivo:
+            #A linha 1 é o cabeçalho
+            for numero, linha in enumerate(csv.DictReader(arquivo), 2):
+                yield numero, linha
+
+
+def _texto(linha, campo):
+    valor = linha.get(campo)
+    return str(valor).strip() if valor is not None else ''
+
+
+#Insere um lote com executemany. As linhas recusadas pelo banco são adicionadas em rejeitados
+#Retorna as linhas gravadas
+def _inserir_lote(conn, sql, lote, rejeitados):
+    if not lote:
+        return []
+    with emprestar_conexao(conn) as con, con.cursor() as cur:
+        cur.executemany(sql, [dados for _, dados in lote], batcherrors=True)
+        erros = {erro.offset: erro.message for erro in cur.getbatcherrors()}
+        for offset, mensagem in erros.items():
+            rejeitados.append((lote[offset][0], mensagem))
+        con.commit()
+    return [dados for offset, (_, dados) in enumerate(lote) if offset not in erros]
+
+
+#IDs das linhas recém-gravadas, encontradas pela chave única (email da conta, chassi do veículo): {chave: id}
+def _ids_gravados(conn, tabela, expressao, chaves):
+    ids = {}
+    with emprestar_conexao(conn) as con, con.cursor() as cur:
+        for inicio in range(0, len(chaves), MAXIMO_IDS_POR_COMANDO):
+            parte = chaves[inicio:inicio + MAXIMO_IDS_POR_COMANDO]
+            nomes = ', '.join(f':chave{i}' for i in range(len(parte)))
+            cur.execute(f"SELECT {expressao}, id FROM {tabela} WHERE {expressao} IN ({nomes})",
+                        {f'chave{i}': chave for i, chave in enumerate(parte)})
+            ids.update(cur.fetchall())
+    return ids
+
+
+#Valida e insere os lotes de um arquivo. validar(linha) retorna (dados, None) ou (None, motivo da recusa)
+#validar_lote(lote), opcional, confere o lote inteiro de uma vez e retorna o lote só com as linhas aceitas
+#gravado(linhas), opcional, é chamado depois do commit de cada lote com as linhas gravadas
+def _importar(conn, caminho, sql, validar, tamanho_lote, validar_lote=None, gravado=None):
+    inseridos = 0
+    rejeitados = []
+    lote = []
+
+    def inserir(lote):
+        if validar_lote and lote:
+            lote = validar_lote(lote, rejeitados)
+        linhas = _inserir_lote(conn, sql, lote, rejeitados)
+        if gravado and linhas:
+            gravado(linhas)
+        return len(linhas)
+
+    try:
+        for numero, linha in ler_linhas(caminho, tamanho_lote):
+            dados, motivo = validar(linha)
+            if motivo:
+                rejeitados.append((numero, motivo))
+                continue
+            lote.append((numero, dados))
+            if len(lote) >= tamanho_lote:
+                inseridos += inserir(lote)
+                lote = []
+        inseridos += inserir(lote)
+    except oracledb.DatabaseError as e:
+        print(f'Erro ao importar dados no banco de dados: {e}')
+
+    return {'inseridos': inseridos, 'rejeitados': rejeitados}
+
+
+#Importa contas a partir das colunas nome, email, senha e cep. O endereço é preenchido pela ViaCEP (com cache)
+#e a senha é gravada com hash
+#Por lote, os CEPs são consultados uma vez cada e em paralelo (resolvedor_cep.py), e os hashes (scrypt, lento de
+#propósito) são calculados em processos separados, um por núcleo, enquanto os CEPs são consultados
+def importar_contas(conn, caminho, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    processos = multiprocessing.cpu_count()
+
+    def validar(linha):
+        email = _texto(linha, 'email')
+        cep = _texto(linha, 'cep').replace('.', '').replace('-', '')
+        if not email:
+            return None, 'Email não informado'
+        if not validar_cep(cep):
+            return None, f'CEP inválido: {cep}'
+        return {'nome': _texto(linha, 'nome'), 'email': email, 'senha': _texto(linha, 'senha'), 'cep': cep}, None
+
+    def validar_lote(lote, rejeitados):
+        hashes = executor.map(gerar_hash_senha, [dados['senha'] for _, dados in lote],
+                              chunksize=max(1, len(lote) // (4 * processos)))
+        enderecos = resolver_todos([dados['cep'] for _, dados in lote])
+        aceitos = []
+        for (numero, dados), hash_senha in zip(lote, hashes):
+            endereco = enderecos.get(dados['cep'])
+            if endereco is FALHA:
+                rejeitados.append((numero, f"ViaCEP indisponível ao consultar o CEP: {dados['cep']}"))
+                continue
+            if not endereco:
+                rejeitados.append((numero, f"Erro ao obter dados do CEP: {dados['cep']}"))
+                continue
+            aceitos.append((numero, {**endereco, 'nome': dados['nome'], 'email': dados['email'],
+                                     'senha': hash_senha}))
+        return aceitos
+
+    def gravado(contas):
+        ids = _ids_gravados(conn, 'usuarios', 'email', [conta['email'] for conta in contas])
+        contas_importadas(conn, [{'id': ids[conta['email']], 'email': conta['email'], 'cep': conta['cep']}
+                                 for conta in contas if conta['email'] in ids])
+
+    sql = """
+        INSERT INTO usuarios (nome, email, senha, cep, uf, cidade, rua, bairro)
+        VALUES (:nome, :email, :senha, :cep, :uf, :cidade, :rua, :bairro)
+    """
+    #spawn: os processos do hash não herdam as conexões (Oracle, cache de CEPs) deste processo
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return _importar(conn, caminho, sql, validar, tamanho_lote, validar_lote, gravado)
+
+
+#Importa veículos a partir das colunas id_usuario, chassi, marca, modelo, cor e placa
+#Chassi e placa são validados e normalizados; os já cadastrados ou repetidos no arquivo são recusados
+def importar_veiculos(conn, caminho, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    def validar(linha):
+        chassi = _texto(linha, 'chassi')
+        id_usuario = _texto(linha, 'id_usuario')
+        if not id_usuario.isdigit():
+            return None, f'ID de usuário inválido: {id_usuario}'
+        return {
+            'id_usuario': int(id_usuario),
+            'chassi': chassi,
+            'marca': _texto(linha, 'marca'),
+            'modelo': _texto(linha, 'modelo'),
+            'cor': _texto(linha, 'cor'),
+            'placa': _texto(linha, 'placa'),
+        }, None
+
+    #Confere o lote inteiro de uma vez (formato e duplicados), com uma única consulta ao banco
+    def validar_lote(lote, rejeitados):
+        aceitos = []
+        for (numero, dados), resultado in zip(lote, validar_veiculos(conn, [dados for _, dados in lote])):
+            if resultado['valido']:
+                dados['chassi'] = resultado['chassi']
+                dados['placa'] = resultado['placa']
+                aceitos.append((numero, dados))
+                #Os próximos lotes do arquivo já enxergam este veículo como cadastrado
+                identificadores_veiculos.adicionar(dados['chassi'], [dados['placa']])
+            else:
+                motivo = ' '.join(resultado['erros'])
+                rejeitados.append((numero, f"{motivo} ({dados['chassi']}, {dados['placa']})"))
+        return aceitos
+
+    def gravado(veiculos):
+        ids = _ids_gravados(conn, 'veiculos', 'UPPER(chassi)', [veiculo['chassi'] for veiculo in veiculos])
+        veiculos_importados(conn, [{**veiculo, 'id': ids[veiculo['chassi']]}
+                                   for veiculo in veiculos if veiculo['chassi'] in ids])
+
+    sql = """
+        INSERT INTO veiculos (id_usuario, chassi, marca, modelo, cor, placa)
+        VALUES (:id_usuario, :chassi, :marca, :modelo, :cor, :placa)
+    """
+    return _importar(conn, caminho, sql, validar, tamanho_lote, validar_lote, gravado)
+
+
+#Exporta uma tabela para CSV ou Parquet, buscando e gravando um lote de linhas por vez
+def exportar_tabela(conn, tabela, caminho, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    colunas = COLUNAS_EXPORTACAO[tabela]
+    total = 0
+    try:
+        with emprestar_conexao(conn) as con, con.cursor() as cur:
+            cur.arraysize = tamanho_lote
+            cur.prefetchrows = tamanho_lote
+            cur.execute(f"SELECT {', '.join(colunas)} FROM {tabela} ORDER BY id")
+
+            if _eh_parquet(caminho):
+                pyarrow = _importar_pyarrow()
+                escritor = None
+                try:
+                    while True:
+                        linhas = cur.fetchmany()
+                        if not linhas:
+                            break
+                        lote = pyarrow.Table.from_pylist([dict(zip(colunas, linha)) for linha in linhas])
+                        if escritor is None:
+                            escritor = pyarrow.parquet.ParquetWriter(caminho, lote.schema)
+                        escritor.write_table(lote)
+                        total += len(linhas)
+                finally:
+                    if escritor is not None:
+                        escritor.close()
+            else:
+                with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+                    escritor = csv.writer(arquivo)
+                    escritor.writerow(colunas)
+                    while True:
+                        linhas = cur.fetchmany()
+                        if not linhas:
+                            break
+                        escritor.writerows(linhas)
+                        total += len(linhas)
+    except oracledb.DatabaseError as e:
+        print(f'Erro ao exportar {tabela}: {e}')
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importação e exportação em lote do Link Car.')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    importar = subcomandos.add_parser('importar', help='Importa contas ou veículos de um arquivo CSV/Parquet')
+    importar.add_argument('tipo', choices=['contas', 'veiculos'])
+    importar.add_argument('arquivo')
+    importar.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO, help='Linhas por lote de inserção')
+
+    exportar = subcomandos.add_parser('exportar', help='Exporta uma tabela para CSV/Parquet')
+    exportar.add_argument('tabela', choices=list(COLUNAS_EXPORTACAO))
+    exportar.add_argument('arquivo')
+    exportar.add_argument('--lote', type=int, default=TAMANHO_LOTE_PADRAO, help='Linhas buscadas por vez')
+
+    args = parser.parse_args()
+
+    conn = conectar_banco()
+    if not conn:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        return
+
+    if args.comando == 'importar':
+        importar_arquivo = importar_contas if args.tipo == 'contas' else importar_veiculos
+        resumo = importar_arquivo(conn, args.arquivo, args.lote)
+        print(f"{resumo['inseridos']} linhas importadas, {len(resumo['rejeitados'])} rejeitadas.")
+        for numero, motivo in resumo['rejeitados']:
+            print(f'- Linha {numero}: {motivo}')
+    else:
+        total = exportar_tabela(conn, args.tabela, args.arquivo, args.lote)
+        print(f'{total} linhas exportadas de {args.tabela} para {args.arquivo}.')
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#Instrumentação opcional dos pontos mais usados: consultas à ViaCEP, comandos SQL e ações do menu
+#Desligada por padrão. Com LINKCAR_METRICAS=1 são registrados histogramas de latência, linhas e idas ao banco,
+#gravados em um log estruturado (JSON por linha) e em um arquivo no formato texto do Prometheus
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+ATIVA = os.environ.get('LINKCAR_METRICAS') == '1'
+#Fração dos eventos registrados (1 = todos). Os contadores de chamadas são sempre exatos
+AMOSTRAGEM = float(os.environ.get('LINKCAR_METRICAS_AMOSTRAGEM', 1))
+ARQUIVO_PROMETHEUS = os.environ.get('LINKCAR_METRICAS_ARQUIVO', 'linkcar_metricas.prom')
+ARQUIVO_LOG = os.environ.get('LINKCAR_METRICAS_LOG', 'linkcar_metricas.log')
+INTERVALO_EXPORTACAO = 15
+
+#Limites dos buckets do histograma, em segundos
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histograma:
+    __slots__ = ('contagens', 'soma', 'total')
+
+    def __init__(self):
+        self.contagens = [0] * len(BUCKETS)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+
+class Metricas:
+    def __init__(self):
+        self.trava = threading.Lock()
+        self.latencias = {} #(tipo, nome) -> Histograma
+        self.chamadas = {} #(tipo, nome) -> quantidade
+        self.linhas = {} #(tipo, nome) -> quantidade de linhas
+        self.idas_banco = 0
+        self.erros = {} #(tipo, nome) -> quantidade
+        self.log = None
+
+    def _log(self):
+        with self.trava:
+            if self.log is None:
+                log = logging.getLogger('linkcar.metricas')
+                log.propagate = False
+                log.setLevel(logging.INFO)
+                log.addHandler(logging.FileHandler(ARQUIVO_LOG, encoding='utf-8'))
+                self.log = log
+        return self.log
+
+    def registrar(self, tipo, nome, duracao=None, linhas=0, idas_banco=0, erro=False):
+        chave = (tipo, nome)
+        amostrado = duracao is not None and random.random() < AMOSTRAGEM
+        with self.trava:
+            self.chamadas[chave] = self.chamadas.get(chave, 0) + 1
+            self.idas_banco += idas_banco
+            if linhas:
+                self.linhas[chave] = self.linhas.get(chave, 0) + linhas
+            if erro:
+                self.erros[chave] = self.erros.get(chave, 0) + 1
+            if amostrado:
+                self.latencias.setdefault(chave, Histograma()).observar(duracao)
+        if amostrado:
+            self._log().info(json.dumps({'ts': round(time.time(), 3), 'tipo': tipo, 'nome': nome,
+                                         'duracao_ms': round(duracao * 1000, 3), 'linhas': linhas,
+                                         'erro': erro}, ensure_ascii=False))
+
+    #Texto no formato de exposição do Prometheus
+    def exposicao(self):
+        with self.trava:
+            linhas = ['# HELP linkcar_duracao_segundos Latência das operações instrumentadas (amostrada).',
+                      '# TYPE linkcar_duracao_segundos histogram']
+            for (tipo, nome), histograma in sorted(self.latencias.items()):
+                rotulos = f'tipo="{tipo}",nome="{nome}"'
+                acumulado = 0
+                for limite, contagem in zip(BUCKETS, histograma.contagens):
+                    acumulado += contagem
+                    linhas.append(f'linkcar_duracao_segundos_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+                linhas.append(f'linkcar_duracao_segundos_bucket{{{rotulos},le="+Inf"}} {histograma.total}')
+                linhas.append(f'linkcar_duracao_segundos_sum{{{rotulos}}} {histograma.soma:.6f}')
+                linhas.append(f'linkcar_duracao_segundos_count{{{rotulos}}} {histograma.total}')
+
+            linhas += ['# HELP linkcar_chamadas_total Quantidade de chamadas de cada operação.',
+                       '# TYPE linkcar_chamadas_total counter']
+            linhas += [f'linkcar_chamadas_total{{tipo="{tipo}",nome="{nome}"}} {quantidade}'
+                       for (tipo, nome), quantidade in sorted(self.chamadas.items())]
+
+            linhas += ['# HELP linkcar_erros_total Quantidade de chamadas que terminaram em erro.',
+                       '# TYPE linkcar_erros_total counter']
+            linhas += [f'linkcar_erros_total{{tipo="{tipo}",nome="{nome}"}} {quantidade}'
+                       for (tipo, nome), quantidade in sorted(self.erros.items())]
+
+            linhas += ['# HELP linkcar_linhas_total Linhas lidas ou alteradas pelos comandos SQL.',
+                       '# TYPE linkcar_linhas_total counter']
+            linhas += [f'linkcar_linhas_total{{tipo="{tipo}",nome="{nome}"}} {quantidade}'
+                       for (tipo, nome), quantidade in sorted(self.linhas.items())]
+
+            linhas += ['# HELP linkcar_idas_banco_total Idas ao banco (execute e cada busca de linhas).',
+                       '# TYPE linkcar_idas_banco_total counter',
+                       f'linkcar_idas_banco_total {self.idas_banco}']
+        return '\n'.join(linhas) + '\n'
+
+    #Grava o arquivo do Prometheus de uma vez (arquivo temporário + troca), para nunca ser lido pela metade
+    def exportar(self, arquivo=ARQUIVO_PROMETHEUS):
+        temporario = f'{arquivo}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as saida:
+            saida.write(self.exposicao())
+        os.replace(temporario, arquivo)
+
+
+metricas = Metricas()
+
+
+def _exportar_periodicamente():
+    while True:
+        time.sleep(INTERVALO_EXPORTACAO)
+        try:
+            metricas.exportar()
+        except OSError as e:
+            print(f'Erro ao gravar as métricas: {e}')
+
+
+if ATIVA:
+    threading.Thread(target=_exportar_periodicamente, daemon=True, name='linkcar-metricas').start()
+    atexit.register(metricas.exportar)
+
+
+#Mede o bloco de código: with medir('menu', 'criar_conta'): ...
+@contextmanager
+def medir(tipo, nome):
+    if not ATIVA:
+        yield
+        return
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except BaseException:
+        erro = True
+        raise
+    finally:
+        metricas.registrar(tipo, nome, time.perf_counter() - inicio, erro=erro)
+
+
+#Decorador que mede cada chamada da função. Quando a instrumentação está desligada, devolve a própria função
+#resultado_erro(retorno) indica se o retorno deve ser contado como erro (ex. None em uma consulta)
+def medir_funcao(tipo, nome, resultado_erro=None):
+    def decorador(funcao):
+        if not ATIVA:
+            return funcao
+
+        @wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                retorno = funcao(*args, **kwargs)
+            except BaseException:
+                metricas.registrar(tipo, nome, time.perf_counter() - inicio, erro=True)
+                raise
+            erro = resultado_erro(retorno) if resultado_erro else False
+            metricas.registrar(tipo, nome, time.perf_counter() - inicio, erro=erro)
+            return retorno
+        return medida
+    return decorador
+
+
+def _nome_comando(sql):
+    partes = sql.split(None, 1)
+    return partes[0].lower() if partes else 'vazio'
+
+
+#Cursor que mede execute/executemany e as buscas de linhas do cursor original
+class CursorInstrumentado:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._comando = 'sql'
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __setattr__(self, nome, valor):
+        if nome.startswith('_'):
+            object.__setattr__(self, nome, valor)
+        else:
+            setattr(self._cursor, nome, valor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self._cursor.__exit__(*args)
+
+    def _medir(self, nome, metodo, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            retorno = metodo(*args, **kwargs)
+        except BaseException:
+            metricas.registrar('sql', nome, time.perf_counter() - inicio, idas_banco=1, erro=True)
+            raise
+        return inicio, retorno
+
+    def execute(self, sql, *args, **kwargs):
+        self._comando = _nome_comando(sql)
+        inicio, retorno = self._medir(self._comando, self._cursor.execute, sql, *args, **kwargs)
+        linhas = self._cursor.rowcount if self._comando != 'select' else 0
+        metricas.registrar('sql', self._comando, time.perf_counter() - inicio, linhas=max(linhas or 0, 0),
+                           idas_banco=1)
+        return retorno
+
+    def executemany(self, sql, parametros, *args, **kwargs):
+        self._comando = _nome_comando(sql)
+        inicio, retorno = self._medir(f'{self._comando}_lote', self._cursor.executemany, sql, parametros,
+                                      *args, **kwargs)
+        metricas.registrar('sql', f'{self._comando}_lote', time.perf_counter() - inicio,
+                           linhas=max(self._cursor.rowcount or 0, 0), idas_banco=1)
+        return retorno
+
+    def _buscar(self, nome, metodo, *args):
+        inicio, linhas = self._medir(nome, metodo, *args)
+        if nome == 'fetchone':
+            quantidade = 1 if linhas is not None else 0
+        else:
+            quantidade = len(linhas)
+        metricas.registrar('sql', f'{self._comando}_{nome}', time.perf_counter() - inicio,
+                           linhas=quantidade, idas_banco=1)
+        return linhas
+
+    def fetchone(self):
+        return self._buscar('fetchone', self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._buscar('fetchmany', self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._buscar('fetchall', self._cursor.fetchall)
+
+    #Ao percorrer o cursor, as linhas chegam em blocos de arraysize: conta uma ida ao banco por bloco
+    def __iter__(self):
+        inicio = time.perf_counter()
+        tamanho_bloco = getattr(self._cursor, 'arraysize', 0) or 1
+        quantidade = 0
+        try:
+            for linha in self._cursor:
+                quantidade += 1
+                yield linha
+        finally:
+            metricas.registrar('sql', f'{self._comando}_iter', time.perf_counter() - inicio, linhas=quantidade,
+                               idas_banco=quantidade // tamanho_bloco + 1)
+
+
+#Conexão que entrega cursores instrumentados e mede commit/rollback
+class ConexaoInstrumentada:
+    def __init__(self, conexao):
+        self._conexao = conexao
+
+    def __getattr__(self, nome):
+        return getattr(self._conexao, nome)
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self._conexao.cursor(*args, **kwargs))
+
+    def _medir(self, nome, metodo):
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            metodo()
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            metricas.registrar('sql', nome, time.perf_counter() - inicio, idas_banco=1, erro=erro)
+
+    def commit(self):
+        self._medir('commit', self._conexao.commit)
+
+    def rollback(self):
+        self._medir('rollback', self._conexao.rollback)
+
+
+#Retorna a conexão instrumentada quando as métricas estão ativas, senão a própria conexão
+def instrumentar_conexao(conexao):
+    if not ATIVA:
+        return conexao
+    return ConexaoInstrumentada(conexao)
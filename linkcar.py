@@ -0,0 +1,427 @@
+#Linha de comando do Link Car: as mesmas operações do menu (LinkCar2.py) como subcomandos, para scripts, cron e
+#lotes, sem precisar responder a perguntas. Sem subcomando, abre o menu
+#Os módulos pesados (oracledb, requests e os serviços) só são importados pelos comandos que usam cada um, e a
+#conexão com o banco só é aberta no primeiro comando que precisa dela: "cep" e "veiculo validar --sem-banco"
+#nem conectam. O subcomando "shell" lê um comando por linha e mantém o pool de conexões, os caches (CEPs, painel,
+#filtro de veículos) e o login entre eles, ex. "python linkcar.py shell < comandos.txt"
+import argparse
+import getpass
+import json
+import os
+import shlex
+import sys
+
+from instrumentacao import medir
+
+
+#Erro de uso de um comando, mostrado ao usuário sem o rastro da exceção
+class ErroComando(Exception):
+    pass
+
+
+class Contexto:
+    def __init__(self, sqlite=None, usar_pool=False):
+        self.sqlite = sqlite
+        self.usar_pool = usar_pool
+        self._conn = None
+        #Usuário do comando "login", usado pelos comandos seguintes do shell
+        self.usuario = None
+
+    #Conexão (ou pool) com o banco, aberta no primeiro uso
+    @property
+    def conn(self):
+        if self._conn is None:
+            import gravacao
+            if self.sqlite:
+                from repositorio import RepositorioSqlite
+                conn = RepositorioSqlite(self.sqlite)
+            else:
+                from banco import conectar_banco, criar_pool
+                conn = criar_pool() if self.usar_pool else conectar_banco()
+            if not conn:
+                raise ErroComando('Não foi possível conectar ao banco de dados.')
+            #Com LINKCAR_GRAVACAO_ADIADA=1 os problemas e a auditoria são gravados em lotes, em segundo plano
+            gravacao.iniciar(conn)
+            self._conn = conn
+        return self._conn
+
+    #Fecha só o que foi aberto pelos comandos executados
+    def fechar(self):
+        if self._conn is not None:
+            import gravacao
+            gravacao.encerrar()
+            self._conn.close()
+            self._conn = None
+        if 'cep' in sys.modules:
+            from cep import base_cep, cache_cep, cliente_viacep
+            cache_cep.fechar()
+            cliente_viacep.fechar()
+            if base_cep is not None:
+                base_cep.fechar()
+
+
+#Senha lida de LINKCAR_SENHA ou, no terminal, pedida sem aparecer na tela
+def _senha(mensagem='Senha: '):
+    senha = os.environ.get('LINKCAR_SENHA')
+    if senha is None:
+        if not sys.stdin.isatty():
+            raise ErroComando('Senha não informada: defina LINKCAR_SENHA.')
+        senha = getpass.getpass(mensagem)
+    return senha
+
+
+def _autenticar(contexto, email):
+    import servicos
+    conta = servicos.autenticar(contexto.conn, email, _senha())
+    if not conta:
+        raise ErroComando('Email ou senha incorretos!')
+    return conta
+
+
+#Usuário dos comandos de veículos, problemas e da conta: o de --email (ou LINKCAR_EMAIL), ou o do login no shell
+def _usuario(args, contexto):
+    if args.email:
+        return _autenticar(contexto, args.email)
+    if contexto.usuario:
+        return contexto.usuario
+    if os.environ.get('LINKCAR_EMAIL'):
+        return _autenticar(contexto, os.environ['LINKCAR_EMAIL'])
+    raise ErroComando('Informe --email (ou LINKCAR_EMAIL), ou entre com "login" no shell.')
+
+
+def _confirmar(args, mensagem):
+    if not args.sim:
+        raise ErroComando(f'{mensagem} Repita o comando com --sim para confirmar.')
+
+
+def conta_criar(args, contexto):
+    import servicos
+    id_usuario = servicos.criar_conta(contexto.conn, args.nome, args.email, _senha('Senha da nova conta: '),
+                                      args.cep)
+    return {'id': id_usuario, 'mensagem': 'Conta criada com sucesso!'}
+
+
+def conta_listar(args, contexto):
+    import servicos
+    contas = list(servicos.iterar_contas(contexto.conn, args.ultimo_id, args.limite))
+    if args.json:
+        return contas
+    return [{'id': conta['id'], 'nome': conta['nome'], 'email': conta['email'], 'cidade': conta['cidade'],
+             'uf': conta['uf'], 'placas': ', '.join(veiculo['placa'] or '' for veiculo in conta['veiculos'])}
+            for conta in contas]
+
+
+def conta_alterar(args, contexto):
+    import servicos
+    if not (args.nome or args.novo_email or args.cep):
+        raise ErroComando('Informe --nome, --novo-email e/ou --cep.')
+    usuario = _usuario(args, contexto)
+    if args.nome:
+        servicos.alterar_nome(contexto.conn, usuario['id'], args.nome)
+        usuario['nome'] = args.nome
+    if args.novo_email:
+        servicos.alterar_email(contexto.conn, usuario['id'], args.novo_email)
+        usuario['email'] = args.novo_email
+    if args.cep:
+        servicos.alterar_endereco(contexto.conn, usuario['id'], args.cep)
+    return 'Informações alteradas com sucesso!'
+
+
+#Só a própria conta pode ser apagada (como na API); o ID é pedido mesmo assim, para não apagar a conta errada
+def conta_apagar(args, contexto):
+    import servicos
+    if _usuario(args, contexto)['id'] != args.id:
+        raise ErroComando('Você só pode apagar a sua própria conta.')
+    _confirmar(args, f'A conta ID {args.id}, os veículos e os problemas dela serão apagados.')
+    if not servicos.apagar_conta(contexto.conn, args.id):
+        raise ErroComando(f'Conta ID {args.id} não encontrada!')
+    if contexto.usuario and contexto.usuario['id'] == args.id:
+        contexto.usuario = None
+    return f'Conta ID {args.id} removida com sucesso!'
+
+
+def login(args, contexto):
+    contexto.usuario = _autenticar(contexto, args.email)
+    return f"Login realizado com sucesso! Bem-vindo, {contexto.usuario['nome']}."
+
+
+def logout(args, contexto):
+    if not contexto.usuario:
+        return 'Você não está logado.'
+    import servicos
+    servicos.encerrar_sessao(contexto.usuario['token'])
+    contexto.usuario = None
+    return 'Você saiu da conta.'
+
+
+def veiculo_registrar(args, contexto):
+    import servicos
+    usuario = _usuario(args, contexto)
+    id_veiculo = servicos.registrar_veiculo(contexto.conn, usuario['id'], args.chassi, args.marca, args.modelo,
+                                            args.cor, args.placa)
+    return {'id': id_veiculo, 'mensagem': f'Veículo {args.marca} {args.modelo} registrado com sucesso!'}
+
+
+def veiculo_listar(args, contexto):
+    import servicos
+    return servicos.listar_veiculos(contexto.conn, _usuario(args, contexto)['id'])
+
+
+#Campos não informados ficam como estão
+def veiculo_alterar(args, contexto):
+    import servicos
+    usuario = _usuario(args, contexto)
+    atual = servicos.obter_veiculo(contexto.conn, args.id, usuario['id'])
+    if not atual or not servicos.alterar_veiculo(contexto.conn, args.id, usuario['id'],
+                                                 args.marca or atual['marca'], args.modelo or atual['modelo'],
+                                                 args.cor or atual['cor'], args.placa or atual['placa']):
+        raise ErroComando('Veículo não encontrado ou não pertence a este usuário.')
+    return 'Informações alteradas com sucesso!'
+
+
+def veiculo_apagar(args, contexto):
+    import servicos
+    _confirmar(args, f'O veículo ID {args.id} e os problemas dele serão apagados.')
+    if not servicos.apagar_veiculo(contexto.conn, args.id, _usuario(args, contexto)['id']):
+        raise ErroComando('Veículo não encontrado ou não pertence a este usuário.')
+    return f'Veículo ID {args.id} removido com sucesso!'
+
+
+def veiculo_buscar(args, contexto):
+    import servicos
+    return servicos.buscar_veiculos(contexto.conn, args.placa, args.chassi, args.marca, args.modelo,
+                                    args.aproximado, args.ultimo_id, args.limite)
+
+
+#Com --sem-banco, só o formato do chassi e da placa é conferido (sem procurar duplicados e sem conectar)
+def veiculo_validar(args, contexto):
+    if args.sem_banco:
+        from validacao import analisar_chassi, analisar_placa
+        chassi, placa = analisar_chassi(args.chassi), analisar_placa(args.placa)
+        erros = chassi['erros'] + placa['erros']
+        resultado = {'chassi': chassi['chassi'], 'placa': placa['placa'], 'valido': not erros, 'erros': erros,
+                     'fabricante': chassi['fabricante']}
+    else:
+        import servicos
+        resultado = servicos.validar_veiculos(contexto.conn, [{'chassi': args.chassi, 'placa': args.placa}])[0]
+    if not args.json:
+        resultado['erros'] = '; '.join(resultado['erros'])
+    return resultado
+
+
+def problema_registrar(args, contexto):
+    import servicos
+    usuario = _usuario(args, contexto)
+    servicos.registrar_problema(contexto.conn, usuario['id'], args.id_veiculo, args.descricao, args.prioridade)
+    return f'Problema registrado no veículo ID {args.id_veiculo}, e será verificado para um diagnóstico.'
+
+
+def problema_listar(args, contexto):
+    import servicos
+    problemas = servicos.listar_problemas(contexto.conn, _usuario(args, contexto)['id'])
+    if args.abertos:
+        from repositorio import STATUS_CONCLUIDO
+        problemas = [problema for problema in problemas if problema['status'] != STATUS_CONCLUIDO]
+    return problemas
+
+
+def problema_fila(args, contexto):
+    import servicos
+    return servicos.estatisticas_fila(contexto.conn)
+
+
+def cep(args, contexto):
+    from cep import buscar_endereco, validar_cep
+    numero = args.cep.replace('.', '').replace('-', '')
+    if not validar_cep(numero):
+        raise ErroComando('CEP inválido!')
+    dados = buscar_endereco(numero)
+    if not dados:
+        raise ErroComando('Erro ao obter dados do CEP.')
+    return dados
+
+
+#Lê um comando por linha (sem o "python linkcar.py"), até "sair" ou o fim da entrada
+#Retorna 1 se algum comando falhou, para que scripts percebam o erro
+def shell(args, contexto):
+    parser = criar_parser()
+    interativo = sys.stdin.isatty()
+    if interativo:
+        print('Link Car. Digite um comando (ex. "veiculo listar"), "help" para a lista ou "sair" para terminar.')
+    codigo = 0
+    while True:
+        try:
+            linha = input('linkcar> ' if interativo else '')
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            print()
+            break
+        try:
+            palavras = shlex.split(linha, comments=True)
+        except ValueError as e:
+            print(f'Comando inválido: {e}')
+            codigo = 1
+            continue
+        if not palavras:
+            continue
+        if palavras[0] in ('sair', 'exit', 'quit'):
+            break
+        if palavras[0] == 'help':
+            parser.print_help()
+            continue
+        try:
+            args_comando = parser.parse_args(palavras)
+        except SystemExit as e:
+            #O argparse já mostrou o erro (ou a ajuda pedida com --help)
+            codigo = codigo or e.code
+            continue
+        if args_comando.funcao in (None, shell):
+            print('Comando indisponível no shell.')
+            continue
+        codigo = executar(args_comando, contexto) or codigo
+    return codigo
+
+
+#Erros mostrados como mensagem. Os dos serviços e do banco só existem se os seus módulos já foram importados
+def _erros_tratados():
+    erros = [ErroComando]
+    if 'servicos' in sys.modules:
+        erros.append(sys.modules['servicos'].ErroServico)
+    if 'repositorio' in sys.modules:
+        erros.extend(sys.modules['repositorio'].ERROS_BANCO)
+    return tuple(erros)
+
+
+def _mostrar(args, resultado):
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2, default=str))
+    elif isinstance(resultado, list):
+        from relatorios import imprimir_tabela
+        imprimir_tabela(resultado)
+    elif isinstance(resultado, dict):
+        for chave, valor in resultado.items():
+            print(f'{chave}: {valor}')
+    elif resultado is not None:
+        print(resultado)
+
+
+#Executa um comando já interpretado. Retorna o código de saída (0 sucesso, 1 erro)
+def executar(args, contexto):
+    with medir('cli', args.nome_comando):
+        try:
+            resultado = args.funcao(args, contexto)
+        except Exception as e:
+            if not isinstance(e, _erros_tratados()):
+                raise
+            print(e)
+            return 1
+    if args.funcao is shell:
+        return resultado
+    _mostrar(args, resultado)
+    return 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog='linkcar', description='Link Car pela linha de comando. Sem comando, '
+                                                                 'abre o menu interativo.')
+    parser.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite (ou :memory:) em vez do Oracle')
+    parser.add_argument('--json', action='store_true', help='Saída em JSON')
+    parser.set_defaults(funcao=None, nome_comando='menu')
+    grupos = parser.add_subparsers(title='comandos', metavar='COMANDO')
+
+    #Opção comum dos comandos que agem em nome de um usuário (a senha vem de LINKCAR_SENHA ou é pedida)
+    com_usuario = argparse.ArgumentParser(add_help=False)
+    com_usuario.add_argument('--email', help='Email da conta (padrão: LINKCAR_EMAIL ou o login do shell)')
+    confirmacao = argparse.ArgumentParser(add_help=False)
+    confirmacao.add_argument('--sim', action='store_true', help='Confirma a exclusão')
+
+    def comando(subparsers, nome, funcao, ajuda, parents=()):
+        sub = subparsers.add_parser(nome, help=ajuda, description=ajuda, parents=parents)
+        sub.set_defaults(funcao=funcao, nome_comando=funcao.__name__)
+        return sub
+
+    def grupo(nome, ajuda):
+        sub = grupos.add_parser(nome, help=ajuda, description=ajuda)
+        sub.set_defaults(funcao=None)
+        return sub.add_subparsers(title='comandos', metavar='COMANDO', required=True)
+
+    contas = grupo('conta', 'Contas de usuário')
+    sub = comando(contas, 'criar', conta_criar, 'Cria uma conta (senha em LINKCAR_SENHA ou pedida)')
+    sub.add_argument('--nome', required=True)
+    sub.add_argument('--email', required=True)
+    sub.add_argument('--cep', required=True)
+    sub = comando(contas, 'listar', conta_listar, 'Lista as contas com os veículos de cada uma')
+    sub.add_argument('--ultimo-id', type=int, default=0, help='Lista as contas com ID maior que este')
+    sub.add_argument('--limite', type=int, default=50)
+    sub = comando(contas, 'alterar', conta_alterar, 'Altera nome, email e/ou endereço da conta',
+                  parents=[com_usuario])
+    sub.add_argument('--nome')
+    sub.add_argument('--novo-email')
+    sub.add_argument('--cep', help='Novo CEP (o endereço é preenchido pela ViaCEP)')
+    sub = comando(contas, 'apagar', conta_apagar, 'Apaga a própria conta, os veículos e os problemas dela',
+                  parents=[com_usuario, confirmacao])
+    sub.add_argument('id', type=int)
+
+    sub = comando(grupos, 'login', login, 'Entra em uma conta para os próximos comandos do shell')
+    sub.add_argument('--email', required=True)
+    comando(grupos, 'logout', logout, 'Sai da conta do login')
+
+    veiculos = grupo('veiculo', 'Veículos do usuário e busca em todos os usuários')
+    sub = comando(veiculos, 'registrar', veiculo_registrar, 'Registra um veículo', parents=[com_usuario])
+    for campo in ('chassi', 'marca', 'modelo', 'cor', 'placa'):
+        sub.add_argument(f'--{campo}', required=True)
+    comando(veiculos, 'listar', veiculo_listar, 'Lista os veículos com os problemas em aberto',
+            parents=[com_usuario])
+    sub = comando(veiculos, 'alterar', veiculo_alterar, 'Altera marca, modelo, cor e/ou placa',
+                  parents=[com_usuario])
+    sub.add_argument('id', type=int)
+    for campo in ('marca', 'modelo', 'cor', 'placa'):
+        sub.add_argument(f'--{campo}')
+    sub = comando(veiculos, 'apagar', veiculo_apagar, 'Apaga um veículo e os problemas dele',
+                  parents=[com_usuario, confirmacao])
+    sub.add_argument('id', type=int)
+    sub = comando(veiculos, 'buscar', veiculo_buscar, 'Busca pela placa, chassi, marca ou modelo')
+    for campo in ('placa', 'chassi', 'marca', 'modelo'):
+        sub.add_argument(f'--{campo}')
+    sub.add_argument('--aproximado', action='store_true', help='Inclui marcas e modelos com nomes parecidos')
+    sub.add_argument('--ultimo-id', type=int, default=0)
+    sub.add_argument('--limite', type=int, default=20)
+    sub = comando(veiculos, 'validar', veiculo_validar, 'Confere chassi e placa e se já estão cadastrados')
+    sub.add_argument('--chassi', required=True)
+    sub.add_argument('--placa', required=True)
+    sub.add_argument('--sem-banco', action='store_true', help='Confere só o formato, sem conectar ao banco')
+
+    problemas = grupo('problema', 'Problemas dos veículos e fila de diagnóstico')
+    sub = comando(problemas, 'registrar', problema_registrar, 'Registra um problema em um veículo',
+                  parents=[com_usuario])
+    sub.add_argument('id_veiculo', type=int)
+    sub.add_argument('--descricao', required=True)
+    sub.add_argument('--prioridade', type=int, choices=(1, 2, 3), default=2, help='1 alta, 2 normal, 3 baixa')
+    sub = comando(problemas, 'listar', problema_listar, 'Lista os problemas dos veículos do usuário',
+                  parents=[com_usuario])
+    sub.add_argument('--abertos', action='store_true', help='Só os ainda não concluídos')
+    comando(problemas, 'fila', problema_fila, 'Tamanho e tempos da fila de diagnóstico')
+
+    sub = comando(grupos, 'cep', cep, 'Consulta um CEP (cache, base offline ou ViaCEP)')
+    sub.add_argument('cep')
+    comando(grupos, 'shell', shell, 'Lê um comando por linha, mantendo conexões, caches e login entre eles')
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.funcao is None:
+        import LinkCar2
+        LinkCar2.main()
+        return 0
+    #O shell usa um pool (como a API), que se recupera sozinho de conexões que caírem entre os comandos
+    contexto = Contexto(args.sqlite, usar_pool=args.funcao is shell or os.environ.get('LINKCAR_POOL') == '1')
+    try:
+        return executar(args, contexto)
+    finally:
+        contexto.fechar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
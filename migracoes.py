@@ -0,0 +1,227 @@
+#Esquema do banco no Oracle, versionado: cada migração tem um número, e as já aplicadas ficam na tabela
+#versao_esquema. "python migracoes.py" lista as pendentes, "--aplicar" aplica e "--verificar-planos" confere se as
+#consultas mais usadas (CONSULTAS_FREQUENTES) são atendidas por índices, saindo com erro se alguma percorrer uma
+#tabela inteira. Bancos criados antes das migrações são aceitos: o que já existe (tabelas, colunas, índices e
+#chaves) é mantido. O SQLite já é criado com o esquema completo e serve para conferir os planos sem o Oracle
+import argparse
+import sys
+
+from banco import conectar_banco
+from repositorio import (CONSULTAS_FREQUENTES, ERROS_BANCO, INDICE_FILA, INDICES_BUSCA, INDICES_UNICOS_VEICULOS,
+                         PRIORIDADE_NORMAL, STATUS_PENDENTE, RepositorioSqlite, obter_repositorio)
+
+
+#Uma migração não pode ser aplicada por causa dos dados que já estão no banco
+class ErroMigracao(Exception):
+    pass
+
+
+#Um ALTER TABLE ... ADD por coluna: se uma das colunas já existir, o Oracle recusa o comando inteiro (ORA-01430,
+#ignorado em ERROS_JA_EXISTE), e as outras colunas do mesmo comando não seriam criadas
+def _colunas(tabela, colunas):
+    return tuple(f"ALTER TABLE {tabela} ADD ({coluna})" for coluna in colunas)
+
+
+#Chave estrangeira com ON DELETE CASCADE. Se a coluna já tiver uma chave sem o CASCADE, ela é trocada pela nova
+def _chave_estrangeira(tabela, coluna, tabela_pai, nome):
+    def aplicar(cur):
+        cur.execute("""
+            SELECT c.constraint_name, c.delete_rule
+            FROM user_constraints c
+            JOIN user_cons_columns k ON k.constraint_name = c.constraint_name
+            WHERE c.table_name = :tabela AND c.constraint_type = 'R' AND k.column_name = :coluna
+        """, tabela=tabela.upper(), coluna=coluna.upper())
+        existentes = cur.fetchall()
+        if any(regra == 'CASCADE' for _, regra in existentes):
+            return
+        for nome_atual, _ in existentes:
+            cur.execute(f"ALTER TABLE {tabela} DROP CONSTRAINT {nome_atual}")
+        cur.execute(f"""
+            ALTER TABLE {tabela} ADD CONSTRAINT {nome}
+            FOREIGN KEY ({coluna}) REFERENCES {tabela_pai} (id) ON DELETE CASCADE
+        """)
+    return aplicar
+
+
+#Troca o índice comum da busca pelo índice único sobre a mesma expressão (o Oracle não aceita dois índices iguais)
+#Antes, confere se há valores repetidos: nesse caso, nada é alterado e a migração para com ErroMigracao
+def _indice_unico(indice, antigo, expressao):
+    def aplicar(cur):
+        cur.execute("SELECT LOWER(index_name) FROM user_indexes WHERE index_name IN (:indice, :antigo)",
+                    indice=indice.upper(), antigo=antigo.upper())
+        existentes = {linha[0] for linha in cur}
+        if indice in existentes:
+            return
+        cur.execute(f"""
+            SELECT {expressao} FROM veiculos WHERE {expressao} IS NOT NULL
+            GROUP BY {expressao} HAVING COUNT(*) > 1
+            FETCH FIRST 1 ROWS ONLY
+        """)
+        repetido = cur.fetchone()
+        if repetido:
+            raise ErroMigracao(f'Há veículos repetidos ({repetido[0]}, entre outros) e o índice {indice} não pode '
+                               f'ser criado. Corrija os veículos listados por "python tarefas.py duplicados" '
+                               f'e rode de novo.')
+        if antigo in existentes:
+            cur.execute(f"DROP INDEX {antigo}")
+        cur.execute(f"CREATE UNIQUE INDEX {indice} ON veiculos ({expressao})")
+    return aplicar
+
+
+#(versão, descrição, comandos), em ordem. Uma migração já aplicada nunca muda: alterações novas entram no fim
+MIGRACOES = (
+    (1, 'Tabelas usuarios, veiculos e problemas', (
+        """
+        CREATE TABLE versao_esquema (
+            versao NUMBER PRIMARY KEY,
+            descricao VARCHAR2(200) NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE usuarios (
+            id NUMBER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            nome VARCHAR2(100),
+            email VARCHAR2(150) NOT NULL,
+            senha VARCHAR2(200),
+            cep VARCHAR2(8),
+            uf VARCHAR2(2),
+            cidade VARCHAR2(100),
+            rua VARCHAR2(200),
+            bairro VARCHAR2(100)
+        )
+        """,
+        """
+        CREATE TABLE veiculos (
+            id NUMBER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            id_usuario NUMBER NOT NULL,
+            chassi VARCHAR2(17) NOT NULL,
+            marca VARCHAR2(50),
+            modelo VARCHAR2(50),
+            cor VARCHAR2(30),
+            placa VARCHAR2(10)
+        )
+        """,
+        """
+        CREATE TABLE problemas (
+            id NUMBER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            id_veiculo NUMBER NOT NULL,
+            descricao VARCHAR2(4000)
+        )
+        """,
+    )),
+    #O índice único do email atende o cadastro (email já usado) e o login. Apagar uma conta apaga os veículos e
+    #os problemas dela, e apagar um veículo apaga os problemas dele
+    (2, 'Email único e chaves estrangeiras com ON DELETE CASCADE', (
+        "ALTER TABLE usuarios ADD CONSTRAINT uq_usuarios_email UNIQUE (email)",
+        _chave_estrangeira('veiculos', 'id_usuario', 'usuarios', 'fk_veiculos_usuario'),
+        _chave_estrangeira('problemas', 'id_veiculo', 'veiculos', 'fk_problemas_veiculo'),
+    )),
+    #O Oracle não indexa as chaves estrangeiras sozinho: sem estes índices, o painel do usuário e as exclusões em
+    #cascata percorreriam as tabelas veiculos e problemas inteiras
+    (3, 'Índices das chaves estrangeiras', (
+        "CREATE INDEX ix_veiculos_usuario ON veiculos (id_usuario)",
+        "CREATE INDEX ix_problemas_veiculo ON problemas (id_veiculo)",
+    )),
+    (4, 'Colunas da fila de diagnóstico em problemas', _colunas('problemas', (
+        f"status VARCHAR2(20) DEFAULT '{STATUS_PENDENTE}' NOT NULL",
+        f"prioridade NUMBER(1) DEFAULT {PRIORIDADE_NORMAL} NOT NULL",
+        "criado_em TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL",
+        "reservado_em TIMESTAMP",
+        "concluido_em TIMESTAMP",
+        "trabalhador VARCHAR2(100)",
+        "tentativas NUMBER DEFAULT 0 NOT NULL",
+        "diagnostico VARCHAR2(4000)",
+    ))),
+    (5, 'Datas de cadastro e de último acesso em usuarios', _colunas('usuarios', (
+        "criado_em TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL",
+        "ultimo_acesso TIMESTAMP",
+    ))),
+    (6, 'Índices da busca de veículos', INDICES_BUSCA),
+    (7, 'Índice da fila de diagnóstico', (INDICE_FILA,)),
+    (8, 'Trilha de auditoria e lotes da gravação adiada', (
+        """
+        CREATE TABLE auditoria (
+            id NUMBER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            ocorrido_em TIMESTAMP NOT NULL,
+            id_usuario NUMBER,
+            entidade VARCHAR2(20) NOT NULL,
+            id_entidade NUMBER,
+            acao VARCHAR2(20) NOT NULL,
+            detalhes VARCHAR2(4000)
+        )
+        """,
+        "CREATE INDEX ix_auditoria_usuario ON auditoria (id_usuario, ocorrido_em)",
+        """
+        CREATE TABLE lotes_gravados (
+            id VARCHAR2(64) PRIMARY KEY,
+            gravado_em TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL
+        )
+        """,
+    )),
+    #A validação (validacao.py) recusa os duplicados antes de gravar, mas dois cadastros do mesmo veículo ao mesmo
+    #tempo passariam os dois por ela: o índice único garante que só um é gravado
+    (9, 'Chassi e placa únicos', tuple(_indice_unico(indice, antigo, expressao)
+                                      for indice, (antigo, expressao) in INDICES_UNICOS_VEICULOS.items())),
+)
+
+
+#Mostra o resultado de cada consulta de CONSULTAS_FREQUENTES (e o plano das que falharem)
+#Retorna os nomes das consultas que percorrem uma tabela inteira
+def verificar_planos(repositorio):
+    falhas = []
+    for nome, sql, parametros in CONSULTAS_FREQUENTES:
+        passos = repositorio.plano_execucao(sql, parametros)
+        if not any(leitura_completa for _, leitura_completa in passos):
+            print(f'OK     {nome}')
+            continue
+        falhas.append(nome)
+        print(f'FALHA  {nome}: percorre a tabela inteira')
+        for passo, leitura_completa in passos:
+            print(f"         {passo}{'   <--' if leitura_completa else ''}")
+    return falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrações do esquema do Link Car no Oracle.')
+    parser.add_argument('--aplicar', action='store_true', help='Aplica as migrações pendentes')
+    parser.add_argument('--verificar-planos', action='store_true',
+                        help='Confere se as consultas mais usadas usam índices (sai com código 1 se não usarem)')
+    parser.add_argument('--sqlite', metavar='ARQUIVO',
+                        help='Confere os planos em um banco SQLite (ex. :memory:) em vez do Oracle')
+    args = parser.parse_args()
+
+    conn = RepositorioSqlite(args.sqlite) if args.sqlite else conectar_banco()
+    if not conn:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        sys.exit(1)
+    repositorio = obter_repositorio(conn)
+    falhas = []
+    try:
+        if args.sqlite:
+            print('O esquema do SQLite já é criado completo.')
+        else:
+            migracoes = repositorio.aplicar_migracoes(MIGRACOES, apenas_listar=not args.aplicar)
+            for versao, descricao in migracoes:
+                print(f"{'Aplicada' if args.aplicar else 'Pendente'}: {versao} - {descricao}")
+            if not migracoes:
+                print(f'O esquema já está na versão {MIGRACOES[-1][0]}.')
+            elif not args.aplicar:
+                print('Use --aplicar para aplicar as migrações pendentes.')
+        if args.verificar_planos:
+            falhas = verificar_planos(repositorio)
+            print(f'{len(falhas)} de {len(CONSULTAS_FREQUENTES)} consultas percorrem uma tabela inteira.')
+    except ErroMigracao as e:
+        print(e)
+        sys.exit(1)
+    except ERROS_BANCO as e:
+        print(f'Erro no banco de dados: {e}')
+        sys.exit(1)
+    finally:
+        conn.close()
+    if falhas:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
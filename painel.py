@@ -0,0 +1,87 @@
+#Cache do painel de cada usuário: os veículos dele e a quantidade de problemas em aberto de cada um
+#As escritas feitas pelos serviços atualizam o painel em memória (write-through), então visualizar os veículos
+#de novo não vai ao banco. O TTL limita o atraso de mudanças feitas por outros processos (ex. diagnóstico)
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+TTL_PAINEL = int(os.environ.get('LINKCAR_PAINEL_TTL', 60))
+CAPACIDADE_PAINEL = int(os.environ.get('LINKCAR_PAINEL_CAPACIDADE', 10000))
+
+#Registros compactos e imutáveis: uma alteração troca o registro inteiro, sem afetar quem já o leu
+Veiculo = namedtuple('Veiculo', 'id marca modelo cor placa chassi problemas_abertos')
+
+
+class Painel:
+    __slots__ = ('veiculos', 'expira_em')
+
+    def __init__(self, veiculos, expira_em):
+        self.veiculos = veiculos #tupla de Veiculo, em ordem de ID
+        self.expira_em = expira_em
+
+
+class CachePainel:
+    def __init__(self, ttl=TTL_PAINEL, capacidade=CAPACIDADE_PAINEL):
+        self.ttl = ttl
+        self.capacidade = capacidade
+        self.paineis = OrderedDict() #id_usuario -> Painel
+        self.trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    #Retorna a tupla de veículos do usuário, ou None se não estiver no cache (ou tiver expirado)
+    def obter(self, id_usuario):
+        with self.trava:
+            painel = self.paineis.get(id_usuario)
+            if painel is not None and painel.expira_em > time.monotonic():
+                self.paineis.move_to_end(id_usuario)
+                self.acertos += 1
+                return painel.veiculos
+            if painel is not None:
+                del self.paineis[id_usuario]
+            self.falhas += 1
+            return None
+
+    def guardar(self, id_usuario, veiculos):
+        veiculos = tuple(veiculos)
+        with self.trava:
+            self.paineis[id_usuario] = Painel(veiculos, time.monotonic() + self.ttl)
+            self.paineis.move_to_end(id_usuario)
+            while len(self.paineis) > self.capacidade:
+                self.paineis.popitem(last=False)
+        return veiculos
+
+    def invalidar(self, id_usuario):
+        with self.trava:
+            self.paineis.pop(id_usuario, None)
+
+    #Aplica alterar(veiculos) ao painel do usuário, se ele estiver no cache. Sem o painel, não há o que alterar:
+    #a próxima leitura busca tudo do banco
+    def _alterar(self, id_usuario, alterar):
+        with self.trava:
+            painel = self.paineis.get(id_usuario)
+            if painel is not None:
+                painel.veiculos = tuple(alterar(painel.veiculos))
+
+    def adicionar_veiculo(self, id_usuario, veiculo):
+        self._alterar(id_usuario, lambda veiculos: (*veiculos, veiculo))
+
+    def atualizar_veiculo(self, id_usuario, id_veiculo, campos):
+        self._alterar(id_usuario, lambda veiculos: (
+            veiculo._replace(**campos) if veiculo.id == id_veiculo else veiculo for veiculo in veiculos))
+
+    def remover_veiculo(self, id_usuario, id_veiculo):
+        self._alterar(id_usuario, lambda veiculos: (veiculo for veiculo in veiculos if veiculo.id != id_veiculo))
+
+    def somar_problema(self, id_usuario, id_veiculo):
+        self._alterar(id_usuario, lambda veiculos: (
+            veiculo._replace(problemas_abertos=veiculo.problemas_abertos + 1) if veiculo.id == id_veiculo
+            else veiculo for veiculo in veiculos))
+
+    def estatisticas(self):
+        with self.trava:
+            return {'paineis': len(self.paineis), 'acertos': self.acertos, 'falhas': self.falhas}
+
+
+cache_painel = CachePainel()
@@ -0,0 +1,345 @@
+#Relatórios da frota: veículos por região, marcas mais comuns, problemas por marca/modelo e cadastros por período
+#Do banco, as contagens são feitas pelo próprio banco (GROUP BY) e ficam em cache por TTL_RELATORIOS segundos;
+#as alterações feitas pelos serviços descartam na hora os relatórios das tabelas alteradas
+#De arquivos exportados (python importacao.py exportar ...), os arquivos são lidos aos poucos e cada coluna usada
+#vira um array de inteiros (os textos são trocados por códigos); as contagens usam o NumPy, quando instalado
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+
+from banco import conectar_banco
+from repositorio import PERIODOS_RELATORIO, STATUS_CONCLUIDO, RepositorioSqlite, obter_repositorio
+
+TTL_RELATORIOS = int(os.environ.get('LINKCAR_RELATORIOS_TTL', 300))
+RELATORIOS = ('regioes', 'marcas', 'modelos', 'cadastros')
+
+
+class CacheRelatorios:
+    def __init__(self, ttl=TTL_RELATORIOS):
+        self.ttl = ttl
+        self.trava = threading.Lock()
+        self.itens = {} #chave -> (expira_em, tabelas lidas, linhas)
+        #Muda a cada invalidação: um cálculo que começou antes dela não é guardado
+        self.geracao = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    #Linhas guardadas na chave, ou as de calcular() (que lê as tabelas informadas)
+    def obter(self, chave, tabelas, calcular):
+        with self.trava:
+            item = self.itens.get(chave)
+            if item is not None and item[0] > time.monotonic():
+                self.acertos += 1
+                return item[2]
+            self.falhas += 1
+            geracao = self.geracao
+        linhas = calcular()
+        with self.trava:
+            if geracao == self.geracao:
+                self.itens[chave] = (time.monotonic() + self.ttl, frozenset(tabelas), linhas)
+        return linhas
+
+    #Descarta os relatórios que leem alguma das tabelas alteradas
+    def invalidar(self, *tabelas):
+        with self.trava:
+            self.geracao += 1
+            for chave in [chave for chave, item in self.itens.items() if item[1].intersection(tabelas)]:
+                del self.itens[chave]
+
+    def estatisticas(self):
+        with self.trava:
+            return {'relatorios': len(self.itens), 'acertos': self.acertos, 'falhas': self.falhas}
+
+
+cache_relatorios = CacheRelatorios()
+
+
+#Textos -> códigos inteiros (0, 1, 2...), na ordem em que aparecem: as colunas guardam só os códigos
+class Codificador:
+    def __init__(self):
+        self.codigos = {}
+        self.valores = []
+
+    def codigo(self, valor):
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = self.codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+
+#O NumPy só é importado pelos relatórios de arquivos: servicos.py importa este módulo (cache_relatorios), e os
+#programas que só usam o banco não pagam o tempo de importação dele. None se não estiver instalado
+@functools.cache
+def _importar_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def _vetor(coluna):
+    numpy = _importar_numpy()
+    return numpy.frombuffer(coluna, dtype=numpy.int64) if isinstance(coluna, array) else coluna
+
+
+#Para cada chave, o código da linha com aquele ID (-1 se não existir). Ex. o código da cidade de cada veículo,
+#a partir do id_usuario dele. Com o NumPy, por busca binária nos IDs ordenados
+def _juntar(ids, codigos, chaves):
+    numpy = _importar_numpy()
+    if numpy is None:
+        por_id = dict(zip(ids, codigos))
+        return array('q', (por_id.get(chave, -1) for chave in chaves))
+    ids, codigos, chaves = _vetor(ids), _vetor(codigos), _vetor(chaves)
+    if not len(ids):
+        return numpy.full(len(chaves), -1, dtype=numpy.int64)
+    ordem = numpy.argsort(ids, kind='stable')
+    ids = ids[ordem]
+    posicoes = numpy.searchsorted(ids, chaves).clip(0, len(ids) - 1)
+    return numpy.where(ids[posicoes] == chaves, codigos[ordem][posicoes], -1)
+
+
+#Quantidade de cada código (a posição é o código). Os -1 (sem correspondente) são ignorados
+def _contar(codigos, quantidade_codigos):
+    numpy = _importar_numpy()
+    if numpy is None:
+        contagem = [0] * quantidade_codigos
+        for codigo in codigos:
+            if codigo >= 0:
+                contagem[codigo] += 1
+        return contagem
+    codigos = _vetor(codigos)
+    return numpy.bincount(codigos[codigos >= 0], minlength=quantidade_codigos).tolist()
+
+
+def _texto(linha, campo):
+    valor = linha.get(campo)
+    return str(valor).strip() if valor is not None else ''
+
+
+#Os mesmos dados agregados do repositório, calculados a partir dos arquivos exportados, sem o banco
+#Cada arquivo é lido uma vez, aos poucos; só as colunas usadas são guardadas, como arrays de inteiros
+class AgregadosArquivos:
+    def __init__(self, usuarios, veiculos, problemas=None):
+        #importacao depende de servicos, que usa o cache deste módulo
+        from importacao import ler_linhas
+
+        self.cidades = Codificador() #(uf, cidade)
+        self.dias = Codificador() #dia do cadastro (AAAA-MM-DD)
+        self.modelos = Codificador() #(MARCA, MODELO)
+        self.ids_usuarios, self.cidade_usuario, self.dia_usuario = array('q'), array('q'), array('q')
+        self.ids_veiculos, self.usuario_veiculo, self.modelo_veiculo = array('q'), array('q'), array('q')
+        self.veiculo_problema, self.veiculo_problema_aberto = array('q'), array('q')
+        self.ignoradas = 0
+
+        for _, linha in ler_linhas(usuarios):
+            if not _texto(linha, 'id').isdigit():
+                self.ignoradas += 1
+                continue
+            self.ids_usuarios.append(int(_texto(linha, 'id')))
+            self.cidade_usuario.append(self.cidades.codigo((_texto(linha, 'uf'), _texto(linha, 'cidade'))))
+            #Exportações antigas não têm criado_em
+            dia = _texto(linha, 'criado_em')[:10]
+            self.dia_usuario.append(self.dias.codigo(dia) if dia else -1)
+
+        for _, linha in ler_linhas(veiculos):
+            if not _texto(linha, 'id').isdigit() or not _texto(linha, 'id_usuario').isdigit():
+                self.ignoradas += 1
+                continue
+            self.ids_veiculos.append(int(_texto(linha, 'id')))
+            self.usuario_veiculo.append(int(_texto(linha, 'id_usuario')))
+            self.modelo_veiculo.append(self.modelos.codigo((_texto(linha, 'marca').upper(),
+                                                            _texto(linha, 'modelo').upper())))
+
+        for _, linha in ler_linhas(problemas) if problemas else ():
+            if not _texto(linha, 'id_veiculo').isdigit():
+                self.ignoradas += 1
+                continue
+            self.veiculo_problema.append(int(_texto(linha, 'id_veiculo')))
+            if _texto(linha, 'status') != STATUS_CONCLUIDO:
+                self.veiculo_problema_aberto.append(int(_texto(linha, 'id_veiculo')))
+
+    def veiculos_por_cidade(self):
+        cidades = _juntar(self.ids_usuarios, self.cidade_usuario, self.usuario_veiculo)
+        contagem = _contar(cidades, len(self.cidades.valores))
+        return [(uf or None, cidade or None, quantidade)
+                for (uf, cidade), quantidade in zip(self.cidades.valores, contagem) if quantidade]
+
+    def problemas_por_modelo(self):
+        quantidade_modelos = len(self.modelos.valores)
+        veiculos = _contar(self.modelo_veiculo, quantidade_modelos)
+        problemas = _contar(_juntar(self.ids_veiculos, self.modelo_veiculo, self.veiculo_problema),
+                            quantidade_modelos)
+        abertos = _contar(_juntar(self.ids_veiculos, self.modelo_veiculo, self.veiculo_problema_aberto),
+                          quantidade_modelos)
+        return [(marca or None, modelo or None, *quantidades)
+                for (marca, modelo), *quantidades in zip(self.modelos.valores, veiculos, problemas, abertos)
+                if quantidades[0]]
+
+    def cadastros_por_periodo(self, periodo):
+        return _cadastros_dos_dias(zip(self.dias.valores, _contar(self.dia_usuario, len(self.dias.valores))),
+                                   periodo)
+
+
+#Linhas (periodo, cadastros) a partir das contagens por dia (AAAA-MM-DD): o período é o começo do dia
+def _cadastros_dos_dias(dias, periodo):
+    tamanho = len(PERIODOS_RELATORIO[periodo][0])
+    contagem = Counter()
+    for dia, quantidade in dias:
+        if dia:
+            contagem[dia[:tamanho]] += quantidade
+    return sorted(contagem.items())
+
+
+#Linhas já agregadas em outro lugar, no formato do repositório (ex. somadas das partições de tarefas.py)
+#dias: linhas de cadastros_por_periodo('dia'), das quais saem os outros períodos
+class AgregadosProntos:
+    def __init__(self, cidades, modelos, dias):
+        self.cidades = cidades
+        self.modelos = modelos
+        self.dias = dias
+
+    def veiculos_por_cidade(self):
+        return self.cidades
+
+    def problemas_por_modelo(self):
+        return self.modelos
+
+    def cadastros_por_periodo(self, periodo):
+        return _cadastros_dos_dias(self.dias, periodo)
+
+
+#Linhas agregadas de uma fonte: do banco (com cache), de AgregadosArquivos ou de AgregadosProntos
+def _linhas(fonte, chave, tabelas, calcular):
+    if isinstance(fonte, (AgregadosArquivos, AgregadosProntos)):
+        return calcular(fonte)
+    return cache_relatorios.obter(chave, tabelas, lambda: calcular(obter_repositorio(fonte)))
+
+
+#Veículos por UF (ou por cidade), das regiões com mais veículos para as com menos
+#fonte: conexão/pool do Oracle, repositório, AgregadosArquivos ou AgregadosProntos
+def veiculos_por_regiao(fonte, por_cidade=False):
+    linhas = _linhas(fonte, ('veiculos_por_cidade',), ('usuarios', 'veiculos'),
+                     lambda origem: origem.veiculos_por_cidade())
+    contagem = Counter()
+    for uf, cidade, quantidade in linhas:
+        contagem[(uf or '', cidade or '') if por_cidade else (uf or '',)] += quantidade
+    return [{'uf': chave[0], **({'cidade': chave[1]} if por_cidade else {}), 'veiculos': quantidade}
+            for chave, quantidade in sorted(contagem.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def _problemas_por_modelo(fonte):
+    return _linhas(fonte, ('problemas_por_modelo',), ('veiculos', 'problemas'),
+                   lambda origem: origem.problemas_por_modelo())
+
+
+#As limite marcas com mais veículos, com o total de problemas registrados nelas
+def marcas_mais_comuns(fonte, limite=10):
+    veiculos, problemas = Counter(), Counter()
+    for marca, _, quantidade_veiculos, quantidade_problemas, _ in _problemas_por_modelo(fonte):
+        veiculos[marca or ''] += quantidade_veiculos
+        problemas[marca or ''] += quantidade_problemas
+    return [{'marca': marca, 'veiculos': quantidade, 'problemas': problemas[marca]}
+            for marca, quantidade in sorted(veiculos.items(), key=lambda item: (-item[1], item[0]))[:limite]]
+
+
+#Problemas por marca/modelo, dos modelos com mais problemas por veículo para os com menos
+#Modelos com menos de minimo_veiculos veículos ficam de fora (poucos veículos distorcem a taxa)
+def problemas_por_modelo(fonte, minimo_veiculos=1):
+    relatorio = [{'marca': marca or '', 'modelo': modelo or '', 'veiculos': veiculos, 'problemas': problemas,
+                  'abertos': abertos, 'problemas_por_veiculo': round(problemas / veiculos, 3)}
+                 for marca, modelo, veiculos, problemas, abertos in _problemas_por_modelo(fonte)
+                 if veiculos >= minimo_veiculos]
+    relatorio.sort(key=lambda linha: (-linha['problemas_por_veiculo'], -linha['veiculos'], linha['marca'],
+                                      linha['modelo']))
+    return relatorio
+
+
+#Contas criadas em cada período ('dia', 'mes' ou 'ano'), em ordem, com o total acumulado
+def cadastros_por_periodo(fonte, periodo='mes'):
+    if periodo not in PERIODOS_RELATORIO:
+        raise ValueError(f"Período inválido: {periodo}. Use {', '.join(PERIODOS_RELATORIO)}.")
+    linhas = _linhas(fonte, ('cadastros_por_periodo', periodo), ('usuarios',),
+                     lambda origem: origem.cadastros_por_periodo(periodo))
+    acumulado = 0
+    relatorio = []
+    for periodo_cadastro, quantidade in linhas:
+        acumulado += quantidade
+        relatorio.append({'periodo': periodo_cadastro, 'cadastros': quantidade, 'acumulado': acumulado})
+    return relatorio
+
+
+def gerar(fonte, relatorio, por_cidade=False, limite=10, minimo_veiculos=1, periodo='mes'):
+    if relatorio == 'regioes':
+        return veiculos_por_regiao(fonte, por_cidade)
+    if relatorio == 'marcas':
+        return marcas_mais_comuns(fonte, limite)
+    if relatorio == 'modelos':
+        return problemas_por_modelo(fonte, minimo_veiculos)
+    return cadastros_por_periodo(fonte, periodo)
+
+
+def imprimir_tabela(linhas):
+    if not linhas:
+        print('Nenhum dado.')
+        return
+    colunas = list(linhas[0])
+    larguras = [max(len(coluna), *(len(str(linha[coluna])) for linha in linhas)) for coluna in colunas]
+    print('  '.join(coluna.ljust(largura) for coluna, largura in zip(colunas, larguras)))
+    for linha in linhas:
+        print('  '.join(str(linha[coluna]).rjust(largura) if isinstance(linha[coluna], (int, float))
+                        else str(linha[coluna]).ljust(largura) for coluna, largura in zip(colunas, larguras)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Relatórios da frota do Link Car.')
+    parser.add_argument('relatorios', nargs='*', metavar='RELATORIO',
+                        help=f"Relatórios a gerar: {', '.join(RELATORIOS)} (padrão: todos)")
+    parser.add_argument('--por-cidade', action='store_true', help='Veículos por cidade em vez de por UF')
+    parser.add_argument('--limite', type=int, default=10, help='Quantidade de marcas no relatório de marcas')
+    parser.add_argument('--minimo-veiculos', type=int, default=1, help='Mínimo de veículos por modelo')
+    parser.add_argument('--periodo', choices=list(PERIODOS_RELATORIO), default='mes', help='Período dos cadastros')
+    parser.add_argument('--json', action='store_true', help='Saída em JSON')
+    origem = parser.add_mutually_exclusive_group()
+    origem.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite em vez do Oracle')
+    origem.add_argument('--arquivos', nargs='+', metavar=('USUARIOS', 'VEICULOS'),
+                        help='Agrega arquivos exportados (usuarios, veiculos e, opcional, problemas), sem o banco')
+    args = parser.parse_args()
+    invalidos = [relatorio for relatorio in args.relatorios if relatorio not in RELATORIOS]
+    if invalidos:
+        parser.error(f"relatório inválido: {', '.join(invalidos)} (use {', '.join(RELATORIOS)})")
+
+    if args.arquivos:
+        if len(args.arquivos) not in (2, 3):
+            parser.error('--arquivos recebe os arquivos de usuarios e veiculos, e opcionalmente o de problemas')
+        inicio = time.perf_counter()
+        fonte = AgregadosArquivos(*args.arquivos)
+        print(f"Arquivos lidos em {time.perf_counter() - inicio:.1f} s "
+              f"({'com' if _importar_numpy() is not None else 'sem'} NumPy, {fonte.ignoradas} linhas ignoradas).")
+    else:
+        fonte = RepositorioSqlite(args.sqlite) if args.sqlite else conectar_banco()
+        if not fonte:
+            print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+            return
+
+    resultados = {relatorio: gerar(fonte, relatorio, args.por_cidade, args.limite, args.minimo_veiculos,
+                                   args.periodo) for relatorio in args.relatorios or RELATORIOS}
+    if not isinstance(fonte, AgregadosArquivos):
+        fonte.close()
+
+    if args.json:
+        print(json.dumps(resultados, ensure_ascii=False, indent=2))
+        return
+    for relatorio, linhas in resultados.items():
+        print(f'\n=== {relatorio} ===')
+        imprimir_tabela(linhas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1337 @@
+#Camada de armazenamento das tabelas usuarios, veiculos e problemas
+#RepositorioOracle usa o banco de produção; RepositorioSqlite tem o mesmo comportamento e roda sem serviços
+#externos (em memória ou em arquivo), para testes e benchmarks
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import oracledb
+
+from banco import emprestar_conexao
+
+#Erros de banco que podem vir de qualquer um dos repositórios
+ERROS_BANCO = (oracledb.DatabaseError, sqlite3.Error)
+#Erros causados pelos dados gravados, e não por conexão caída ou banco fora do ar: repetir o comando não adianta
+#Restrições (chave, NOT NULL, único) e ORA-01438 número grande demais, ORA-01722 número inválido,
+#ORA-01830/01840/01841/01861 data inválida, ORA-12899 texto grande demais
+ERROS_DADOS = (oracledb.IntegrityError, oracledb.DataError, sqlite3.IntegrityError, sqlite3.DataError)
+CODIGOS_ERRO_DADOS = (1438, 1722, 1830, 1840, 1841, 1861, 12899)
+
+
+def erro_nos_dados(erro):
+    if isinstance(erro, ERROS_DADOS):
+        return True
+    return isinstance(erro, oracledb.DatabaseError) and getattr(erro.args[0], 'code', None) in CODIGOS_ERRO_DADOS
+
+#Colunas que podem ser alteradas em cada tabela
+CAMPOS_USUARIO = ('nome', 'email', 'senha', 'cep', 'uf', 'cidade', 'rua', 'bairro')
+CAMPOS_VEICULO = ('marca', 'modelo', 'cor', 'placa')
+
+
+def _veiculo(linha):
+    return {'id': linha[0], 'marca': linha[1], 'modelo': linha[2], 'cor': linha[3],
+            'placa': linha[4], 'chassi': linha[5]}
+
+
+#Placa sem hífen e espaços, em maiúsculas. As buscas usam exatamente estas expressões, para que o banco
+#use os índices de expressão (function-based) criados sobre elas
+EXPRESSAO_PLACA = "UPPER(REPLACE(REPLACE(placa, '-', ''), ' ', ''))"
+EXPRESSOES_BUSCA = {'marca': 'UPPER(marca)', 'modelo': 'UPPER(modelo)'}
+
+#Índices usados pela busca de veículos (iguais no Oracle e no SQLite)
+INDICES_BUSCA = (
+    f"CREATE INDEX ix_veiculos_placa_norm ON veiculos ({EXPRESSAO_PLACA})",
+    "CREATE INDEX ix_veiculos_chassi ON veiculos (UPPER(chassi))",
+    "CREATE INDEX ix_veiculos_marca_modelo ON veiculos (UPPER(marca), UPPER(modelo), id)",
+    "CREATE INDEX ix_veiculos_modelo ON veiculos (UPPER(modelo), id)",
+)
+#Um chassi e uma placa (normalizados) só podem estar em um veículo, mesmo com dois cadastros ao mesmo tempo
+#Nome do índice único -> (índice comum da busca sobre a mesma expressão, que ele substitui; expressão)
+INDICES_UNICOS_VEICULOS = {
+    'ux_veiculos_chassi': ('ix_veiculos_chassi', 'UPPER(chassi)'),
+    'ux_veiculos_placa_norm': ('ix_veiculos_placa_norm', EXPRESSAO_PLACA),
+}
+#Restrição única do email (migracoes.py): o Oracle cita o nome dela no erro, o SQLite cita a coluna
+RESTRICAO_EMAIL = ('uq_usuarios_email', 'usuarios.email')
+
+#Fila de diagnóstico: cada problema passa por PENDENTE -> EM_DIAGNOSTICO -> CONCLUIDO
+STATUS_PENDENTE = 'PENDENTE'
+STATUS_EM_DIAGNOSTICO = 'EM_DIAGNOSTICO'
+STATUS_CONCLUIDO = 'CONCLUIDO'
+#Prioridades: 1 é a mais urgente
+PRIORIDADE_ALTA, PRIORIDADE_NORMAL, PRIORIDADE_BAIXA = 1, 2, 3
+
+#Os trabalhadores pegam os próximos pendentes por prioridade e ordem de chegada, direto deste índice
+INDICE_FILA = "CREATE INDEX ix_problemas_fila ON problemas (status, prioridade, id)"
+
+#Consultas mais usadas pelo programa (iguais no Oracle e no SQLite). Ficam aqui, e não dentro dos métodos, para que
+#"python migracoes.py --verificar-planos" confira o plano de execução exatamente do que é executado
+SQL_EMAIL_CADASTRADO = "SELECT 1 FROM usuarios WHERE email = :email"
+SQL_CREDENCIAIS = "SELECT id, nome, email, senha FROM usuarios WHERE email = :email"
+SQL_VEICULOS_USUARIO = """
+    SELECT id, marca, modelo, cor, placa, chassi
+    FROM veiculos
+    WHERE id_usuario = :id_usuario
+    ORDER BY id
+"""
+SQL_PAINEL_USUARIO = f"""
+    SELECT v.id, v.marca, v.modelo, v.cor, v.placa, v.chassi, COUNT(p.id)
+    FROM veiculos v
+    LEFT JOIN problemas p ON p.id_veiculo = v.id AND p.status <> '{STATUS_CONCLUIDO}'
+    WHERE v.id_usuario = :id_usuario
+    GROUP BY v.id, v.marca, v.modelo, v.cor, v.placa, v.chassi
+    ORDER BY v.id
+"""
+SQL_OBTER_VEICULO = """
+    SELECT id, marca, modelo, cor, placa, chassi
+    FROM veiculos
+    WHERE id = :id AND id_usuario = :id_usuario
+"""
+SQL_PROBLEMAS_USUARIO = """
+    SELECT p.id, p.id_veiculo, v.placa, p.descricao, p.status, p.prioridade, p.criado_em, p.diagnostico
+    FROM veiculos v
+    JOIN problemas p ON p.id_veiculo = v.id
+    WHERE v.id_usuario = :id_usuario
+    ORDER BY p.id
+"""
+
+#Erros do Oracle de objetos que já existem, ignorados ao migrar um banco criado antes das migrações:
+#ORA-00955 nome já usado, ORA-01408 colunas já indexadas, ORA-01430 coluna já existe,
+#ORA-02260/02261 chave primária/única já existe, ORA-02275 chave estrangeira já existe
+ERROS_JA_EXISTE = (955, 1408, 1430, 2260, 2261, 2275)
+
+
+#Executa um comando de migração no Oracle: um DDL (ignorando ERROS_JA_EXISTE) ou uma função que recebe o cursor
+def _executar_ddl(cur, comando):
+    if callable(comando):
+        comando(cur)
+        return
+    try:
+        cur.execute(comando)
+    except oracledb.DatabaseError as e:
+        if e.args[0].code not in ERROS_JA_EXISTE:
+            raise
+
+#Comandos da gravação de problemas e da trilha de auditoria (iguais no Oracle e no SQLite)
+#O problema só é inserido se o veículo pertencer ao usuário
+SQL_INSERIR_PROBLEMA = """
+    INSERT INTO problemas (id_veiculo, descricao, prioridade)
+    SELECT id, :descricao, :prioridade FROM veiculos WHERE id = :id_veiculo AND id_usuario = :id_usuario
+"""
+SQL_INSERIR_AUDITORIA = """
+    INSERT INTO auditoria (ocorrido_em, id_usuario, entidade, id_entidade, acao, detalhes)
+    VALUES (:ocorrido_em, :id_usuario, :entidade, :id_entidade, :acao, :detalhes)
+"""
+
+#Relatórios da frota (relatorios.py): as contagens são feitas pelo banco, e só as linhas agregadas são transferidas
+SQL_VEICULOS_POR_CIDADE = """
+    SELECT u.uf, u.cidade, COUNT(*)
+    FROM veiculos v
+    JOIN usuarios u ON u.id = v.id_usuario
+    GROUP BY u.uf, u.cidade
+"""
+#Agrupado pelas mesmas expressões do índice ix_veiculos_marca_modelo
+SQL_PROBLEMAS_POR_MODELO = f"""
+    SELECT UPPER(v.marca), UPPER(v.modelo), COUNT(*), COALESCE(SUM(p.problemas), 0), COALESCE(SUM(p.abertos), 0)
+    FROM veiculos v
+    LEFT JOIN (
+        SELECT id_veiculo, COUNT(*) AS problemas,
+               SUM(CASE WHEN status = '{STATUS_CONCLUIDO}' THEN 0 ELSE 1 END) AS abertos
+        FROM problemas
+        GROUP BY id_veiculo
+    ) p ON p.id_veiculo = v.id
+    GROUP BY UPPER(v.marca), UPPER(v.modelo)
+"""
+#Períodos dos cadastros: máscara do TO_CHAR no Oracle e formato do strftime no SQLite (ambos geram ex. 2024-05)
+PERIODOS_RELATORIO = {'dia': ('YYYY-MM-DD', '%Y-%m-%d'), 'mes': ('YYYY-MM', '%Y-%m'), 'ano': ('YYYY', '%Y')}
+
+#Tarefas em lote (tarefas.py): as contas são divididas em faixas de ID com a mesma quantidade de contas, e cada
+#faixa é percorrida em lotes de contas consecutivas
+SQL_FAIXAS_USUARIOS = """
+    SELECT MIN(id), MAX(id)
+    FROM (SELECT id, NTILE(:partes) OVER (ORDER BY id) AS parte FROM usuarios)
+    GROUP BY parte
+    ORDER BY 1
+"""
+SQL_ENDERECOS_USUARIOS = """
+    SELECT id, cep, uf, cidade, rua, bairro FROM usuarios
+    WHERE id BETWEEN :primeiro AND :ultimo
+    ORDER BY id
+"""
+SQL_ATUALIZAR_ENDERECO = "UPDATE usuarios SET uf = :uf, cidade = :cidade, rua = :rua, bairro = :bairro WHERE id = :id"
+SQL_VEICULOS_FAIXA_USUARIOS = """
+    SELECT id, id_usuario, chassi, placa FROM veiculos
+    WHERE id_usuario BETWEEN :primeiro AND :ultimo
+"""
+#Os relatórios da frota (SQL_VEICULOS_POR_CIDADE, SQL_PROBLEMAS_POR_MODELO) só das contas de uma faixa
+SQL_VEICULOS_POR_CIDADE_FAIXA = """
+    SELECT u.uf, u.cidade, COUNT(*)
+    FROM veiculos v
+    JOIN usuarios u ON u.id = v.id_usuario
+    WHERE u.id BETWEEN :primeiro AND :ultimo
+    GROUP BY u.uf, u.cidade
+"""
+#Parte das contas da faixa (e não dos veículos): assim o banco lê só os veículos e problemas delas, em vez de
+#percorrer o índice ix_veiculos_marca_modelo inteiro para não ordenar o GROUP BY
+SQL_PROBLEMAS_POR_MODELO_FAIXA = f"""
+    SELECT UPPER(v.marca), UPPER(v.modelo), COUNT(DISTINCT v.id), COUNT(p.id),
+           SUM(CASE WHEN p.id IS NULL OR p.status = '{STATUS_CONCLUIDO}' THEN 0 ELSE 1 END)
+    FROM usuarios u
+    JOIN veiculos v ON v.id_usuario = u.id
+    LEFT JOIN problemas p ON p.id_veiculo = v.id
+    WHERE u.id BETWEEN :primeiro AND :ultimo
+    GROUP BY UPPER(v.marca), UPPER(v.modelo)
+"""
+
+#Máximo de IDs por comando no expurgo de contas (o Oracle aceita até 1000 itens em um IN)
+MAXIMO_IDS_POR_COMANDO = 1000
+
+
+#Consulta que devolve quais chassis e placas (normalizados) já estão cadastrados. Retorna (sql, parâmetros)
+def _sql_identificadores_existentes(chassis, placas):
+    partes = []
+    parametros = {}
+    if chassis:
+        nomes = ', '.join(f':chassi{i}' for i in range(len(chassis)))
+        partes.append(f"SELECT 'chassi', UPPER(chassi) FROM veiculos WHERE UPPER(chassi) IN ({nomes})")
+        parametros.update({f'chassi{i}': chassi for i, chassi in enumerate(chassis)})
+    if placas:
+        nomes = ', '.join(f':placa{i}' for i in range(len(placas)))
+        partes.append(f"SELECT 'placa', {EXPRESSAO_PLACA} FROM veiculos WHERE {EXPRESSAO_PLACA} IN ({nomes})")
+        parametros.update({f'placa{i}': placa for i, placa in enumerate(placas)})
+    return ' UNION ALL '.join(partes), parametros
+
+
+#_sql_identificadores_existentes em partes de até MAXIMO_IDS_POR_COMANDO chassis e placas (limite do IN no Oracle,
+#e mantém o SQLite abaixo do limite de parâmetros por comando)
+def _consultas_identificadores_existentes(chassis, placas):
+    for inicio in range(0, max(len(chassis), len(placas)), MAXIMO_IDS_POR_COMANDO):
+        yield _sql_identificadores_existentes(chassis[inicio:inicio + MAXIMO_IDS_POR_COMANDO],
+                                              placas[inicio:inicio + MAXIMO_IDS_POR_COMANDO])
+
+
+def _separar_identificadores(linhas):
+    chassis, placas = set(), set()
+    for tipo, valor in linhas:
+        (chassis if tipo == 'chassi' else placas).add(valor)
+    return chassis, placas
+
+
+#Comandos que apagam um conjunto de contas, na ordem: problemas, veículos e usuários. Retorna (sql, parâmetros)
+def _sql_apagar_contas(ids):
+    nomes = ', '.join(f':id{i}' for i in range(len(ids)))
+    parametros = {f'id{i}': id_usuario for i, id_usuario in enumerate(ids)}
+    return [
+        ('problemas', f"""
+            DELETE FROM problemas
+            WHERE id_veiculo IN (SELECT id FROM veiculos WHERE id_usuario IN ({nomes}))
+        """),
+        ('veiculos', f"DELETE FROM veiculos WHERE id_usuario IN ({nomes})"),
+        ('usuarios', f"DELETE FROM usuarios WHERE id IN ({nomes})"),
+    ], parametros
+
+
+#Monta o WHERE da busca de veículos. placas é uma lista de placas já normalizadas; marca e modelo podem
+#ser um texto (busca pelo prefixo) ou uma lista (valores exatos, vindos da busca aproximada)
+def _sql_busca_veiculos(placas=(), chassi=None, marca=None, modelo=None, ultimo_id=0):
+    condicoes = ['id > :ultimo_id']
+    parametros = {'ultimo_id': ultimo_id}
+    if placas:
+        nomes = [f':placa{i}' for i in range(len(placas))]
+        condicoes.append(f"{EXPRESSAO_PLACA} IN ({', '.join(nomes)})")
+        parametros.update({nome[1:]: placa for nome, placa in zip(nomes, placas)})
+    if chassi:
+        condicoes.append('UPPER(chassi) = :chassi')
+        parametros['chassi'] = chassi
+    for campo, valor in (('marca', marca), ('modelo', modelo)):
+        expressao = EXPRESSOES_BUSCA[campo]
+        if isinstance(valor, str) and valor:
+            #Prefixo como intervalo (>= e <), que usa o índice no Oracle e no SQLite, ao contrário do LIKE
+            condicoes.append(f'{expressao} >= :{campo}_inicio AND {expressao} < :{campo}_fim')
+            parametros[f'{campo}_inicio'] = valor
+            parametros[f'{campo}_fim'] = valor[:-1] + chr(ord(valor[-1]) + 1)
+        elif valor:
+            nomes = [f':{campo}{i}' for i in range(len(valor))]
+            condicoes.append(f"{expressao} IN ({', '.join(nomes)})")
+            parametros.update({nome[1:]: item for nome, item in zip(nomes, valor)})
+    return ' AND '.join(condicoes), parametros
+
+
+def _consulta_busca(**filtros):
+    condicoes, parametros = _sql_busca_veiculos(**filtros)
+    return f"SELECT id, marca, modelo, cor, placa, chassi FROM veiculos WHERE {condicoes} ORDER BY id", parametros
+
+
+def _consultas_apagar_conta():
+    comandos, parametros = _sql_apagar_contas([1])
+    return tuple((f'apagar conta ({tabela})', sql, parametros) for tabela, sql in comandos)
+
+
+#Consultas feitas a cada cadastro, login e tela do menu/API, com parâmetros de exemplo: (nome, sql, parâmetros)
+#"python migracoes.py --verificar-planos" falha se alguma delas percorrer uma tabela inteira
+CONSULTAS_FREQUENTES = (
+    ('email já cadastrado', SQL_EMAIL_CADASTRADO, {'email': 'maria@exemplo.com'}),
+    ('login', SQL_CREDENCIAIS, {'email': 'maria@exemplo.com'}),
+    ('veículos do usuário', SQL_VEICULOS_USUARIO, {'id_usuario': 1}),
+    ('painel do usuário', SQL_PAINEL_USUARIO, {'id_usuario': 1}),
+    ('veículo do usuário', SQL_OBTER_VEICULO, {'id': 1, 'id_usuario': 1}),
+    ('problemas do usuário', SQL_PROBLEMAS_USUARIO, {'id_usuario': 1}),
+    ('registrar problema', SQL_INSERIR_PROBLEMA,
+     {'descricao': 'Barulho no freio', 'prioridade': PRIORIDADE_NORMAL, 'id_veiculo': 1, 'id_usuario': 1}),
+    ('chassis e placas cadastrados', *_sql_identificadores_existentes(['9BWZZZ377VT004251'], ['ABC1D23'])),
+    ('busca por placa', *_consulta_busca(placas=['ABC1D23'])),
+    ('busca por chassi', *_consulta_busca(chassi='9BWZZZ377VT004251')),
+    ('busca por marca', *_consulta_busca(marca='VOLKS')),
+    ('busca por modelo', *_consulta_busca(modelo='GOL')),
+    ('fila de diagnóstico',
+     f"SELECT id FROM problemas WHERE status = '{STATUS_PENDENTE}' ORDER BY prioridade, id", {}),
+    *_consultas_apagar_conta(),
+)
+
+
+#Separa um lote de eventos (ver gravacao.py) nos parâmetros de SQL_INSERIR_PROBLEMA e SQL_INSERIR_AUDITORIA
+def _separar_eventos(eventos):
+    problemas = [{campo: evento[campo] for campo in ('id_usuario', 'id_veiculo', 'descricao', 'prioridade')}
+                 for evento in eventos if evento['tipo'] == 'problema']
+    auditoria = [{campo: evento[campo]
+                  for campo in ('ocorrido_em', 'id_usuario', 'entidade', 'id_entidade', 'acao', 'detalhes')}
+                 for evento in eventos if evento['tipo'] == 'auditoria']
+    return problemas, auditoria
+
+
+def _problema(linha):
+    return {'id': linha[0], 'id_veiculo': linha[1], 'descricao': linha[2], 'prioridade': linha[3],
+            'criado_em': str(linha[4])}
+
+
+def _endereco(linha):
+    return {'id': linha[0], 'cep': linha[1], 'uf': linha[2], 'cidade': linha[3], 'rua': linha[4], 'bairro': linha[5]}
+
+
+def _problema_usuario(linha):
+    return {'id': linha[0], 'id_veiculo': linha[1], 'placa': linha[2], 'descricao': linha[3], 'status': linha[4],
+            'prioridade': linha[5], 'criado_em': str(linha[6]), 'diagnostico': linha[7]}
+
+
+def _estatisticas_fila(quantidades, idade, espera, latencia, concluidos_hora):
+    def segundos(valor):
+        return round(float(valor), 1) if valor is not None else None
+    return {'pendentes': quantidades.get(STATUS_PENDENTE, 0),
+            'em_diagnostico': quantidades.get(STATUS_EM_DIAGNOSTICO, 0),
+            'concluidos': quantidades.get(STATUS_CONCLUIDO, 0),
+            'idade_pendente_mais_antigo_s': segundos(idade),
+            'espera_media_s': segundos(espera),
+            'latencia_media_s': segundos(latencia),
+            'concluidos_ultima_hora': concluidos_hora}
+
+
+#Agrupa as linhas do join usuarios x veiculos em uma conta com a lista de veículos
+def _agrupar_contas(linhas):
+    conta = None
+    for linha in linhas:
+        if conta is None or linha[0] != conta['id']:
+            if conta is not None:
+                yield conta
+            conta = {'id': linha[0], 'nome': linha[1], 'email': linha[2], 'cep': linha[3],
+                     'uf': linha[4], 'cidade': linha[5], 'rua': linha[6], 'bairro': linha[7],
+                     'veiculos': []}
+        if linha[8] is not None:
+            conta['veiculos'].append({'marca': linha[8], 'modelo': linha[9], 'placa': linha[10]})
+    if conta is not None:
+        yield conta
+
+
+def _sql_atualizacao(campos, permitidos):
+    invalidos = set(campos) - set(permitidos)
+    if invalidos:
+        raise ValueError(f'Campos não permitidos: {", ".join(sorted(invalidos))}')
+    return ', '.join(f'{campo} = :{campo}' for campo in campos)
+
+
+#Um INSERT ou UPDATE recusado por um dos INDICES_UNICOS_VEICULOS ou pela RESTRICAO_EMAIL. indice: o nome dele
+class RegistroDuplicado(Exception):
+    def __init__(self, indice):
+        super().__init__(f'Registro duplicado ({indice})')
+        self.indice = indice
+
+
+#Problemas de um lote (gravar_lote) que não foram inseridos: o veículo não existe mais ou não é do usuário
+#O INSERT ... SELECT não dá erro nesse caso, só não insere a linha
+class ProblemaSemVeiculo(Exception):
+    def __init__(self, faltando):
+        super().__init__(f'{faltando} problemas de veículos apagados ou de outro usuário')
+        self.faltando = faltando
+
+
+#Troca o erro do banco por RegistroDuplicado quando um índice único dos veículos ou o email é violado
+#(ORA-00001 no Oracle, "UNIQUE constraint failed: index ..." no SQLite, ambos com o nome do índice)
+@contextmanager
+def _conferir_duplicados():
+    try:
+        yield
+    except (oracledb.IntegrityError, sqlite3.IntegrityError) as e:
+        mensagem = str(e).lower()
+        for indice in INDICES_UNICOS_VEICULOS:
+            if indice in mensagem:
+                raise RegistroDuplicado(indice) from None
+        if any(texto in mensagem for texto in RESTRICAO_EMAIL):
+            raise RegistroDuplicado(RESTRICAO_EMAIL[0]) from None
+        raise
+
+
+#Interface comum aos repositórios
+class Repositorio:
+    def email_cadastrado(self, email):
+        raise NotImplementedError
+
+    #dados: nome, email, senha, cep, uf, cidade, rua, bairro. Retorna o ID criado
+    def inserir_usuario(self, dados):
+        raise NotImplementedError
+
+    #Retorna {'id', 'nome', 'email', 'senha'} da conta com o email (senha é o hash guardado), senão None
+    def buscar_credenciais(self, email):
+        raise NotImplementedError
+
+    #Percorre até limite contas com ID maior que ultimo_id, em ordem de ID, com os veículos de cada uma
+    def iterar_contas(self, ultimo_id=0, limite=50):
+        raise NotImplementedError
+
+    #Apaga as contas, os veículos delas e os problemas desses veículos em uma única transação
+    #(no máximo MAXIMO_IDS_POR_COMANDO IDs). Retorna as linhas apagadas: {'usuarios', 'veiculos', 'problemas'}
+    def apagar_contas(self, ids):
+        raise NotImplementedError
+
+    #Apaga a conta, os veículos e os problemas dela. Retorna False se a conta não existir
+    def apagar_conta(self, id_usuario):
+        return self.apagar_contas([id_usuario])['usuarios'] > 0
+
+    #IDs (em ordem, a partir de ultimo_id) das contas sem acesso desde a data. Contas que nunca entraram
+    #contam a partir da criação
+    def ids_contas_inativas(self, desde, ultimo_id=0, limite=MAXIMO_IDS_POR_COMANDO):
+        raise NotImplementedError
+
+    def registrar_acesso(self, id_usuario):
+        raise NotImplementedError
+
+    def atualizar_usuario(self, id_usuario, campos):
+        raise NotImplementedError
+
+    #dados: chassi, marca, modelo, cor, placa. Retorna o ID criado
+    def inserir_veiculo(self, id_usuario, dados):
+        raise NotImplementedError
+
+    def listar_veiculos(self, id_usuario):
+        raise NotImplementedError
+
+    #Veículos do usuário com a quantidade de problemas não concluídos de cada um:
+    #linhas (id, marca, modelo, cor, placa, chassi, problemas_abertos), em ordem de ID
+    def painel_usuario(self, id_usuario):
+        raise NotImplementedError
+
+    def obter_veiculo(self, id_veiculo, id_usuario):
+        raise NotImplementedError
+
+    #Retorna False se o veículo não existir ou não for do usuário
+    def atualizar_veiculo(self, id_veiculo, id_usuario, campos):
+        raise NotImplementedError
+
+    def apagar_veiculo(self, id_veiculo, id_usuario):
+        raise NotImplementedError
+
+    #Retorna False se o veículo não existir ou não for do usuário
+    def inserir_problema(self, id_usuario, id_veiculo, descricao, prioridade=PRIORIDADE_NORMAL):
+        raise NotImplementedError
+
+    #Problemas de todos os veículos do usuário, em ordem de ID
+    def problemas_usuario(self, id_usuario):
+        raise NotImplementedError
+
+    #Grava um lote de eventos (problemas e auditoria, ver gravacao.py) em uma transação, um comando por tabela
+    #Com id_lote, cada lote é gravado uma única vez: retorna False se ele já tinha sido gravado
+    #Lança ProblemaSemVeiculo (e nada é gravado) se algum problema for de um veículo apagado ou de outro usuário
+    def gravar_lote(self, id_lote, eventos):
+        raise NotImplementedError
+
+    #Apaga os IDs dos lotes gravados há mais de dias dias (só servem para recuperar o spool depois de uma queda)
+    def esquecer_lotes(self, dias):
+        raise NotImplementedError
+
+    #Busca veículos de todos os usuários (ver _sql_busca_veiculos), em ordem de ID, a partir de ultimo_id
+    def buscar_veiculos(self, placas=(), chassi=None, marca=None, modelo=None, ultimo_id=0, limite=20):
+        raise NotImplementedError
+
+    #Valores distintos (em maiúsculas) de marca ou modelo, usados na busca aproximada
+    def valores_distintos(self, campo):
+        raise NotImplementedError
+
+    def contar_veiculos(self):
+        raise NotImplementedError
+
+    #Percorre (chassi, placa) de todos os veículos, normalizados como nos índices da busca
+    def iterar_identificadores_veiculos(self):
+        raise NotImplementedError
+
+    #Retorna (chassis, placas) já cadastrados entre os informados (normalizados), em uma consulta por parte de até
+    #MAXIMO_IDS_POR_COMANDO chassis e placas
+    def identificadores_existentes(self, chassis, placas):
+        raise NotImplementedError
+
+    #Aplica, em ordem, as migrações (ver migracoes.py) que ainda não constam na tabela versao_esquema
+    #Com apenas_listar=True, só informa quais faltam. Retorna (versao, descricao) das aplicadas ou pendentes
+    def aplicar_migracoes(self, migracoes, apenas_listar=False):
+        raise NotImplementedError
+
+    #Plano de execução do sql: lista de (passo, leitura_completa), com leitura_completa=True nos passos que
+    #percorrem uma tabela inteira
+    def plano_execucao(self, sql, parametros):
+        raise NotImplementedError
+
+    #Linhas (uf, cidade, veiculos) com a quantidade de veículos dos usuários de cada cidade
+    def veiculos_por_cidade(self):
+        raise NotImplementedError
+
+    #Linhas (marca, modelo, veiculos, problemas, problemas_abertos), com marca e modelo em maiúsculas
+    def problemas_por_modelo(self):
+        raise NotImplementedError
+
+    #Linhas (periodo, cadastros) em ordem, com periodo no formato de PERIODOS_RELATORIO (ex. '2024-05')
+    def cadastros_por_periodo(self, periodo):
+        raise NotImplementedError
+
+    #Divide as contas em até partes faixas de ID com a mesma quantidade de contas: lista de (primeiro, ultimo)
+    def faixas_usuarios(self, partes):
+        raise NotImplementedError
+
+    #Maior ID do próximo lote de até limite contas com ID maior que ultimo_id e até fim, ou None se não houver
+    def fim_lote_usuarios(self, ultimo_id, fim, limite):
+        raise NotImplementedError
+
+    #Endereços ({'id', 'cep', 'uf', 'cidade', 'rua', 'bairro'}) das contas com ID entre primeiro e ultimo
+    def enderecos_usuarios(self, primeiro, ultimo):
+        raise NotImplementedError
+
+    #Grava os endereços ({'id', 'uf', 'cidade', 'rua', 'bairro'}) com um único commit
+    def atualizar_enderecos(self, enderecos):
+        raise NotImplementedError
+
+    #Linhas (id, id_usuario, chassi, placa) dos veículos das contas com ID entre primeiro e ultimo
+    def veiculos_faixa_usuarios(self, primeiro, ultimo):
+        raise NotImplementedError
+
+    #As linhas de veiculos_por_cidade, problemas_por_modelo e cadastros_por_periodo('dia'), só das contas com ID
+    #entre primeiro e ultimo (e dos veículos delas): {'cidades', 'modelos', 'dias'}
+    def relatorios_faixa_usuarios(self, primeiro, ultimo):
+        raise NotImplementedError
+
+    #Reserva até quantidade problemas pendentes para o trabalhador, os mais urgentes e antigos primeiro
+    def reservar_problemas(self, trabalhador, quantidade):
+        raise NotImplementedError
+
+    #resultados: lista de (id_problema, diagnostico). Retorna quantos foram concluídos
+    def concluir_problemas(self, trabalhador, resultados):
+        raise NotImplementedError
+
+    #Devolve à fila problemas reservados pelo trabalhador que não foram concluídos
+    def devolver_problemas(self, trabalhador, ids):
+        raise NotImplementedError
+
+    #Devolve à fila reservas mais antigas que segundos (ex. trabalhador que parou no meio). Retorna quantas
+    def devolver_reservas_expiradas(self, segundos):
+        raise NotImplementedError
+
+    #Quantidade por status, idade do pendente mais antigo e tempos médios da última hora, em segundos
+    def estatisticas_fila(self):
+        raise NotImplementedError
+
+
+class RepositorioOracle(Repositorio):
+    #conn pode ser uma conexão única ou um pool
+    def __init__(self, conn):
+        self.conn = conn
+
+    def email_cadastrado(self, email):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_EMAIL_CADASTRADO, email=email)
+            return cur.fetchone() is not None
+
+    def inserir_usuario(self, dados):
+        with _conferir_duplicados(), emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            id_usuario = cur.var(oracledb.NUMBER)
+            cur.execute("""
+                INSERT INTO usuarios (nome, email, senha, cep, uf, cidade, rua, bairro)
+                VALUES (:nome, :email, :senha, :cep, :uf, :cidade, :rua, :bairro)
+                RETURNING id INTO :id
+            """, {**{campo: dados[campo] for campo in CAMPOS_USUARIO}, 'id': id_usuario})
+            con.commit()
+            return int(id_usuario.getvalue()[0])
+
+    def buscar_credenciais(self, email):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_CREDENCIAIS, email=email)
+            conta = cur.fetchone()
+            if conta:
+                return {'id': conta[0], 'nome': conta[1], 'email': conta[2], 'senha': conta[3]}
+            return None
+
+    #Cada conta é entregue assim que as suas linhas chegam do banco, sem esperar pela página inteira
+    def iterar_contas(self, ultimo_id=0, limite=50):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            #Busca as linhas em blocos, evitando uma ida ao banco para cada linha
+            cur.prefetchrows = limite + 1
+            cur.arraysize = limite
+            cur.execute("""
+                SELECT u.id, u.nome, u.email, u.cep, u.uf, u.cidade, u.rua, u.bairro,
+                       v.marca, v.modelo, v.placa
+                FROM (
+                    SELECT id, nome, email, cep, uf, cidade, rua, bairro
+                    FROM usuarios
+                    WHERE id > :ultimo_id
+                    ORDER BY id
+                    FETCH FIRST :limite ROWS ONLY
+                ) u
+                LEFT JOIN veiculos v ON v.id_usuario = u.id
+                ORDER BY u.id, v.id
+            """, ultimo_id=ultimo_id, limite=limite)
+            yield from _agrupar_contas(cur)
+
+    def apagar_contas(self, ids):
+        comandos, parametros = _sql_apagar_contas(ids)
+        apagadas = {}
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            try:
+                for tabela, sql in comandos:
+                    cur.execute(sql, parametros)
+                    apagadas[tabela] = cur.rowcount
+                con.commit()
+            except oracledb.DatabaseError:
+                con.rollback()
+                raise
+        return apagadas
+
+    def ids_contas_inativas(self, desde, ultimo_id=0, limite=MAXIMO_IDS_POR_COMANDO):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = limite
+            cur.execute("""
+                SELECT id FROM usuarios
+                WHERE id > :ultimo_id AND COALESCE(ultimo_acesso, criado_em) < :desde
+                ORDER BY id
+                FETCH FIRST :limite ROWS ONLY
+            """, ultimo_id=ultimo_id, desde=desde, limite=limite)
+            return [linha[0] for linha in cur]
+
+    def registrar_acesso(self, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("UPDATE usuarios SET ultimo_acesso = SYSTIMESTAMP WHERE id = :id", id=id_usuario)
+            con.commit()
+
+    def atualizar_usuario(self, id_usuario, campos):
+        sql = f"UPDATE usuarios SET {_sql_atualizacao(campos, CAMPOS_USUARIO)} WHERE id = :id"
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(sql, {**campos, 'id': id_usuario})
+            con.commit()
+
+    def inserir_veiculo(self, id_usuario, dados):
+        with _conferir_duplicados(), emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            id_veiculo = cur.var(oracledb.NUMBER)
+            cur.execute("""
+                INSERT INTO veiculos (id_usuario, chassi, marca, modelo, cor, placa)
+                VALUES (:id_usuario, :chassi, :marca, :modelo, :cor, :placa)
+                RETURNING id INTO :id
+            """, id_usuario=id_usuario, chassi=dados['chassi'], marca=dados['marca'],
+                 modelo=dados['modelo'], cor=dados['cor'], placa=dados['placa'], id=id_veiculo)
+            con.commit()
+            return int(id_veiculo.getvalue()[0])
+
+    def listar_veiculos(self, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_VEICULOS_USUARIO, id_usuario=id_usuario)
+            return [_veiculo(linha) for linha in cur]
+
+    def painel_usuario(self, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_PAINEL_USUARIO, id_usuario=id_usuario)
+            return cur.fetchall()
+
+    def obter_veiculo(self, id_veiculo, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_OBTER_VEICULO, id=id_veiculo, id_usuario=id_usuario)
+            linha = cur.fetchone()
+            return _veiculo(linha) if linha else None
+
+    def atualizar_veiculo(self, id_veiculo, id_usuario, campos):
+        sql = (f"UPDATE veiculos SET {_sql_atualizacao(campos, CAMPOS_VEICULO)} "
+               f"WHERE id = :id AND id_usuario = :id_usuario")
+        with _conferir_duplicados(), emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(sql, {**campos, 'id': id_veiculo, 'id_usuario': id_usuario})
+            if cur.rowcount > 0:
+                con.commit()
+                return True
+            return False
+
+    def apagar_veiculo(self, id_veiculo, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("DELETE FROM veiculos WHERE id = :id AND id_usuario = :id_usuario",
+                        id=id_veiculo, id_usuario=id_usuario)
+            if cur.rowcount > 0:
+                con.commit()
+                return True
+            return False
+
+    def inserir_problema(self, id_usuario, id_veiculo, descricao, prioridade=PRIORIDADE_NORMAL):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_INSERIR_PROBLEMA, descricao=descricao, prioridade=prioridade, id_veiculo=id_veiculo,
+                        id_usuario=id_usuario)
+            if cur.rowcount == 0:
+                return False
+            con.commit()
+            return True
+
+    def problemas_usuario(self, id_usuario):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_PROBLEMAS_USUARIO, id_usuario=id_usuario)
+            return [_problema_usuario(linha) for linha in cur]
+
+    def gravar_lote(self, id_lote, eventos):
+        problemas, auditoria = _separar_eventos(eventos)
+        for evento in auditoria:
+            evento['ocorrido_em'] = datetime.fromisoformat(evento['ocorrido_em'])
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            try:
+                if id_lote:
+                    cur.execute("""
+                        INSERT INTO lotes_gravados (id)
+                        SELECT :id FROM dual WHERE NOT EXISTS (SELECT 1 FROM lotes_gravados WHERE id = :id)
+                    """, id=id_lote)
+                    if cur.rowcount == 0:
+                        con.rollback()
+                        return False
+                if problemas:
+                    cur.executemany(SQL_INSERIR_PROBLEMA, problemas)
+                    if cur.rowcount < len(problemas):
+                        raise ProblemaSemVeiculo(len(problemas) - cur.rowcount)
+                if auditoria:
+                    cur.executemany(SQL_INSERIR_AUDITORIA, auditoria)
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+        return True
+
+    def esquecer_lotes(self, dias):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("DELETE FROM lotes_gravados WHERE gravado_em < SYSTIMESTAMP - NUMTODSINTERVAL(:dias, 'DAY')",
+                        dias=dias)
+            con.commit()
+
+    def buscar_veiculos(self, placas=(), chassi=None, marca=None, modelo=None, ultimo_id=0, limite=20):
+        condicoes, parametros = _sql_busca_veiculos(placas, chassi, marca, modelo, ultimo_id)
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.prefetchrows = limite + 1
+            cur.arraysize = limite
+            cur.execute(f"""
+                SELECT id, marca, modelo, cor, placa, chassi, id_usuario
+                FROM veiculos
+                WHERE {condicoes}
+                ORDER BY id
+                FETCH FIRST :limite ROWS ONLY
+            """, {**parametros, 'limite': limite})
+            return [{**_veiculo(linha), 'id_usuario': linha[6]} for linha in cur]
+
+    def valores_distintos(self, campo):
+        expressao = EXPRESSOES_BUSCA[campo]
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 1000
+            #Lido só do índice, sem acessar a tabela
+            cur.execute(f"SELECT DISTINCT {expressao} FROM veiculos WHERE {expressao} IS NOT NULL")
+            return [linha[0] for linha in cur]
+
+    def contar_veiculos(self):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM veiculos")
+            return cur.fetchone()[0]
+
+    def iterar_identificadores_veiculos(self):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 5000
+            cur.prefetchrows = 5000
+            cur.execute(f"SELECT UPPER(chassi), {EXPRESSAO_PLACA} FROM veiculos")
+            yield from cur
+
+    def identificadores_existentes(self, chassis, placas):
+        encontrados = set(), set()
+        for sql, parametros in _consultas_identificadores_existentes(chassis, placas):
+            with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+                cur.execute(sql, parametros)
+                for conjunto, novos in zip(encontrados, _separar_identificadores(cur)):
+                    conjunto.update(novos)
+        return encontrados
+
+    def aplicar_migracoes(self, migracoes, apenas_listar=False):
+        pendentes = []
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            try:
+                cur.execute("SELECT versao FROM versao_esquema")
+                aplicadas = {linha[0] for linha in cur}
+            except oracledb.DatabaseError as e:
+                #ORA-00942: a tabela ainda não existe (nenhuma migração aplicada); ela é criada pela primeira
+                if e.args[0].code != 942:
+                    raise
+                aplicadas = set()
+            for versao, descricao, comandos in migracoes:
+                if versao in aplicadas:
+                    continue
+                if not apenas_listar:
+                    #Cada DDL é confirmado pelo próprio Oracle: se um comando falhar, a versão não é registrada e,
+                    #na próxima vez, os comandos que já tinham dado certo são ignorados (ERROS_JA_EXISTE)
+                    for comando in comandos:
+                        _executar_ddl(cur, comando)
+                    cur.execute("INSERT INTO versao_esquema (versao, descricao) VALUES (:versao, :descricao)",
+                                versao=versao, descricao=descricao)
+                    con.commit()
+                pendentes.append((versao, descricao))
+        return pendentes
+
+    def plano_execucao(self, sql, parametros):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(f"EXPLAIN PLAN SET STATEMENT_ID = 'linkcar' FOR {sql}", parametros)
+            cur.execute("""
+                SELECT LPAD(' ', 2 * depth) || operation || ' ' || options || ' ' || object_name, operation, options
+                FROM plan_table
+                WHERE statement_id = 'linkcar'
+                ORDER BY id
+            """)
+            passos = [(passo.rstrip(), operacao == 'TABLE ACCESS' and opcoes == 'FULL')
+                      for passo, operacao, opcoes in cur]
+            cur.execute("DELETE FROM plan_table WHERE statement_id = 'linkcar'")
+            con.commit()
+        return passos
+
+    def _agregar(self, sql):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 1000
+            cur.prefetchrows = 1000
+            cur.execute(sql)
+            return cur.fetchall()
+
+    def veiculos_por_cidade(self):
+        return self._agregar(SQL_VEICULOS_POR_CIDADE)
+
+    def problemas_por_modelo(self):
+        return self._agregar(SQL_PROBLEMAS_POR_MODELO)
+
+    def cadastros_por_periodo(self, periodo):
+        mascara = PERIODOS_RELATORIO[periodo][0]
+        return self._agregar(f"""
+            SELECT TO_CHAR(criado_em, '{mascara}'), COUNT(*) FROM usuarios
+            GROUP BY TO_CHAR(criado_em, '{mascara}')
+            ORDER BY 1
+        """)
+
+    def faixas_usuarios(self, partes):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(SQL_FAIXAS_USUARIOS, partes=partes)
+            return cur.fetchall()
+
+    def fim_lote_usuarios(self, ultimo_id, fim, limite):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM usuarios
+                    WHERE id > :ultimo_id AND id <= :fim
+                    ORDER BY id
+                    FETCH FIRST :limite ROWS ONLY
+                )
+            """, ultimo_id=ultimo_id, fim=fim, limite=limite)
+            return cur.fetchone()[0]
+
+    def enderecos_usuarios(self, primeiro, ultimo):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 1000
+            cur.prefetchrows = 1000
+            cur.execute(SQL_ENDERECOS_USUARIOS, primeiro=primeiro, ultimo=ultimo)
+            return [_endereco(linha) for linha in cur]
+
+    def atualizar_enderecos(self, enderecos):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            try:
+                cur.executemany(SQL_ATUALIZAR_ENDERECO, enderecos)
+                con.commit()
+            except oracledb.DatabaseError:
+                con.rollback()
+                raise
+
+    def veiculos_faixa_usuarios(self, primeiro, ultimo):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 1000
+            cur.prefetchrows = 1000
+            cur.execute(SQL_VEICULOS_FAIXA_USUARIOS, primeiro=primeiro, ultimo=ultimo)
+            return cur.fetchall()
+
+    def relatorios_faixa_usuarios(self, primeiro, ultimo):
+        mascara = PERIODOS_RELATORIO['dia'][0]
+        consultas = {
+            'cidades': SQL_VEICULOS_POR_CIDADE_FAIXA,
+            'modelos': SQL_PROBLEMAS_POR_MODELO_FAIXA,
+            'dias': f"""
+                SELECT TO_CHAR(criado_em, '{mascara}'), COUNT(*) FROM usuarios
+                WHERE id BETWEEN :primeiro AND :ultimo
+                GROUP BY TO_CHAR(criado_em, '{mascara}')
+            """,
+        }
+        linhas = {}
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.arraysize = 1000
+            cur.prefetchrows = 1000
+            for chave, sql in consultas.items():
+                cur.execute(sql, primeiro=primeiro, ultimo=ultimo)
+                linhas[chave] = cur.fetchall()
+        return linhas
+
+    def reservar_problemas(self, trabalhador, quantidade):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            #O Oracle não aceita FETCH FIRST com FOR UPDATE: as linhas são travadas conforme são buscadas,
+            #então só o primeiro bloco (quantidade linhas) é buscado. SKIP LOCKED pula as que outros
+            #trabalhadores já travaram, sem esperar por elas
+            cur.prefetchrows = quantidade
+            cur.arraysize = quantidade
+            cur.execute(f"""
+                SELECT p.id, p.id_veiculo, p.descricao, p.prioridade, p.criado_em
+                FROM problemas p
+                WHERE p.status = '{STATUS_PENDENTE}'
+                ORDER BY p.prioridade, p.id
+                FOR UPDATE SKIP LOCKED
+            """)
+            linhas = cur.fetchmany(quantidade)
+            if not linhas:
+                con.rollback()
+                return []
+            cur.executemany(f"""
+                UPDATE problemas
+                SET status = '{STATUS_EM_DIAGNOSTICO}', trabalhador = :trabalhador,
+                    reservado_em = SYSTIMESTAMP, tentativas = tentativas + 1
+                WHERE id = :id
+            """, [{'trabalhador': trabalhador, 'id': linha[0]} for linha in linhas])
+            con.commit()
+            return [_problema(linha) for linha in linhas]
+
+    def concluir_problemas(self, trabalhador, resultados):
+        if not resultados:
+            return 0
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            #Uma única ida ao banco e um único commit para o lote inteiro
+            cur.executemany(f"""
+                UPDATE problemas
+                SET status = '{STATUS_CONCLUIDO}', diagnostico = :diagnostico, concluido_em = SYSTIMESTAMP
+                WHERE id = :id AND trabalhador = :trabalhador AND status = '{STATUS_EM_DIAGNOSTICO}'
+            """, [{'id': id_problema, 'diagnostico': diagnostico, 'trabalhador': trabalhador}
+                  for id_problema, diagnostico in resultados], arraydmlrowcounts=True)
+            concluidos = sum(cur.getarraydmlrowcounts())
+            con.commit()
+            return concluidos
+
+    def devolver_problemas(self, trabalhador, ids):
+        if not ids:
+            return
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.executemany(f"""
+                UPDATE problemas SET status = '{STATUS_PENDENTE}', trabalhador = NULL, reservado_em = NULL
+                WHERE id = :id AND trabalhador = :trabalhador AND status = '{STATUS_EM_DIAGNOSTICO}'
+            """, [{'id': id_problema, 'trabalhador': trabalhador} for id_problema in ids])
+            con.commit()
+
+    def devolver_reservas_expiradas(self, segundos):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute(f"""
+                UPDATE problemas SET status = '{STATUS_PENDENTE}', trabalhador = NULL, reservado_em = NULL
+                WHERE status = '{STATUS_EM_DIAGNOSTICO}'
+                  AND reservado_em < SYSTIMESTAMP - NUMTODSINTERVAL(:segundos, 'SECOND')
+            """, segundos=segundos)
+            devolvidas = cur.rowcount
+            con.commit()
+            return devolvidas
+
+    def estatisticas_fila(self):
+        with emprestar_conexao(self.conn) as con, con.cursor() as cur:
+            cur.execute("SELECT status, COUNT(*) FROM problemas GROUP BY status")
+            quantidades = dict(cur.fetchall())
+            cur.execute(f"""
+                SELECT (CAST(SYSTIMESTAMP AS DATE) - CAST(MIN(criado_em) AS DATE)) * 86400
+                FROM problemas WHERE status = '{STATUS_PENDENTE}'
+            """)
+            idade = cur.fetchone()[0]
+            cur.execute(f"""
+                SELECT AVG((CAST(reservado_em AS DATE) - CAST(criado_em AS DATE)) * 86400),
+                       AVG((CAST(concluido_em AS DATE) - CAST(criado_em AS DATE)) * 86400),
+                       COUNT(*)
+                FROM problemas
+                WHERE status = '{STATUS_CONCLUIDO}' AND concluido_em >= SYSTIMESTAMP - INTERVAL '1' HOUR
+            """)
+            espera, latencia, concluidos_hora = cur.fetchone()
+        return _estatisticas_fila(quantidades, idade, espera, latencia, concluidos_hora)
+
+
+#Índices das migrações: os da busca (com os únicos no lugar dos comuns do chassi e da placa) e o da fila
+_SUBSTITUIDOS = {antigo for antigo, _ in INDICES_UNICOS_VEICULOS.values()}
+INDICES_SQLITE = (
+    *(ddl for ddl in INDICES_BUSCA if ddl.split()[2] not in _SUBSTITUIDOS),
+    INDICE_FILA,
+    *(f'CREATE UNIQUE INDEX {indice} ON veiculos ({expressao})'
+      for indice, (_, expressao) in INDICES_UNICOS_VEICULOS.items()),
+)
+
+#Mesmo esquema das tabelas do Oracle depois de todas as migrações (migracoes.py), com os mesmos índices
+ESQUEMA_SQLITE = """
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT, email TEXT NOT NULL UNIQUE, senha TEXT,
+        cep TEXT, uf TEXT, cidade TEXT, rua TEXT, bairro TEXT,
+        criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP, ultimo_acesso TEXT
+    );
+    CREATE TABLE IF NOT EXISTS veiculos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_usuario INTEGER NOT NULL REFERENCES usuarios (id) ON DELETE CASCADE,
+        chassi TEXT NOT NULL, marca TEXT, modelo TEXT, cor TEXT, placa TEXT
+    );
+    CREATE TABLE IF NOT EXISTS problemas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_veiculo INTEGER NOT NULL REFERENCES veiculos (id) ON DELETE CASCADE,
+        descricao TEXT,
+        status TEXT NOT NULL DEFAULT 'PENDENTE',
+        prioridade INTEGER NOT NULL DEFAULT 2,
+        criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        reservado_em TEXT, concluido_em TEXT, trabalhador TEXT,
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        diagnostico TEXT
+    );
+    CREATE TABLE IF NOT EXISTS auditoria (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ocorrido_em TEXT NOT NULL,
+        id_usuario INTEGER,
+        entidade TEXT NOT NULL, id_entidade INTEGER, acao TEXT NOT NULL, detalhes TEXT
+    );
+    CREATE TABLE IF NOT EXISTS lotes_gravados (
+        id TEXT PRIMARY KEY,
+        gravado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS ix_veiculos_usuario ON veiculos (id_usuario);
+    CREATE INDEX IF NOT EXISTS ix_problemas_veiculo ON problemas (id_veiculo);
+    CREATE INDEX IF NOT EXISTS ix_auditoria_usuario ON auditoria (id_usuario, ocorrido_em);
+""" + ''.join(ddl.replace('INDEX', 'INDEX IF NOT EXISTS', 1) + ';\n' for ddl in INDICES_SQLITE)
+
+
+class RepositorioSqlite(Repositorio):
+    #arquivo=':memory:' mantém tudo em memória, sem gravar nada em disco
+    def __init__(self, arquivo=':memory:'):
+        self.conn = sqlite3.connect(arquivo, check_same_thread=False)
+        self.conn.executescript(ESQUEMA_SQLITE)
+        #O SQLite só confere as chaves estrangeiras (e apaga em cascata) se isto for ligado em cada conexão
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        #Uma única conexão compartilhada entre threads, protegida por uma trava
+        self.trava = threading.RLock()
+
+    def email_cadastrado(self, email):
+        with self.trava:
+            cur = self.conn.execute(SQL_EMAIL_CADASTRADO, {'email': email})
+            return cur.fetchone() is not None
+
+    def inserir_usuario(self, dados):
+        with _conferir_duplicados(), self.trava, self.conn:
+            cur = self.conn.execute("""
+                INSERT INTO usuarios (nome, email, senha, cep, uf, cidade, rua, bairro)
+                VALUES (:nome, :email, :senha, :cep, :uf, :cidade, :rua, :bairro)
+            """, {campo: dados[campo] for campo in CAMPOS_USUARIO})
+            return cur.lastrowid
+
+    def buscar_credenciais(self, email):
+        with self.trava:
+            conta = self.conn.execute(SQL_CREDENCIAIS, {'email': email}).fetchone()
+            if conta:
+                return {'id': conta[0], 'nome': conta[1], 'email': conta[2], 'senha': conta[3]}
+            return None
+
+    def iterar_contas(self, ultimo_id=0, limite=50):
+        with self.trava:
+            linhas = self.conn.execute("""
+                SELECT u.id, u.nome, u.email, u.cep, u.uf, u.cidade, u.rua, u.bairro,
+                       v.marca, v.modelo, v.placa
+                FROM (
+                    SELECT id, nome, email, cep, uf, cidade, rua, bairro
+                    FROM usuarios
+                    WHERE id > :ultimo_id
+                    ORDER BY id
+                    LIMIT :limite
+                ) u
+                LEFT JOIN veiculos v ON v.id_usuario = u.id
+                ORDER BY u.id, v.id
+            """, {'ultimo_id': ultimo_id, 'limite': limite}).fetchall()
+        yield from _agrupar_contas(linhas)
+
+    def apagar_contas(self, ids):
+        comandos, parametros = _sql_apagar_contas(ids)
+        with self.trava, self.conn:
+            return {tabela: self.conn.execute(sql, parametros).rowcount for tabela, sql in comandos}
+
+    def ids_contas_inativas(self, desde, ultimo_id=0, limite=MAXIMO_IDS_POR_COMANDO):
+        with self.trava:
+            linhas = self.conn.execute("""
+                SELECT id FROM usuarios
+                WHERE id > :ultimo_id AND COALESCE(ultimo_acesso, criado_em) < :desde
+                ORDER BY id
+                LIMIT :limite
+            """, {'ultimo_id': ultimo_id, 'desde': str(desde), 'limite': limite}).fetchall()
+        return [linha[0] for linha in linhas]
+
+    def registrar_acesso(self, id_usuario):
+        with self.trava, self.conn:
+            self.conn.execute("UPDATE usuarios SET ultimo_acesso = CURRENT_TIMESTAMP WHERE id = :id",
+                              {'id': id_usuario})
+
+    def atualizar_usuario(self, id_usuario, campos):
+        sql = f"UPDATE usuarios SET {_sql_atualizacao(campos, CAMPOS_USUARIO)} WHERE id = :id"
+        with self.trava, self.conn:
+            self.conn.execute(sql, {**campos, 'id': id_usuario})
+
+    def inserir_veiculo(self, id_usuario, dados):
+        with _conferir_duplicados(), self.trava, self.conn:
+            cur = self.conn.execute("""
+                INSERT INTO veiculos (id_usuario, chassi, marca, modelo, cor, placa)
+                VALUES (:id_usuario, :chassi, :marca, :modelo, :cor, :placa)
+            """, {'id_usuario': id_usuario, 'chassi': dados['chassi'], 'marca': dados['marca'],
+                  'modelo': dados['modelo'], 'cor': dados['cor'], 'placa': dados['placa']})
+            return cur.lastrowid
+
+    def listar_veiculos(self, id_usuario):
+        with self.trava:
+            cur = self.conn.execute(SQL_VEICULOS_USUARIO, {'id_usuario': id_usuario})
+            return [_veiculo(linha) for linha in cur]
+
+    def painel_usuario(self, id_usuario):
+        with self.trava:
+            return self.conn.execute(SQL_PAINEL_USUARIO, {'id_usuario': id_usuario}).fetchall()
+
+    def obter_veiculo(self, id_veiculo, id_usuario):
+        with self.trava:
+            linha = self.conn.execute(SQL_OBTER_VEICULO, {'id': id_veiculo, 'id_usuario': id_usuario}).fetchone()
+            return _veiculo(linha) if linha else None
+
+    def atualizar_veiculo(self, id_veiculo, id_usuario, campos):
+        sql = (f"UPDATE veiculos SET {_sql_atualizacao(campos, CAMPOS_VEICULO)} "
+               f"WHERE id = :id AND id_usuario = :id_usuario")
+        with _conferir_duplicados(), self.trava, self.conn:
+            cur = self.conn.execute(sql, {**campos, 'id': id_veiculo, 'id_usuario': id_usuario})
+            return cur.rowcount > 0
+
+    def apagar_veiculo(self, id_veiculo, id_usuario):
+        with self.trava, self.conn:
+            cur = self.conn.execute("DELETE FROM veiculos WHERE id = :id AND id_usuario = :id_usuario",
+                                    {'id': id_veiculo, 'id_usuario': id_usuario})
+            return cur.rowcount > 0
+
+    def inserir_problema(self, id_usuario, id_veiculo, descricao, prioridade=PRIORIDADE_NORMAL):
+        with self.trava, self.conn:
+            cur = self.conn.execute(SQL_INSERIR_PROBLEMA, {'descricao': descricao, 'prioridade': prioridade,
+                                                           'id_veiculo': id_veiculo, 'id_usuario': id_usuario})
+            return cur.rowcount > 0
+
+    def problemas_usuario(self, id_usuario):
+        with self.trava:
+            cur = self.conn.execute(SQL_PROBLEMAS_USUARIO, {'id_usuario': id_usuario})
+            return [_problema_usuario(linha) for linha in cur]
+
+    def gravar_lote(self, id_lote, eventos):
+        problemas, auditoria = _separar_eventos(eventos)
+        with self.trava, self.conn:
+            if id_lote and self.conn.execute("""
+                INSERT INTO lotes_gravados (id)
+                SELECT :id WHERE NOT EXISTS (SELECT 1 FROM lotes_gravados WHERE id = :id)
+            """, {'id': id_lote}).rowcount == 0:
+                return False
+            if problemas:
+                cur = self.conn.executemany(SQL_INSERIR_PROBLEMA, problemas)
+                if cur.rowcount < len(problemas):
+                    raise ProblemaSemVeiculo(len(problemas) - cur.rowcount)
+            if auditoria:
+                self.conn.executemany(SQL_INSERIR_AUDITORIA, auditoria)
+        return True
+
+    def esquecer_lotes(self, dias):
+        with self.trava, self.conn:
+            self.conn.execute("DELETE FROM lotes_gravados WHERE gravado_em < datetime('now', '-' || :dias || ' days')",
+                              {'dias': dias})
+
+    def buscar_veiculos(self, placas=(), chassi=None, marca=None, modelo=None, ultimo_id=0, limite=20):
+        condicoes, parametros = _sql_busca_veiculos(placas, chassi, marca, modelo, ultimo_id)
+        with self.trava:
+            linhas = self.conn.execute(f"""
+                SELECT id, marca, modelo, cor, placa, chassi, id_usuario
+                FROM veiculos
+                WHERE {condicoes}
+                ORDER BY id
+                LIMIT :limite
+            """, {**parametros, 'limite': limite}).fetchall()
+        return [{**_veiculo(linha), 'id_usuario': linha[6]} for linha in linhas]
+
+    def valores_distintos(self, campo):
+        expressao = EXPRESSOES_BUSCA[campo]
+        with self.trava:
+            linhas = self.conn.execute(
+                f"SELECT DISTINCT {expressao} FROM veiculos WHERE {expressao} IS NOT NULL").fetchall()
+        return [linha[0] for linha in linhas]
+
+    #O esquema já é criado completo (ESQUEMA_SQLITE), sem migrações
+    def aplicar_migracoes(self, migracoes, apenas_listar=False):
+        return []
+
+    def plano_execucao(self, sql, parametros):
+        with self.trava:
+            linhas = self.conn.execute(f'EXPLAIN QUERY PLAN {sql}', parametros).fetchall()
+        #SEARCH vai direto às linhas por um índice; SCAN percorre a tabela (ou um índice) inteira
+        return [(detalhe, detalhe.startswith('SCAN ') and detalhe != 'SCAN CONSTANT ROW') for *_, detalhe in linhas]
+
+    def veiculos_por_cidade(self):
+        with self.trava:
+            return self.conn.execute(SQL_VEICULOS_POR_CIDADE).fetchall()
+
+    def problemas_por_modelo(self):
+        with self.trava:
+            return self.conn.execute(SQL_PROBLEMAS_POR_MODELO).fetchall()
+
+    def cadastros_por_periodo(self, periodo):
+        formato = PERIODOS_RELATORIO[periodo][1]
+        with self.trava:
+            return self.conn.execute(f"""
+                SELECT strftime('{formato}', criado_em), COUNT(*) FROM usuarios
+                GROUP BY 1
+                ORDER BY 1
+            """).fetchall()
+
+    def faixas_usuarios(self, partes):
+        with self.trava:
+            return self.conn.execute(SQL_FAIXAS_USUARIOS, {'partes': partes}).fetchall()
+
+    def fim_lote_usuarios(self, ultimo_id, fim, limite):
+        with self.trava:
+            return self.conn.execute("""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM usuarios
+                    WHERE id > :ultimo_id AND id <= :fim
+                    ORDER BY id
+                    LIMIT :limite
+                )
+            """, {'ultimo_id': ultimo_id, 'fim': fim, 'limite': limite}).fetchone()[0]
+
+    def enderecos_usuarios(self, primeiro, ultimo):
+        with self.trava:
+            cur = self.conn.execute(SQL_ENDERECOS_USUARIOS, {'primeiro': primeiro, 'ultimo': ultimo})
+            return [_endereco(linha) for linha in cur]
+
+    def atualizar_enderecos(self, enderecos):
+        with self.trava, self.conn:
+            self.conn.executemany(SQL_ATUALIZAR_ENDERECO, enderecos)
+
+    def veiculos_faixa_usuarios(self, primeiro, ultimo):
+        with self.trava:
+            return self.conn.execute(SQL_VEICULOS_FAIXA_USUARIOS, {'primeiro': primeiro, 'ultimo': ultimo}).fetchall()
+
+    def relatorios_faixa_usuarios(self, primeiro, ultimo):
+        formato = PERIODOS_RELATORIO['dia'][1]
+        parametros = {'primeiro': primeiro, 'ultimo': ultimo}
+        with self.trava:
+            return {
+                'cidades': self.conn.execute(SQL_VEICULOS_POR_CIDADE_FAIXA, parametros).fetchall(),
+                'modelos': self.conn.execute(SQL_PROBLEMAS_POR_MODELO_FAIXA, parametros).fetchall(),
+                'dias': self.conn.execute(f"""
+                    SELECT strftime('{formato}', criado_em), COUNT(*) FROM usuarios
+                    WHERE id BETWEEN :primeiro AND :ultimo
+                    GROUP BY 1
+                """, parametros).fetchall(),
+            }
+
+    def contar_veiculos(self):
+        with self.trava:
+            return self.conn.execute("SELECT COUNT(*) FROM veiculos").fetchone()[0]
+
+    def iterar_identificadores_veiculos(self):
+        with self.trava:
+            linhas = self.conn.execute(f"SELECT UPPER(chassi), {EXPRESSAO_PLACA} FROM veiculos").fetchall()
+        yield from linhas
+
+    def identificadores_existentes(self, chassis, placas):
+        encontrados = set(), set()
+        for sql, parametros in _consultas_identificadores_existentes(chassis, placas):
+            with self.trava:
+                linhas = self.conn.execute(sql, parametros).fetchall()
+            for conjunto, novos in zip(encontrados, _separar_identificadores(linhas)):
+                conjunto.update(novos)
+        return encontrados
+
+    def reservar_problemas(self, trabalhador, quantidade):
+        #O SQLite tem um único escritor por vez: o UPDATE já reserva as linhas de forma atômica
+        with self.trava, self.conn:
+            linhas = self.conn.execute(f"""
+                UPDATE problemas
+                SET status = '{STATUS_EM_DIAGNOSTICO}', trabalhador = :trabalhador,
+                    reservado_em = CURRENT_TIMESTAMP, tentativas = tentativas + 1
+                WHERE id IN (
+                    SELECT id FROM problemas WHERE status = '{STATUS_PENDENTE}'
+                    ORDER BY prioridade, id
+                    LIMIT :quantidade
+                )
+                RETURNING id, id_veiculo, descricao, prioridade, criado_em
+            """, {'trabalhador': trabalhador, 'quantidade': quantidade}).fetchall()
+        return [_problema(linha) for linha in sorted(linhas, key=lambda linha: (linha[3], linha[0]))]
+
+    def concluir_problemas(self, trabalhador, resultados):
+        with self.trava, self.conn:
+            cur = self.conn.executemany(f"""
+                UPDATE problemas
+                SET status = '{STATUS_CONCLUIDO}', diagnostico = :diagnostico, concluido_em = CURRENT_TIMESTAMP
+                WHERE id = :id AND trabalhador = :trabalhador AND status = '{STATUS_EM_DIAGNOSTICO}'
+            """, [{'id': id_problema, 'diagnostico': diagnostico, 'trabalhador': trabalhador}
+                  for id_problema, diagnostico in resultados])
+            return max(cur.rowcount, 0)
+
+    def devolver_problemas(self, trabalhador, ids):
+        with self.trava, self.conn:
+            self.conn.executemany(f"""
+                UPDATE problemas SET status = '{STATUS_PENDENTE}', trabalhador = NULL, reservado_em = NULL
+                WHERE id = :id AND trabalhador = :trabalhador AND status = '{STATUS_EM_DIAGNOSTICO}'
+            """, [{'id': id_problema, 'trabalhador': trabalhador} for id_problema in ids])
+
+    def devolver_reservas_expiradas(self, segundos):
+        with self.trava, self.conn:
+            cur = self.conn.execute(f"""
+                UPDATE problemas SET status = '{STATUS_PENDENTE}', trabalhador = NULL, reservado_em = NULL
+                WHERE status = '{STATUS_EM_DIAGNOSTICO}'
+                  AND reservado_em < datetime('now', '-' || :segundos || ' seconds')
+            """, {'segundos': segundos})
+            return cur.rowcount
+
+    def estatisticas_fila(self):
+        with self.trava:
+            quantidades = dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM problemas GROUP BY status").fetchall())
+            idade = self.conn.execute(f"""
+                SELECT (julianday('now') - julianday(MIN(criado_em))) * 86400
+                FROM problemas WHERE status = '{STATUS_PENDENTE}'
+            """).fetchone()[0]
+            espera, latencia, concluidos_hora = self.conn.execute(f"""
+                SELECT AVG((julianday(reservado_em) - julianday(criado_em)) * 86400),
+                       AVG((julianday(concluido_em) - julianday(criado_em)) * 86400),
+                       COUNT(*)
+                FROM problemas
+                WHERE status = '{STATUS_CONCLUIDO}' AND concluido_em >= datetime('now', '-1 hour')
+            """).fetchone()
+        return _estatisticas_fila(quantidades, idade, espera, latencia, concluidos_hora)
+
+    def close(self):
+        self.conn.close()
+
+
+#Retorna o repositório a ser usado: se já for um repositório, ele mesmo; senão, uma conexão/pool do Oracle
+def obter_repositorio(conn):
+    if isinstance(conn, Repositorio):
+        return conn
+    return RepositorioOracle(conn)
+
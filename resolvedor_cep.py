@@ -0,0 +1,138 @@
+#Resolução de CEPs em lote, para reenriquecer os endereços de muitos usuários de uma vez
+#As consultas rodam em paralelo (asyncio), com limite de concorrência e de requisições por segundo
+import argparse
+import asyncio
+import time
+
+from banco import conectar_banco
+from cache_cep import AUSENTE
+from cep import base_cep, cache_cep, cliente_viacep, extrair_dados, validar_cep
+from cliente_cep import ViaCepIndisponivel
+from repositorio import ERROS_BANCO, RepositorioSqlite, obter_repositorio
+
+
+#Marcador para consulta que falhou por um motivo passageiro (ViaCEP indisponível ou sem resposta), diferente de
+#None (CEP inválido ou não encontrado): vale tentar de novo mais tarde
+FALHA = object()
+
+
+#Limitador de taxa (token bucket) para não sobrecarregar a ViaCEP
+#A vaga é reservada sem nenhum await no meio, então não precisa de trava: o mesmo limitador pode ser usado em
+#várias chamadas de resolver_ceps (cada uma com o seu asyncio.run), dividindo o mesmo limite
+class LimitadorTaxa:
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self.proximo = time.monotonic()
+
+    async def aguardar(self):
+        if not self.intervalo:
+            return
+        agora = time.monotonic()
+        espera = self.proximo - agora
+        self.proximo = max(self.proximo, agora) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+#Consulta uma lista de CEPs e devolve (cep, dados) conforme cada resultado fica pronto
+#CEPs repetidos são consultados uma única vez. dados é None para CEP inválido ou não encontrado, e FALHA se a
+#ViaCEP não respondeu (não vai para o cache). limitador, opcional, troca o limite de por_segundo por um já em uso
+async def resolver_ceps(ceps, concorrencia=20, por_segundo=10, cliente=cliente_viacep, cache=cache_cep,
+                        base=base_cep, limitador=None):
+    fila = asyncio.Queue()
+    resultados = asyncio.Queue(maxsize=concorrencia * 2)
+    limitador = limitador or LimitadorTaxa(por_segundo)
+
+    vistos = set()
+    for cep in ceps:
+        if cep not in vistos:
+            vistos.add(cep)
+            fila.put_nowait(cep)
+
+    async def trabalhador():
+        while True:
+            try:
+                cep = fila.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if not cep:
+                await resultados.put((cep, None))
+                continue
+
+            #O cache lê e grava em um arquivo SQLite: em uma thread, para não travar as outras consultas
+            dados = await asyncio.to_thread(cache.obter, cep) if cache else AUSENTE
+            #A base offline responde sem rede nem limite de taxa
+            if dados is AUSENTE and base is not None:
+                resposta = base.consultar(cep)
+                if resposta is not None:
+                    dados = extrair_dados(resposta)
+            if dados is AUSENTE:
+                dados = None
+                if validar_cep(cep):
+                    await limitador.aguardar()
+                    try:
+                        #A consulta é bloqueante, então roda em uma thread separada
+                        resposta = await asyncio.to_thread(cliente.consultar, cep)
+                    except ViaCepIndisponivel:
+                        resposta = None
+                    if resposta is None:
+                        dados = FALHA
+                    else:
+                        dados = extrair_dados(resposta)
+                        if cache:
+                            await asyncio.to_thread(cache.guardar, cep, dados)
+            await resultados.put((cep, dados))
+
+    trabalhadores = [asyncio.create_task(trabalhador()) for _ in range(min(concorrencia, len(vistos)))]
+
+    try:
+        for _ in range(len(vistos)):
+            yield await resultados.get()
+    finally:
+        for tarefa in trabalhadores:
+            tarefa.cancel()
+
+
+#Como resolver_ceps, esperando todos os resultados: {cep: dados}. Para quem não usa asyncio
+def resolver_todos(ceps, **opcoes):
+    async def coletar():
+        return {cep: dados async for cep, dados in resolver_ceps(ceps, **opcoes)}
+
+    return asyncio.run(coletar())
+
+
+#Reconsulta o CEP de todas as contas com servicos.reenriquecer_enderecos, de uma vez (em bases grandes,
+#python tarefas.py enderecos divide o trabalho entre processos e pode continuar de onde parou)
+def main():
+    #servicos usa este módulo (resolver_todos): importado só aqui, para não ter importação circular
+    import servicos
+
+    parser = argparse.ArgumentParser(description='Consulta de novo o CEP de todas as contas e atualiza os endereços.')
+    parser.add_argument('--por-segundo', type=float, default=10, help='Consultas por segundo à ViaCEP (0: sem limite)')
+    parser.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite em vez do Oracle')
+    args = parser.parse_args()
+
+    conn = RepositorioSqlite(args.sqlite) if args.sqlite else conectar_banco()
+    if not conn:
+        print("Não foi possível conectar ao banco de dados. O programa será encerrado.")
+        return
+    try:
+        faixas = obter_repositorio(conn).faixas_usuarios(1)
+        if not faixas:
+            print('Nenhuma conta cadastrada.')
+            return
+        primeiro, ultimo = faixas[0]
+        resumo = servicos.reenriquecer_enderecos(conn, primeiro, ultimo, LimitadorTaxa(args.por_segundo))
+    except ERROS_BANCO as e:
+        print(f'Erro ao atualizar os endereços: {e}')
+        return
+    finally:
+        conn.close()
+    print(f"{resumo['conferidas']} contas conferidas, {resumo['atualizadas']} endereços atualizados, "
+          f"{resumo['sem_endereco']} CEPs inválidos ou inexistentes.")
+    if resumo['falhas']:
+        print(f"A ViaCEP não respondeu o CEP de {resumo['falhas']} contas; rode de novo mais tarde para conferi-las.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#Senhas e sessões: hash das senhas com scrypt (custo ajustável) e cache de sessões autenticadas
+#Uma sessão ativa é verificada só em memória, em tempo constante, sem consultar o banco nem recalcular o scrypt
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+#Custo do scrypt: N (potência de 2), r e p. Quanto maior o N, mais lento (e mais seguro) é cada login
+SCRYPT_N = int(os.environ.get('LINKCAR_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+TAMANHO_SAL = 16
+TAMANHO_HASH = 32
+PREFIXO_HASH = 'scrypt'
+
+#Tempo de vida de uma sessão, em segundos
+DURACAO_SESSAO = int(os.environ.get('LINKCAR_DURACAO_SESSAO', 8 * 60 * 60))
+
+
+def _b64(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b'=').decode('ascii')
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(senha.encode('utf-8'), salt=sal, n=n, r=r, p=p, dklen=TAMANHO_HASH,
+                          maxmem=256 * n * r * p)
+
+
+#Gera o hash da senha no formato scrypt$N$r$p$sal$hash, guardado na coluna senha
+def gerar_hash_senha(senha, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    sal = secrets.token_bytes(TAMANHO_SAL)
+    return f'{PREFIXO_HASH}${n}${r}${p}${_b64(sal)}${_b64(_scrypt(senha, sal, n, r, p))}'
+
+
+def eh_hash(valor):
+    return bool(valor) and valor.startswith(PREFIXO_HASH + '$')
+
+
+#Confere a senha com o valor guardado. Contas antigas, com a senha em texto puro, também são aceitas
+def verificar_senha(senha, guardado):
+    if not guardado:
+        return False
+    if not eh_hash(guardado):
+        return hmac.compare_digest(senha.encode('utf-8'), guardado.encode('utf-8'))
+    try:
+        _, n, r, p, sal, esperado = guardado.split('$')
+        calculado = _scrypt(senha, _de_b64(sal), int(n), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(calculado, _de_b64(esperado))
+
+
+#Indica se o valor guardado deve ser regravado (texto puro, ou hash com custo diferente do atual)
+def precisa_novo_hash(guardado):
+    if not eh_hash(guardado):
+        return True
+    partes = guardado.split('$')
+    return partes[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+class CacheSessoes:
+    def __init__(self, duracao=DURACAO_SESSAO, segredo=None):
+        self.duracao = duracao
+        #Sem um segredo configurado, as sessões valem apenas enquanto o processo estiver rodando
+        segredo = segredo or os.environ.get('LINKCAR_SEGREDO_SESSAO')
+        self.segredo = segredo.encode('utf-8') if segredo else secrets.token_bytes(32)
+        self.trava = threading.Lock()
+        self.sessoes = {} #id da sessão -> (expira_em, usuario)
+        self.criadas = 0
+
+    def _assinar(self, texto):
+        return _b64(hmac.new(self.segredo, texto.encode('utf-8'), hashlib.sha256).digest())
+
+    #Cria uma sessão para o usuário e retorna o token assinado (id.expira_em.assinatura)
+    def criar(self, usuario):
+        expira_em = int(time.time()) + self.duracao
+        id_sessao = secrets.token_urlsafe(16)
+        conteudo = f'{id_sessao}.{expira_em}'
+        with self.trava:
+            self.sessoes[id_sessao] = (expira_em, dict(usuario))
+            self.criadas += 1
+            limpar = self.criadas % 1000 == 0
+        #De tempos em tempos, remove as sessões expiradas para o cache não crescer sem limite
+        if limpar:
+            self.limpar_expiradas()
+        return f'{conteudo}.{self._assinar(conteudo)}'
+
+    #Retorna o usuário da sessão, ou None se o token for inválido, expirado ou encerrado
+    def validar(self, token):
+        try:
+            id_sessao, expira_em, assinatura = token.split('.')
+            expira_em = int(expira_em)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(assinatura, self._assinar(f'{id_sessao}.{expira_em}')):
+            return None
+        if expira_em <= time.time():
+            self.encerrar(token)
+            return None
+        with self.trava:
+            sessao = self.sessoes.get(id_sessao)
+        return dict(sessao[1]) if sessao else None
+
+    def encerrar(self, token):
+        with self.trava:
+            self.sessoes.pop(str(token).split('.')[0], None)
+
+    #Atualiza os dados (nome, email) guardados nas sessões do usuário
+    def atualizar_usuario(self, id_usuario, campos):
+        with self.trava:
+            for _, usuario in self.sessoes.values():
+                if usuario['id'] == id_usuario:
+                    usuario.update(campos)
+
+    #Encerra todas as sessões de um usuário (ex. conta apagada)
+    def encerrar_usuario(self, id_usuario):
+        with self.trava:
+            for id_sessao in [chave for chave, (_, usuario) in self.sessoes.items() if usuario['id'] == id_usuario]:
+                del self.sessoes[id_sessao]
+
+    #Remove as sessões expiradas
+    def limpar_expiradas(self):
+        agora = time.time()
+        with self.trava:
+            for id_sessao in [chave for chave, (expira_em, _) in self.sessoes.items() if expira_em <= agora]:
+                del self.sessoes[id_sessao]
+
+
+sessoes = CacheSessoes()
+
+
+#Mede quanto tempo leva cada hash para alguns custos de N, para escolher o equilíbrio entre segurança e logins/s
+def medir_custos(expoentes, repeticoes=5):
+    resultados = []
+    for expoente in expoentes:
+        n = 2 ** expoente
+        guardado = gerar_hash_senha('senha de teste', n=n)
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            verificar_senha('senha de teste', guardado)
+        tempo = (time.perf_counter() - inicio) / repeticoes
+        resultados.append({'n': n, 'ms_por_login': round(tempo * 1000, 2),
+                           'logins_por_segundo_por_nucleo': round(1 / tempo, 1),
+                           'memoria_mb': round(128 * n * SCRYPT_R / 1024 / 1024, 1)})
+    return resultados
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mede o custo do hash de senha (scrypt) para cada valor de N.')
+    parser.add_argument('--expoentes', type=int, nargs='+', default=[12, 13, 14, 15, 16],
+                        help='Expoentes de N (N = 2^expoente)')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+    for resultado in medir_custos(args.expoentes, args.repeticoes):
+        print(f"N={resultado['n']:>7}  {resultado['ms_por_login']:>8.2f} ms/login  "
+              f"{resultado['logins_por_segundo_por_nucleo']:>8.1f} logins/s por núcleo  "
+              f"{resultado['memoria_mb']:>6.1f} MB")
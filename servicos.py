@@ -0,0 +1,440 @@
+#Regras de negócio do Link Car, sem entrada/saída de terminal
+#Usadas tanto pelo menu (LinkCar2.py) quanto pela API HTTP (api.py)
+#conn pode ser uma conexão ou um pool do Oracle, ou qualquer repositório (ex. RepositorioSqlite)
+import difflib
+import itertools
+import time
+
+import gravacao
+from cep import validar_cep, buscar_endereco
+from painel import Veiculo, cache_painel
+from relatorios import cache_relatorios
+from repositorio import (MAXIMO_IDS_POR_COMANDO, PRIORIDADE_ALTA, PRIORIDADE_BAIXA, PRIORIDADE_NORMAL,
+                         RegistroDuplicado, obter_repositorio)
+from resolvedor_cep import FALHA, resolver_todos
+from seguranca import gerar_hash_senha, precisa_novo_hash, sessoes, verificar_senha
+from validacao import analisar_chassi, analisar_placa, identificadores_veiculos, normalizar_placa, variantes_placa
+
+
+#Erro de regra de negócio (dado inválido, registro duplicado...), com uma mensagem para o usuário
+class ErroServico(Exception):
+    pass
+
+
+#Busca aproximada de marca/modelo: a lista de valores distintos fica em memória por TTL_VALORES_BUSCA segundos
+TTL_VALORES_BUSCA = 300
+MAXIMO_VALORES_BUSCA = 50
+_valores_busca = {} #campo -> (expira_em, valores)
+
+#Mensagem de cada índice único, quando ele recusa um cadastro que passou pela validação
+MENSAGENS_DUPLICADO = {'ux_veiculos_chassi': 'Já existe um veículo cadastrado com este chassi!',
+                       'ux_veiculos_placa_norm': 'Já existe um veículo cadastrado com esta placa!',
+                       'uq_usuarios_email': 'Já existe um usuário com este email cadastrado!'}
+
+
+#Grava eventos (problemas e auditoria): pela gravação adiada, se ela estiver ligada, senão na hora, em um lote
+def _gravar(conn, eventos):
+    try:
+        adiados = [gravacao.enfileirar(evento) for evento in eventos]
+    except gravacao.FilaCheia as e:
+        raise ErroServico(str(e))
+    if not all(adiados):
+        obter_repositorio(conn).gravar_lote(None, eventos)
+
+
+#Registra alterações de contas e veículos na trilha de auditoria (tabela auditoria)
+def _auditar(conn, id_usuario, entidade, id_entidade, acao, detalhes=None):
+    _gravar(conn, [gravacao.evento_auditoria(id_usuario, entidade, id_entidade, acao, detalhes)])
+
+
+#Verificar se já existe uma conta com o email
+def email_cadastrado(conn, email):
+    return obter_repositorio(conn).email_cadastrado(email)
+
+
+#Criar uma conta, preenchendo o endereço a partir do CEP. Retorna o ID da conta criada
+def criar_conta(conn, nome, email, senha, cep):
+    repositorio = obter_repositorio(conn)
+    cep = cep.replace('.', '').replace('-', '')
+    if not validar_cep(cep):
+        raise ErroServico('CEP inválido!')
+    if repositorio.email_cadastrado(email):
+        raise ErroServico('Já existe um usuário com este email cadastrado!')
+
+    dados = buscar_endereco(cep)
+    if not dados:
+        raise ErroServico('Erro ao obter dados do CEP.')
+    dados['nome'] = nome
+    dados['email'] = email
+    dados['senha'] = gerar_hash_senha(senha)
+    #Outro cadastro com o mesmo email pode ter entrado depois da conferência acima
+    try:
+        id_usuario = repositorio.inserir_usuario(dados)
+    except RegistroDuplicado as e:
+        raise ErroServico(MENSAGENS_DUPLICADO[e.indice])
+    cache_relatorios.invalidar('usuarios')
+    _auditar(conn, id_usuario, 'conta', id_usuario, 'criar', {'email': email, 'cep': cep})
+    return id_usuario
+
+
+#Retorna os dados da conta e um token de sessão se o email e a senha estiverem corretos, senão None
+#Email e senha são sempre conferidos no banco (a senha pode ter mudado ou a conta ter sido apagada por outro
+#processo); o que fica só em memória é a sessão: enquanto ela vale, o token é conferido sem ir ao banco
+def autenticar(conn, email, senha):
+    repositorio = obter_repositorio(conn)
+    conta = repositorio.buscar_credenciais(email)
+    if not conta or not verificar_senha(senha, conta['senha']):
+        return None
+    #Senhas antigas em texto puro (ou com outro custo) são regravadas com o hash atual
+    if precisa_novo_hash(conta['senha']):
+        repositorio.atualizar_usuario(conta['id'], {'senha': gerar_hash_senha(senha)})
+    repositorio.registrar_acesso(conta['id'])
+    usuario = {'id': conta['id'], 'nome': conta['nome'], 'email': conta['email']}
+    usuario['token'] = sessoes.criar(usuario)
+    return usuario
+
+
+#Retorna o usuário da sessão, ou None se o token for inválido ou tiver expirado
+def validar_sessao(token):
+    return sessoes.validar(token)
+
+
+def encerrar_sessao(token):
+    sessoes.encerrar(token)
+
+
+#Percorre as contas com ID maior que ultimo_id (no máximo limite contas), já com os seus veículos
+#Cada conta é entregue assim que as suas linhas chegam do banco, sem esperar pela página inteira
+def iterar_contas(conn, ultimo_id=0, limite=50):
+    return obter_repositorio(conn).iterar_contas(ultimo_id, limite)
+
+
+#Apagar uma conta, os veículos e os problemas dela. Retorna False se a conta não existir
+def apagar_conta(conn, id_conta):
+    if obter_repositorio(conn).apagar_conta(id_conta):
+        sessoes.encerrar_usuario(id_conta)
+        cache_painel.invalidar(id_conta)
+        cache_relatorios.invalidar('usuarios', 'veiculos', 'problemas')
+        _auditar(conn, id_conta, 'conta', id_conta, 'apagar')
+        return True
+    return False
+
+
+#Lotes de IDs a apagar: os informados, ou os das contas inativas, buscados aos poucos (paginação por ID)
+def _lotes_contas(repositorio, ids, inativas_desde, tamanho_lote):
+    if ids is not None:
+        ids = iter(ids)
+        while lote := list(itertools.islice(ids, tamanho_lote)):
+            yield lote
+        return
+    ultimo_id = 0
+    while lote := repositorio.ids_contas_inativas(inativas_desde, ultimo_id, tamanho_lote):
+        yield lote
+        ultimo_id = lote[-1]
+
+
+#Apagar muitas contas (com veículos e problemas) de uma vez, pelos IDs ou pela data do último acesso
+#Cada lote de até tamanho_lote contas é apagado em uma transação, com um comando por tabela
+#A cada lote, devolve os totais apagados até ali: {'lotes', 'usuarios', 'veiculos', 'problemas'}
+def expurgar_contas(conn, ids=None, inativas_desde=None, tamanho_lote=500):
+    if (ids is None) == (inativas_desde is None):
+        raise ErroServico('Informe os IDs das contas ou a data de inatividade (apenas um dos dois).')
+    repositorio = obter_repositorio(conn)
+    totais = {'lotes': 0, 'usuarios': 0, 'veiculos': 0, 'problemas': 0}
+    for lote in _lotes_contas(repositorio, ids, inativas_desde, min(tamanho_lote, MAXIMO_IDS_POR_COMANDO)):
+        apagadas = repositorio.apagar_contas(lote)
+        for id_usuario in lote:
+            sessoes.encerrar_usuario(id_usuario)
+            cache_painel.invalidar(id_usuario)
+        cache_relatorios.invalidar('usuarios', 'veiculos', 'problemas')
+        #IDs que não existiam também são registrados: a auditoria guarda o que foi pedido no expurgo
+        _gravar(conn, [gravacao.evento_auditoria(id_usuario, 'conta', id_usuario, 'apagar', {'expurgo': True})
+                       for id_usuario in lote])
+        totais['lotes'] += 1
+        for tabela, quantidade in apagadas.items():
+            totais[tabela] += quantidade
+        yield dict(totais)
+
+
+def alterar_nome(conn, id_usuario, nome):
+    obter_repositorio(conn).atualizar_usuario(id_usuario, {'nome': nome})
+    sessoes.atualizar_usuario(id_usuario, {'nome': nome})
+    _auditar(conn, id_usuario, 'conta', id_usuario, 'alterar', {'nome': nome})
+
+
+def alterar_email(conn, id_usuario, email):
+    repositorio = obter_repositorio(conn)
+    conta = repositorio.buscar_credenciais(email)
+    if conta and conta['id'] != id_usuario:
+        raise ErroServico('Email já cadastrado!')
+    repositorio.atualizar_usuario(id_usuario, {'email': email})
+    sessoes.atualizar_usuario(id_usuario, {'email': email})
+    _auditar(conn, id_usuario, 'conta', id_usuario, 'alterar', {'email': email})
+
+
+#Alterar o endereço a partir de um novo CEP. Retorna os dados do endereço gravado
+def alterar_endereco(conn, id_usuario, cep):
+    cep = cep.replace('.', '').replace('-', '')
+    if not validar_cep(cep):
+        raise ErroServico('CEP inválido!')
+    dados = buscar_endereco(cep)
+    if not dados:
+        raise ErroServico('Erro ao obter dados do CEP.')
+
+    obter_repositorio(conn).atualizar_usuario(id_usuario, dados)
+    cache_relatorios.invalidar('usuarios')
+    _auditar(conn, id_usuario, 'conta', id_usuario, 'alterar', {'cep': cep})
+    return dados
+
+
+#Consulta de novo o CEP (cache, base offline ou ViaCEP) das contas com ID entre primeiro e ultimo e grava, com um
+#único commit, os endereços que mudaram. Retorna {'conferidas', 'atualizadas', 'sem_endereco', 'falhas'}:
+#sem_endereco conta os CEPs inválidos ou que a ViaCEP diz não existir, e falhas as contas cujo CEP ficou sem
+#resposta (ViaCEP indisponível), que não são alteradas e podem ser conferidas de novo mais tarde
+#Os CEPs são consultados em paralelo (resolvedor_cep.py), dentro do limite de limitador (LimitadorTaxa), se informado
+def reenriquecer_enderecos(conn, primeiro, ultimo, limitador=None):
+    repositorio = obter_repositorio(conn)
+    contas = repositorio.enderecos_usuarios(primeiro, ultimo)
+    ceps = {conta['id']: (conta['cep'] or '').replace('.', '').replace('-', '') for conta in contas}
+    enderecos = resolver_todos([cep for cep in ceps.values() if validar_cep(cep)], limitador=limitador)
+    alterados = []
+    sem_endereco = falhas = 0
+    for conta in contas:
+        dados = enderecos.get(ceps[conta['id']])
+        if dados is FALHA:
+            falhas += 1
+            continue
+        if not dados:
+            sem_endereco += 1
+            continue
+        novo = {'id': conta['id'], 'uf': dados['uf'], 'cidade': dados['cidade'], 'rua': dados['rua'],
+                'bairro': dados['bairro']}
+        if any(conta[campo] != novo[campo] for campo in ('uf', 'cidade', 'rua', 'bairro')):
+            alterados.append(novo)
+    if alterados:
+        repositorio.atualizar_enderecos(alterados)
+        cache_relatorios.invalidar('usuarios')
+        _gravar(conn, [gravacao.evento_auditoria(endereco['id'], 'conta', endereco['id'], 'alterar',
+                                                 {'reenriquecimento': True})
+                       for endereco in alterados])
+    return {'conferidas': len(contas) - falhas, 'atualizadas': len(alterados), 'sem_endereco': sem_endereco,
+            'falhas': falhas}
+
+
+#Depois de cada lote gravado pela importação (importacao.py): atualiza os relatórios e registra as contas na
+#auditoria, como criar_conta. contas: lista de {'id', 'email', 'cep'}
+def contas_importadas(conn, contas):
+    cache_relatorios.invalidar('usuarios')
+    _gravar(conn, [gravacao.evento_auditoria(conta['id'], 'conta', conta['id'], 'criar',
+                                             {'email': conta['email'], 'cep': conta['cep'], 'importacao': True})
+                   for conta in contas])
+
+
+#Como contas_importadas, para os veículos: lista de {'id', 'id_usuario', 'chassi', 'placa'}
+def veiculos_importados(conn, veiculos):
+    for id_usuario in {veiculo['id_usuario'] for veiculo in veiculos}:
+        cache_painel.invalidar(id_usuario)
+    cache_relatorios.invalidar('veiculos')
+    _gravar(conn, [gravacao.evento_auditoria(veiculo['id_usuario'], 'veiculo', veiculo['id'], 'criar',
+                                             {'chassi': veiculo['chassi'], 'placa': veiculo['placa'],
+                                              'importacao': True})
+                   for veiculo in veiculos])
+
+
+#Registrar um veículo para o usuário. Retorna o ID do veículo criado
+def registrar_veiculo(conn, id_usuario, chassi, marca, modelo, cor, placa):
+    resultado = validar_veiculos(conn, [{'chassi': chassi, 'placa': placa}])[0]
+    if not resultado['valido']:
+        raise ErroServico(resultado['erros'][0])
+    chassi, placa = resultado['chassi'], resultado['placa']
+
+    try:
+        id_veiculo = obter_repositorio(conn).inserir_veiculo(id_usuario, {
+            'chassi': chassi, 'marca': marca, 'modelo': modelo, 'cor': cor, 'placa': placa})
+    except RegistroDuplicado as e:
+        raise ErroServico(MENSAGENS_DUPLICADO[e.indice])
+    identificadores_veiculos.adicionar(chassi, [placa])
+    cache_painel.adicionar_veiculo(id_usuario, Veiculo(id_veiculo, marca, modelo, cor, placa, chassi, 0))
+    cache_relatorios.invalidar('veiculos')
+    _auditar(conn, id_usuario, 'veiculo', id_veiculo, 'criar', {'chassi': chassi, 'placa': placa})
+    return id_veiculo
+
+
+#Valida uma lista de veículos ({'chassi', 'placa'}) de uma vez, ex. antes de uma importação
+#Confere o formato do chassi e da placa e recusa os que já estão cadastrados ou repetidos na própria lista
+#Os duplicados são encontrados pelo filtro em memória, e só os suspeitos são conferidos no banco
+#Retorna, na mesma ordem: {'chassi', 'placa' (normalizados), 'valido', 'erros', 'fabricante'}
+def validar_veiculos(conn, veiculos):
+    resultados = []
+    for veiculo in veiculos:
+        chassi = analisar_chassi(veiculo.get('chassi') or '')
+        placa = analisar_placa(veiculo.get('placa') or '')
+        resultados.append({'chassi': chassi['chassi'], 'placa': placa['placa'], 'valido': True,
+                           'erros': chassi['erros'] + placa['erros'], 'fabricante': chassi['fabricante']})
+
+    validos = [resultado for resultado in resultados if not resultado['erros']]
+    chassis_existentes, placas_existentes = identificadores_veiculos.existentes(
+        obter_repositorio(conn), [resultado['chassi'] for resultado in validos],
+        [variante for resultado in validos for variante in variantes_placa(resultado['placa'])])
+
+    chassis_vistos, placas_vistas = set(), set()
+    for resultado in validos:
+        variantes = variantes_placa(resultado['placa'])
+        if resultado['chassi'] in chassis_existentes:
+            resultado['erros'].append('Já existe um veículo cadastrado com este chassi!')
+        elif resultado['chassi'] in chassis_vistos:
+            resultado['erros'].append('Chassi repetido na lista.')
+        if placas_existentes.intersection(variantes):
+            resultado['erros'].append('Já existe um veículo cadastrado com esta placa!')
+        elif placas_vistas.intersection(variantes):
+            resultado['erros'].append('Placa repetida na lista.')
+        chassis_vistos.add(resultado['chassi'])
+        placas_vistas.update(variantes)
+
+    for resultado in resultados:
+        resultado['valido'] = not resultado['erros']
+    return resultados
+
+
+#Veículos do usuário (com os problemas em aberto de cada um), servidos do cache do painel quando possível
+def painel_usuario(conn, id_usuario):
+    veiculos = cache_painel.obter(id_usuario)
+    if veiculos is None:
+        linhas = obter_repositorio(conn).painel_usuario(id_usuario)
+        veiculos = cache_painel.guardar(id_usuario, (Veiculo(*linha) for linha in linhas))
+    return veiculos
+
+
+def listar_veiculos(conn, id_usuario):
+    return [veiculo._asdict() for veiculo in painel_usuario(conn, id_usuario)]
+
+
+#Retorna o veículo se ele existir e pertencer ao usuário, senão None
+def obter_veiculo(conn, id_veiculo, id_usuario):
+    for veiculo in painel_usuario(conn, id_usuario):
+        if veiculo.id == id_veiculo:
+            return veiculo._asdict()
+    return None
+
+
+#Alterar marca, modelo, cor e placa. Retorna False se o veículo não existir ou não for do usuário
+def alterar_veiculo(conn, id_veiculo, id_usuario, marca, modelo, cor, placa):
+    analise = analisar_placa(placa)
+    if not analise['valido']:
+        raise ErroServico(analise['erros'][0])
+    placa = analise['placa']
+    atual = obter_veiculo(conn, id_veiculo, id_usuario)
+    if not atual:
+        return False
+    #Trocar a placa por uma que já pertence a outro veículo não é permitido
+    if normalizar_placa(atual['placa'] or '') != placa:
+        repositorio = obter_repositorio(conn)
+        _, placas_existentes = identificadores_veiculos.existentes(repositorio, [], variantes_placa(placa))
+        if placas_existentes:
+            raise ErroServico('Já existe um veículo cadastrado com esta placa!')
+
+    campos = {'marca': marca, 'modelo': modelo, 'cor': cor, 'placa': placa}
+    try:
+        if not obter_repositorio(conn).atualizar_veiculo(id_veiculo, id_usuario, campos):
+            return False
+    except RegistroDuplicado as e:
+        raise ErroServico(MENSAGENS_DUPLICADO[e.indice])
+    identificadores_veiculos.adicionar(atual['chassi'], [placa])
+    cache_painel.atualizar_veiculo(id_usuario, id_veiculo, campos)
+    cache_relatorios.invalidar('veiculos')
+    _auditar(conn, id_usuario, 'veiculo', id_veiculo, 'alterar', campos)
+    return True
+
+
+#Apagar um veículo. Retorna False se o veículo não existir ou não for do usuário
+def apagar_veiculo(conn, id_veiculo, id_usuario):
+    if not obter_repositorio(conn).apagar_veiculo(id_veiculo, id_usuario):
+        return False
+    cache_painel.remover_veiculo(id_usuario, id_veiculo)
+    cache_relatorios.invalidar('veiculos', 'problemas')
+    _auditar(conn, id_usuario, 'veiculo', id_veiculo, 'apagar')
+    return True
+
+
+#Registrar um problema em um veículo do usuário. Ele entra na fila de diagnóstico com a prioridade informada
+#Com a gravação adiada ligada, o dono do veículo é conferido pelo painel (em memória) e o problema vai para o
+#banco no próximo lote
+def registrar_problema(conn, id_usuario, id_veiculo, descricao, prioridade=PRIORIDADE_NORMAL):
+    if prioridade not in (PRIORIDADE_ALTA, PRIORIDADE_NORMAL, PRIORIDADE_BAIXA):
+        raise ErroServico('Prioridade inválida! Use 1 (alta), 2 (normal) ou 3 (baixa).')
+    if gravacao.gravacao_adiada is not None:
+        if not obter_veiculo(conn, id_veiculo, id_usuario):
+            raise ErroServico('Veículo não encontrado ou não pertence a este usuário.')
+        _gravar(conn, [gravacao.evento_problema(id_usuario, id_veiculo, descricao, prioridade)])
+    elif not obter_repositorio(conn).inserir_problema(id_usuario, id_veiculo, descricao, prioridade):
+        raise ErroServico('Veículo não encontrado ou não pertence a este usuário.')
+    cache_painel.somar_problema(id_usuario, id_veiculo)
+    cache_relatorios.invalidar('problemas')
+
+
+#Problemas registrados nos veículos do usuário, com o status na fila e o diagnóstico
+#Com a gravação adiada ligada, os problemas ainda não gravados no banco não aparecem
+def listar_problemas(conn, id_usuario):
+    return obter_repositorio(conn).problemas_usuario(id_usuario)
+
+
+#Fila de diagnóstico: cada trabalhador reserva um lote de problemas, diagnostica e conclui o lote de uma vez
+def reservar_problemas(conn, trabalhador, quantidade):
+    return obter_repositorio(conn).reservar_problemas(trabalhador, quantidade)
+
+
+#resultados: lista de (id_problema, diagnostico). Retorna quantos problemas foram concluídos
+def concluir_problemas(conn, trabalhador, resultados):
+    concluidos = obter_repositorio(conn).concluir_problemas(trabalhador, resultados)
+    cache_relatorios.invalidar('problemas')
+    return concluidos
+
+
+def devolver_problemas(conn, trabalhador, ids):
+    obter_repositorio(conn).devolver_problemas(trabalhador, ids)
+
+
+def devolver_reservas_expiradas(conn, segundos):
+    return obter_repositorio(conn).devolver_reservas_expiradas(segundos)
+
+
+#Tamanho da fila por status, idade do pendente mais antigo e tempos médios de espera/diagnóstico
+def estatisticas_fila(conn):
+    return obter_repositorio(conn).estatisticas_fila()
+
+
+#Valores de marca ou modelo parecidos com o termo: os que começam com ele e os mais próximos (erros de digitação)
+def _valores_aproximados(repositorio, campo, termo):
+    agora = time.monotonic()
+    item = _valores_busca.get(campo)
+    if not item or item[0] <= agora:
+        item = (agora + TTL_VALORES_BUSCA, repositorio.valores_distintos(campo))
+        _valores_busca[campo] = item
+    valores = item[1]
+    encontrados = [valor for valor in valores if valor.startswith(termo)][:MAXIMO_VALORES_BUSCA]
+    for valor in difflib.get_close_matches(termo, valores, n=10, cutoff=0.7):
+        if valor not in encontrados:
+            encontrados.append(valor)
+    return encontrados
+
+
+#Buscar veículos de todos os usuários pela placa (qualquer formato), chassi, marca e/ou modelo
+#Marca e modelo são buscados pelo começo do nome; com aproximado=True, também por nomes parecidos
+#Retorna até limite veículos com ID maior que ultimo_id, em ordem de ID
+def buscar_veiculos(conn, placa=None, chassi=None, marca=None, modelo=None, aproximado=False,
+                    ultimo_id=0, limite=20):
+    repositorio = obter_repositorio(conn)
+    filtros = {}
+    if placa and placa.strip():
+        filtros['placas'] = variantes_placa(placa)
+    if chassi and chassi.strip():
+        filtros['chassi'] = chassi.strip().upper()
+    for campo, valor in (('marca', marca), ('modelo', modelo)):
+        if valor and valor.strip():
+            valor = valor.strip().upper()
+            filtros[campo] = _valores_aproximados(repositorio, campo, valor) if aproximado else valor
+            if not filtros[campo]:
+                return []
+    if not filtros:
+        raise ErroServico('Informe a placa, o chassi, a marca ou o modelo para buscar.')
+    return repositorio.buscar_veiculos(ultimo_id=ultimo_id, limite=limite, **filtros)
@@ -0,0 +1,331 @@
+#Tarefas em lote (ex. noturnas) divididas entre vários processos, para usar todos os núcleos da máquina
+#As contas são divididas em faixas de ID (partições) com a mesma quantidade de contas. Cada processo trabalhador
+#tem a sua conexão (um pool de uma conexão, refeita se cair) e processa uma partição por vez, em lotes de contas
+#consecutivas, com um commit por lote; no final, os resultados das partições são juntados
+#Cada lote concluído é anotado no arquivo de progresso da partição: uma execução interrompida (Ctrl+C, queda,
+#erro no banco, ViaCEP fora do ar) continua do ponto em que parou ao rodar o mesmo comando de novo
+#  enderecos: consulta de novo o CEP das contas e atualiza os endereços que mudaram. O limite de consultas por
+#  segundo à ViaCEP é dividido entre os processos
+#  duplicados: encontra veículos com o mesmo chassi ou a mesma placa (ABC1234 e ABC1C34 são a mesma placa)
+#  relatorios: os relatórios da frota (relatorios.py), com as contagens (GROUP BY) feitas por faixa de contas
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import relatorios
+import servicos
+from banco import conectar_banco, criar_pool
+from repositorio import ERROS_BANCO, RepositorioSqlite, obter_repositorio
+from resolvedor_cep import LimitadorTaxa
+from validacao import normalizar_chassi, variantes_placa
+
+TAMANHO_LOTE = 500
+#Consultas por segundo à ViaCEP, somando todos os processos
+CONSULTAS_POR_SEGUNDO = 10
+#Mais partições que processos equilibram a carga quando algumas faixas demoram mais que outras
+PARTICOES_POR_PROCESSO = 4
+DIRETORIO_PROGRESSO = 'tarefas_progresso'
+#Quantos grupos de duplicados são mostrados na tela (o arquivo de --saida tem todos)
+EXEMPLOS_DUPLICADOS = 10
+
+
+#Se a ViaCEP não respondeu algum CEP, o lote não é dado como concluído: os endereços já conferidos ficam gravados,
+#e o lote inteiro é conferido de novo na próxima execução
+def _processar_enderecos(conn, primeiro, ultimo):
+    resultado = servicos.reenriquecer_enderecos(conn, primeiro, ultimo, _limitador)
+    if resultado['falhas']:
+        raise servicos.ErroServico(f"A ViaCEP não respondeu o CEP de {resultado['falhas']} contas (IDs {primeiro} "
+                                   f"a {ultimo}); o lote será conferido de novo na próxima execução.")
+    return resultado
+
+
+def _juntar_contagens(resultados):
+    total = Counter()
+    for resultado in resultados:
+        total.update(resultado)
+    return dict(total)
+
+
+#{'chassi': {chassi: [IDs dos veículos]}, 'placa': {placa: [IDs]}}. A placa é guardada pela menor das suas
+#variantes (antiga e Mercosul), para que as duas formas da mesma placa fiquem juntas
+def _processar_duplicados(conn, primeiro, ultimo):
+    chaves = {'chassi': {}, 'placa': {}}
+    for id_veiculo, _, chassi, placa in obter_repositorio(conn).veiculos_faixa_usuarios(primeiro, ultimo):
+        if chassi:
+            chaves['chassi'].setdefault(normalizar_chassi(chassi), []).append(id_veiculo)
+        if placa:
+            chaves['placa'].setdefault(min(variantes_placa(placa)), []).append(id_veiculo)
+    return chaves
+
+
+def _juntar_chaves(resultados):
+    juntas = {'chassi': {}, 'placa': {}}
+    for resultado in resultados:
+        for tipo, chaves in resultado.items():
+            for chave, ids in chaves.items():
+                juntas[tipo].setdefault(chave, []).extend(ids)
+    return juntas
+
+
+#Só depois de juntar todas as partições dá para saber quais chaves se repetem (o mesmo chassi pode estar em
+#contas de partições diferentes)
+def _finalizar_duplicados(resultado):
+    return {tipo: {chave: sorted(ids) for chave, ids in chaves.items() if len(ids) > 1}
+            for tipo, chaves in resultado.items()}
+
+
+#{'cidades', 'modelos', 'dias'}: as linhas agregadas dos relatórios, só das contas da faixa
+def _processar_relatorios(conn, primeiro, ultimo):
+    return obter_repositorio(conn).relatorios_faixa_usuarios(primeiro, ultimo)
+
+
+#Soma as contagens das linhas com as mesmas chaves: (uf, cidade), (marca, modelo) e o dia
+#Os resultados juntados voltam a ser juntados (lotes -> partição -> tarefa), então saem no mesmo formato
+def _juntar_relatorios(resultados):
+    cidades, modelos, dias = Counter(), {}, Counter()
+    for resultado in resultados:
+        for uf, cidade, quantidade in resultado['cidades']:
+            cidades[(uf, cidade)] += quantidade
+        for marca, modelo, *quantidades in resultado['modelos']:
+            somas = modelos.setdefault((marca, modelo), [0, 0, 0])
+            for i, quantidade in enumerate(quantidades):
+                somas[i] += quantidade
+        for dia, quantidade in resultado['dias']:
+            dias[dia] += quantidade
+    return {'cidades': [[*chave, quantidade] for chave, quantidade in cidades.items()],
+            'modelos': [[*chave, *somas] for chave, somas in modelos.items()],
+            'dias': [[dia, quantidade] for dia, quantidade in dias.items()]}
+
+
+#Os relatórios de relatorios.py (com as opções padrão), a partir das linhas somadas de todas as partições
+def _finalizar_relatorios(resultado):
+    fonte = relatorios.AgregadosProntos(resultado['cidades'], resultado['modelos'], resultado['dias'])
+    return {relatorio: relatorios.gerar(fonte, relatorio) for relatorio in relatorios.RELATORIOS}
+
+
+#Nome -> (processa as contas com ID entre primeiro e ultimo, junta resultados, prepara o resultado final ou None)
+#Os resultados são gravados no arquivo de progresso, então precisam poder ser convertidos para JSON
+TAREFAS = {
+    'enderecos': (_processar_enderecos, _juntar_contagens, None),
+    'duplicados': (_processar_duplicados, _juntar_chaves, _finalizar_duplicados),
+    'relatorios': (_processar_relatorios, _juntar_relatorios, _finalizar_relatorios),
+}
+
+
+#Uma partição falhou. Só com a mensagem, para voltar do processo trabalhador sem depender do tipo do erro original
+class ErroParticao(Exception):
+    pass
+
+
+#Conexão do processo trabalhador, aberta uma vez e usada em todas as partições que ele processar, e a parte dele
+#do limite de consultas à ViaCEP
+_conn = None
+_limitador = None
+
+
+def _iniciar_trabalhador(sqlite, por_segundo):
+    global _conn, _limitador
+    _conn = RepositorioSqlite(sqlite) if sqlite else criar_pool(minimo=1, maximo=1)
+    _limitador = LimitadorTaxa(por_segundo)
+
+
+def _caminho_particao(pasta, indice):
+    return os.path.join(pasta, f'particao_{indice:04d}.jsonl')
+
+
+#Lê o progresso de uma partição: (último ID processado ou None, resultados dos lotes concluídos)
+#Uma última linha incompleta (queda no meio da escrita) é cortada do arquivo, e o lote dela é refeito
+def _ler_progresso(caminho):
+    ultimo_id, resultados = None, []
+    if not os.path.exists(caminho):
+        return ultimo_id, resultados
+    tamanho_valido = 0
+    with open(caminho, 'rb') as arquivo:
+        for linha in arquivo:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            if not linha.endswith(b'\n'):
+                break
+            ultimo_id = registro['ultimo_id']
+            resultados.append(registro['resultado'])
+            tamanho_valido += len(linha)
+    os.truncate(caminho, tamanho_valido)
+    return ultimo_id, resultados
+
+
+#Roda no processo trabalhador: processa as contas com ID maior que depois_de e até ate, em lotes, a partir do
+#ponto anotado no arquivo de progresso. Retorna os resultados da partição já juntados
+def _executar_particao(tarefa, indice, depois_de, ate, caminho, tamanho_lote):
+    processar, juntar, _ = TAREFAS[tarefa]
+    if not _conn:
+        raise ErroParticao(f'Partição {indice + 1}: não foi possível conectar ao banco de dados.')
+    ultimo_id, resultados = _ler_progresso(caminho)
+    if ultimo_id is None:
+        ultimo_id = depois_de
+    repositorio = obter_repositorio(_conn)
+    try:
+        with open(caminho, 'a', encoding='utf-8') as arquivo:
+            while True:
+                fim = repositorio.fim_lote_usuarios(ultimo_id, ate, tamanho_lote)
+                if fim is None:
+                    break
+                resultado = processar(_conn, ultimo_id + 1, fim)
+                #Anotado só depois do commit do lote: numa retomada, no máximo o lote em andamento é refeito
+                arquivo.write(json.dumps({'ultimo_id': fim, 'resultado': resultado}, ensure_ascii=False) + '\n')
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+                resultados.append(resultado)
+                ultimo_id = fim
+    except ERROS_BANCO as e:
+        raise ErroParticao(f'Partição {indice + 1}: erro no banco de dados: {e}') from None
+    #Ex. a ViaCEP não respondeu: o lote não foi anotado e é refeito na próxima execução
+    except servicos.ErroServico as e:
+        raise ErroParticao(f'Partição {indice + 1}: {e}') from None
+    return juntar(resultados)
+
+
+def _apagar_progresso(pasta):
+    for caminho in glob.glob(os.path.join(glob.escape(pasta), 'particao_*.jsonl')):
+        os.remove(caminho)
+    if os.path.exists(os.path.join(pasta, 'particoes.json')):
+        os.remove(os.path.join(pasta, 'particoes.json'))
+    if os.path.isdir(pasta) and not os.listdir(pasta):
+        os.rmdir(pasta)
+
+
+#Divide as contas em partições: lista de [depois_de, ate], cobrindo sem buracos do primeiro ao último ID
+def _planejar(pasta, particoes, sqlite):
+    conn = RepositorioSqlite(sqlite) if sqlite else conectar_banco()
+    if not conn:
+        return None
+    try:
+        faixas = obter_repositorio(conn).faixas_usuarios(particoes)
+    finally:
+        conn.close()
+    limites = [[primeiro - 1 if i == 0 else faixas[i - 1][1], ultimo] for i, (primeiro, ultimo) in enumerate(faixas)]
+    os.makedirs(pasta, exist_ok=True)
+    temporario = os.path.join(pasta, 'particoes.json.tmp')
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(limites, arquivo)
+    os.replace(temporario, os.path.join(pasta, 'particoes.json'))
+    return limites
+
+
+#Executa a tarefa em processos processos. Retorna o resultado final, ou None se a execução não terminou (o
+#progresso fica guardado em diretorio/tarefa e é usado na próxima execução)
+def executar(tarefa, processos, particoes=None, tamanho_lote=TAMANHO_LOTE, diretorio=DIRETORIO_PROGRESSO,
+             sqlite=None, recomecar=False, por_segundo=CONSULTAS_POR_SEGUNDO):
+    pasta = os.path.join(diretorio, tarefa)
+    if recomecar:
+        _apagar_progresso(pasta)
+    if os.path.exists(os.path.join(pasta, 'particoes.json')):
+        with open(os.path.join(pasta, 'particoes.json'), encoding='utf-8') as arquivo:
+            limites = json.load(arquivo)
+        print(f'Continuando a execução interrompida ({len(limites)} partições).')
+    else:
+        limites = _planejar(pasta, particoes or processos * PARTICOES_POR_PROCESSO, sqlite)
+        if limites is None:
+            print("Não foi possível conectar ao banco de dados.")
+            return None
+
+    _, juntar, finalizar = TAREFAS[tarefa]
+    resultados = {}
+    falhas = 0
+    #spawn: cada trabalhador começa do zero, sem herdar as conexões (Oracle, cache de CEPs) do processo principal
+    contexto = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto, initializer=_iniciar_trabalhador,
+                                 initargs=(sqlite, por_segundo / processos)) as executor:
+            futuros = {executor.submit(_executar_particao, tarefa, indice, depois_de, ate,
+                                       _caminho_particao(pasta, indice), tamanho_lote): indice
+                       for indice, (depois_de, ate) in enumerate(limites)}
+            for futuro in as_completed(futuros):
+                try:
+                    resultados[futuros[futuro]] = futuro.result()
+                except ErroParticao as e:
+                    print(e)
+                    falhas += 1
+                    continue
+                #Um trabalhador que morreu (ex. falta de memória) quebra o pool: esta e as partições que ainda
+                #não terminaram falham, mas o progresso delas fica anotado para a próxima execução
+                except BrokenProcessPool:
+                    print(f'Partição {futuros[futuro] + 1}: o processo trabalhador terminou inesperadamente.')
+                    falhas += 1
+                    continue
+                except Exception as e:
+                    print(f'Partição {futuros[futuro] + 1}: erro inesperado: {e!r}')
+                    falhas += 1
+                    continue
+                print(f'Partições concluídas: {len(resultados)} de {len(limites)}')
+    except KeyboardInterrupt:
+        print('Interrompido. Rode o mesmo comando de novo para continuar de onde parou.')
+        return None
+    if falhas:
+        print(f'{falhas} partições não terminaram. Rode o mesmo comando de novo para continuar de onde parou.')
+        return None
+
+    resultado = juntar([resultados[indice] for indice in sorted(resultados)])
+    if finalizar:
+        resultado = finalizar(resultado)
+    _apagar_progresso(pasta)
+    return resultado
+
+
+def imprimir_resultado(tarefa, resultado):
+    if tarefa == 'enderecos':
+        print(f"{resultado.get('conferidas', 0)} contas conferidas, {resultado.get('atualizadas', 0)} endereços "
+              f"atualizados, {resultado.get('sem_endereco', 0)} CEPs sem endereço.")
+        return
+    if tarefa == 'relatorios':
+        for relatorio, linhas in resultado.items():
+            print(f'\n=== {relatorio} ===')
+            relatorios.imprimir_tabela(linhas)
+        return
+    for tipo, grupos in resultado.items():
+        print(f"{len(grupos)} {'chassis repetidos' if tipo == 'chassi' else 'placas repetidas'}.")
+        for chave, ids in list(grupos.items())[:EXEMPLOS_DUPLICADOS]:
+            print(f"  {chave}: veículos {', '.join(map(str, ids))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tarefas em lote do Link Car, divididas entre vários processos.')
+    parser.add_argument('tarefa', choices=list(TAREFAS), help='enderecos, duplicados ou relatorios')
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1, help='Processos trabalhadores')
+    parser.add_argument('--particoes', type=int,
+                        help=f'Faixas de contas (padrão: {PARTICOES_POR_PROCESSO} por processo)')
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Contas por lote (um commit por lote)')
+    parser.add_argument('--progresso', default=DIRETORIO_PROGRESSO, metavar='PASTA',
+                        help='Onde fica o progresso das execuções interrompidas')
+    parser.add_argument('--recomecar', action='store_true',
+                        help='Descarta o progresso de uma execução interrompida e começa do zero')
+    parser.add_argument('--por-segundo', type=float, default=CONSULTAS_POR_SEGUNDO,
+                        help='Consultas por segundo à ViaCEP, somando todos os processos (0: sem limite)')
+    parser.add_argument('--saida', metavar='ARQUIVO', help='Grava o resultado completo em JSON')
+    parser.add_argument('--sqlite', metavar='ARQUIVO', help='Usa um arquivo SQLite em vez do Oracle')
+    args = parser.parse_args()
+    if args.sqlite == ':memory:':
+        parser.error('cada processo teria o seu próprio banco em memória; use um arquivo SQLite')
+
+    inicio = time.perf_counter()
+    resultado = executar(args.tarefa, args.processos, args.particoes, args.lote, args.progresso, args.sqlite,
+                         args.recomecar, args.por_segundo)
+    if resultado is None:
+        sys.exit(1)
+    print(f'Concluído em {time.perf_counter() - inicio:.1f} s.')
+    imprimir_resultado(args.tarefa, resultado)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#Testes sobre o RepositorioSqlite(':memory:'), sem Oracle e sem acesso à ViaCEP
+#Rodar da raiz do projeto: python -m pytest -q
+import os
+import sys
+
+#Lidas na importação dos módulos: hash de senha barato e nenhuma base offline de CEPs
+os.environ.setdefault('LINKCAR_SCRYPT_N', '16')
+os.environ.setdefault('LINKCAR_BASE_CEP', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from repositorio import RepositorioSqlite
+
+
+@pytest.fixture
+def repositorio():
+    repositorio = RepositorioSqlite(':memory:')
+    yield repositorio
+    repositorio.conn.close()
+
+
+#Cria uma conta e retorna o ID. Os campos passados substituem os padrões
+@pytest.fixture
+def novo_usuario(repositorio):
+    def criar(**campos):
+        dados = {'nome': 'Maria', 'email': 'maria@exemplo.com', 'senha': 'senha', 'cep': '01001000', 'uf': 'SP',
+                 'cidade': 'São Paulo', 'rua': 'Praça da Sé', 'bairro': 'Sé'}
+        return repositorio.inserir_usuario({**dados, **campos})
+    return criar
+
+
+#Cadastra um veículo da conta e retorna o ID
+@pytest.fixture
+def novo_veiculo(repositorio):
+    def criar(id_usuario, **campos):
+        dados = {'chassi': '9BWZZZ377VT004251', 'marca': 'Volkswagen', 'modelo': 'Gol', 'cor': 'Prata',
+                 'placa': 'ABC1234'}
+        return repositorio.inserir_veiculo(id_usuario, {**dados, **campos})
+    return criar
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from base_cep import BaseCep, construir
+
+
+@pytest.fixture
+def dumps(tmp_path):
+    csv = tmp_path / 'sp.csv'
+    csv.write_text('cep;logradouro;bairro;localidade;uf\n'
+                   '01001-000;Praça da Sé;Sé;São Paulo;SP\n'
+                   '01310-100;Avenida Paulista;Bela Vista;São Paulo;sp\n'
+                   '0131;CEP curto;;São Paulo;SP\n', encoding='utf-8')
+    jsonl = tmp_path / 'rj.jsonl'
+    jsonl.write_text('\n'.join(json.dumps(linha, ensure_ascii=False) for linha in [
+        {'cep': '20040-002', 'logradouro': 'Avenida Rio Branco', 'bairro': 'Centro', 'localidade': 'Rio de Janeiro',
+         'uf': 'RJ'},
+        {'cep': '99999-999', 'erro': True},
+        #Repetido: vale o último
+        {'cep': '01001000', 'logradouro': 'Praça da Sé - lado ímpar', 'bairro': 'Sé', 'localidade': 'São Paulo',
+         'uf': 'SP'},
+    ]) + '\n', encoding='utf-8')
+    return [str(csv), str(jsonl)]
+
+
+def test_construir_e_consultar(dumps, tmp_path):
+    saida = str(tmp_path / 'base_cep.idx')
+    resultado = construir(dumps, saida)
+    assert {campo: resultado[campo] for campo in ('ceps', 'ignorados')} == {'ceps': 3, 'ignorados': 2}
+
+    base = BaseCep.abrir(saida)
+    try:
+        assert len(base) == 3
+        assert base.consultar('01310100') == {'cep': '01310-100', 'uf': 'SP', 'localidade': 'São Paulo',
+                                              'logradouro': 'Avenida Paulista', 'bairro': 'Bela Vista'}
+        assert base.consultar('01001000')['logradouro'] == 'Praça da Sé - lado ímpar'
+        assert base.consultar('20040002')['localidade'] == 'Rio de Janeiro'
+        assert base.consultar('99999999') is None
+        assert base.consultar('00000000') is None
+        assert base.consultar('abc') is None
+    finally:
+        base.fechar()
+
+
+def test_abrir_sem_base(tmp_path):
+    assert BaseCep.abrir(str(tmp_path / 'base_cep.idx')) is None
+    invalido = tmp_path / 'invalido.idx'
+    invalido.write_bytes(b'X' * 64)
+    assert BaseCep.abrir(str(invalido)) is None
@@ -0,0 +1,55 @@
+from cache_cep import AUSENTE, CacheCep
+
+SE = {'cep': '01001000', 'uf': 'SP', 'cidade': 'São Paulo', 'rua': 'Praça da Sé', 'bairro': 'Sé'}
+
+
+def test_lru_descarta_o_menos_usado():
+    cache = CacheCep(arquivo=None, capacidade=2)
+    cache.guardar('01001000', SE)
+    cache.guardar('20040002', {**SE, 'cep': '20040002'})
+    #Usado agora: o 20040002 passa a ser o menos usado
+    assert cache.obter('01001000') == SE
+    cache.guardar('30130010', {**SE, 'cep': '30130010'})
+    assert list(cache.memoria) == ['01001000', '30130010']
+    assert cache.obter('20040002') is AUSENTE
+
+
+def test_ttl_expirado():
+    cache = CacheCep(arquivo=None, ttl=-1)
+    cache.guardar('01001000', SE)
+    assert cache.obter('01001000') is AUSENTE
+    assert '01001000' not in cache.memoria
+
+
+def test_cache_negativo():
+    cache = CacheCep(arquivo=None)
+    cache.guardar('99999999', None)
+    assert cache.obter('99999999') is None
+    assert cache.estatisticas()['acertos_memoria'] == 1
+
+    expirado = CacheCep(arquivo=None, ttl_negativo=-1)
+    expirado.guardar('99999999', None)
+    assert expirado.obter('99999999') is AUSENTE
+
+
+#Os dados voltam como cópia: alterar o resultado não altera o cache
+def test_obter_retorna_copia():
+    cache = CacheCep(arquivo=None)
+    cache.guardar('01001000', SE)
+    cache.obter('01001000')['rua'] = 'Outra'
+    assert cache.obter('01001000') == SE
+
+
+def test_arquivo_persistente(tmp_path):
+    arquivo = str(tmp_path / 'cache_cep.sqlite3')
+    cache = CacheCep(arquivo=arquivo, ttl_negativo=-1)
+    cache.guardar('01001000', SE)
+    cache.guardar('99999999', None)
+    cache.fechar()
+
+    reaberto = CacheCep(arquivo=arquivo)
+    assert reaberto.obter('01001000') == SE
+    assert reaberto.estatisticas()['acertos_disco'] == 1
+    assert reaberto.obter('99999999') is AUSENTE
+    assert reaberto.limpar_expirados() == 1
+    reaberto.fechar()
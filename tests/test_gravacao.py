@@ -0,0 +1,116 @@
+import json
+import os
+
+import pytest
+
+from gravacao import GravacaoAdiada, evento_auditoria, evento_problema
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / 'teste.spool')
+
+
+def _contar(repositorio, tabela):
+    return repositorio.conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+
+
+def _rejeitados(spool):
+    with open(f'{spool}.rejeitados', encoding='utf-8') as arquivo:
+        return [json.loads(linha) for linha in arquivo]
+
+
+def test_grava_em_lote(repositorio, novo_usuario, novo_veiculo, spool):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    gravacao = GravacaoAdiada(repositorio, arquivo=spool, intervalo=0.05)
+    gravacao.iniciar()
+    for numero in range(10):
+        gravacao.enfileirar(evento_problema(id_usuario, id_veiculo, f'Problema {numero}', 2))
+    gravacao.enfileirar(evento_auditoria(id_usuario, 'veiculo', id_veiculo, 'alterar', {'cor': 'Preto'}))
+    assert gravacao.descarregar()
+    gravacao.encerrar()
+
+    assert (_contar(repositorio, 'problemas'), _contar(repositorio, 'auditoria')) == (10, 1)
+    assert gravacao.estatisticas() == {'pendentes': 0, 'lotes': 0, 'gravados': 11, 'falhas': 0, 'rejeitados': 0}
+    assert not os.path.exists(spool)
+
+
+#O programa caiu com eventos no spool, o último no meio da escrita: os completos são gravados ao iniciar
+def test_spool_gravado_depois_de_uma_queda(repositorio, novo_usuario, novo_veiculo, spool):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    with open(spool, 'w', encoding='utf-8') as arquivo:
+        for numero in range(3):
+            arquivo.write(json.dumps(evento_problema(id_usuario, id_veiculo, f'Problema {numero}', 2)) + '\n')
+        arquivo.write(json.dumps(evento_problema(id_usuario, id_veiculo, 'Incompleto', 2))[:30])
+
+    gravacao = GravacaoAdiada(repositorio, arquivo=spool, intervalo=0.05)
+    gravacao.iniciar()
+    assert gravacao.descarregar()
+    gravacao.encerrar()
+
+    descricoes = [problema['descricao'] for problema in repositorio.problemas_usuario(id_usuario)]
+    assert sorted(descricoes) == ['Problema 0', 'Problema 1', 'Problema 2']
+    assert gravacao.estatisticas()['rejeitados'] == 0
+    assert os.listdir(os.path.dirname(spool)) == []
+
+
+#Um lote que já foi gravado (queda entre o commit e a remoção do arquivo) não é gravado de novo
+def test_lote_ja_gravado_nao_se_repete(repositorio, novo_usuario, novo_veiculo, spool):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    eventos = [evento_problema(id_usuario, id_veiculo, 'Barulho no freio', 1)]
+    assert repositorio.gravar_lote('1-abc', eventos)
+    with open(f'{spool}.1-abc.lote', 'w', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps(eventos[0]) + '\n')
+
+    gravacao = GravacaoAdiada(repositorio, arquivo=spool, intervalo=0.05)
+    gravacao.iniciar()
+    assert gravacao.descarregar()
+    gravacao.encerrar()
+    assert _contar(repositorio, 'problemas') == 1
+    assert not os.path.exists(f'{spool}.1-abc.lote')
+
+
+#Um problema de um veículo apagado vai para os rejeitados, sem impedir a gravação dos outros eventos
+def test_evento_recusado(repositorio, novo_usuario, novo_veiculo, spool):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    apagado = novo_veiculo(id_usuario, chassi='9BWZZZ377VT004252', placa='XYZ9876')
+    repositorio.apagar_veiculo(apagado, id_usuario)
+
+    gravacao = GravacaoAdiada(repositorio, arquivo=spool, intervalo=0.05)
+    gravacao.iniciar()
+    gravacao.enfileirar(evento_problema(id_usuario, id_veiculo, 'Barulho no freio', 1))
+    gravacao.enfileirar(evento_problema(id_usuario, apagado, 'Pneu furado', 2))
+    gravacao.enfileirar(evento_auditoria(id_usuario, 'veiculo', apagado, 'apagar'))
+    assert gravacao.descarregar()
+    gravacao.encerrar()
+
+    assert (_contar(repositorio, 'problemas'), _contar(repositorio, 'auditoria')) == (1, 1)
+    assert gravacao.estatisticas()['gravados'] == 2
+    assert gravacao.estatisticas()['rejeitados'] == 1
+    [rejeitado] = _rejeitados(spool)
+    assert rejeitado['evento']['descricao'] == 'Pneu furado'
+    assert 'ProblemaSemVeiculo' in rejeitado['erro']
+
+
+#Uma linha ruim no meio do arquivo não é a escrita interrompida: vai para os rejeitados, e as outras são gravadas
+def test_linha_corrompida_no_meio(repositorio, novo_usuario, novo_veiculo, spool):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    with open(spool, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps(evento_problema(id_usuario, id_veiculo, 'Antes', 2)) + '\n')
+        arquivo.write('{"tipo": "problema", lixo\n')
+        arquivo.write(json.dumps(evento_problema(id_usuario, id_veiculo, 'Depois', 2)) + '\n')
+
+    gravacao = GravacaoAdiada(repositorio, arquivo=spool, intervalo=0.05)
+    gravacao.iniciar()
+    assert gravacao.descarregar()
+    gravacao.encerrar()
+
+    assert sorted(problema['descricao'] for problema in repositorio.problemas_usuario(id_usuario)) == [
+        'Antes', 'Depois']
+    [rejeitado] = _rejeitados(spool)
+    assert rejeitado['evento'] == {'linha': '{"tipo": "problema", lixo\n'}
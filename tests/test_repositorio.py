@@ -0,0 +1,115 @@
+import pytest
+
+from repositorio import RegistroDuplicado
+from validacao import variantes_placa
+
+
+def test_inserir_e_buscar_usuario(repositorio, novo_usuario):
+    id_usuario = novo_usuario()
+    assert repositorio.email_cadastrado('maria@exemplo.com')
+    assert not repositorio.email_cadastrado('joao@exemplo.com')
+    conta = repositorio.buscar_credenciais('maria@exemplo.com')
+    assert conta == {'id': id_usuario, 'nome': 'Maria', 'email': 'maria@exemplo.com', 'senha': 'senha'}
+    assert repositorio.buscar_credenciais('joao@exemplo.com') is None
+
+
+def test_email_repetido(novo_usuario):
+    novo_usuario()
+    with pytest.raises(RegistroDuplicado) as erro:
+        novo_usuario(nome='Outra Maria')
+    assert erro.value.indice == 'uq_usuarios_email'
+
+
+def test_atualizar_usuario(repositorio, novo_usuario):
+    id_usuario = novo_usuario()
+    repositorio.atualizar_usuario(id_usuario, {'nome': 'Maria Silva', 'senha': 'nova'})
+    conta = repositorio.buscar_credenciais('maria@exemplo.com')
+    assert (conta['nome'], conta['senha']) == ('Maria Silva', 'nova')
+    with pytest.raises(ValueError):
+        repositorio.atualizar_usuario(id_usuario, {'id': 10})
+
+
+def test_inserir_listar_atualizar_apagar_veiculo(repositorio, novo_usuario, novo_veiculo):
+    id_usuario = novo_usuario()
+    id_veiculo = novo_veiculo(id_usuario)
+    assert repositorio.listar_veiculos(id_usuario) == [
+        {'id': id_veiculo, 'marca': 'Volkswagen', 'modelo': 'Gol', 'cor': 'Prata', 'placa': 'ABC1234',
+         'chassi': '9BWZZZ377VT004251'}]
+
+    assert repositorio.atualizar_veiculo(id_veiculo, id_usuario, {'cor': 'Preto'})
+    assert repositorio.obter_veiculo(id_veiculo, id_usuario)['cor'] == 'Preto'
+
+    assert repositorio.apagar_veiculo(id_veiculo, id_usuario)
+    assert repositorio.listar_veiculos(id_usuario) == []
+    assert repositorio.obter_veiculo(id_veiculo, id_usuario) is None
+    assert not repositorio.atualizar_veiculo(id_veiculo, id_usuario, {'cor': 'Azul'})
+    assert not repositorio.apagar_veiculo(id_veiculo, id_usuario)
+
+
+def test_veiculo_de_outro_usuario(repositorio, novo_usuario, novo_veiculo):
+    dono = novo_usuario()
+    outro = novo_usuario(email='joao@exemplo.com')
+    id_veiculo = novo_veiculo(dono)
+    assert repositorio.obter_veiculo(id_veiculo, outro) is None
+    assert not repositorio.atualizar_veiculo(id_veiculo, outro, {'cor': 'Azul'})
+    assert not repositorio.apagar_veiculo(id_veiculo, outro)
+    assert len(repositorio.listar_veiculos(dono)) == 1
+
+
+@pytest.mark.parametrize('campos, indice', [
+    ({'chassi': '9bwzzz377vt004251', 'placa': 'XYZ9876'}, 'ux_veiculos_chassi'),
+    ({'chassi': '9BWZZZ377VT004252', 'placa': 'abc-1234'}, 'ux_veiculos_placa_norm'),
+])
+def test_veiculo_repetido(repositorio, novo_usuario, novo_veiculo, campos, indice):
+    id_usuario = novo_usuario()
+    novo_veiculo(id_usuario)
+    with pytest.raises(RegistroDuplicado) as erro:
+        novo_veiculo(novo_usuario(email='joao@exemplo.com'), **campos)
+    assert erro.value.indice == indice
+
+
+def test_atualizar_para_placa_repetida(repositorio, novo_usuario, novo_veiculo):
+    id_usuario = novo_usuario()
+    novo_veiculo(id_usuario)
+    id_veiculo = novo_veiculo(id_usuario, chassi='9BWZZZ377VT004252', placa='XYZ9876')
+    with pytest.raises(RegistroDuplicado) as erro:
+        repositorio.atualizar_veiculo(id_veiculo, id_usuario, {'placa': 'ABC1234'})
+    assert erro.value.indice == 'ux_veiculos_placa_norm'
+
+
+def test_problemas(repositorio, novo_usuario, novo_veiculo):
+    id_usuario = novo_usuario()
+    outro = novo_usuario(email='joao@exemplo.com')
+    id_veiculo = novo_veiculo(id_usuario)
+    assert repositorio.inserir_problema(id_usuario, id_veiculo, 'Barulho no freio', 1)
+    #O veículo não é do usuário: nada é inserido
+    assert not repositorio.inserir_problema(outro, id_veiculo, 'Pneu furado', 2)
+    problemas = repositorio.problemas_usuario(id_usuario)
+    assert [(p['id_veiculo'], p['descricao'], p['prioridade']) for p in problemas] == [
+        (id_veiculo, 'Barulho no freio', 1)]
+    assert repositorio.problemas_usuario(outro) == []
+
+
+def test_apagar_conta_em_cascata(repositorio, novo_usuario, novo_veiculo):
+    id_usuario = novo_usuario()
+    outro = novo_usuario(email='joao@exemplo.com')
+    id_veiculo = novo_veiculo(id_usuario)
+    id_outro_veiculo = novo_veiculo(outro, chassi='9BWZZZ377VT004252', placa='XYZ9876')
+    repositorio.inserir_problema(id_usuario, id_veiculo, 'Barulho no freio', 1)
+    repositorio.inserir_problema(outro, id_outro_veiculo, 'Pneu furado', 2)
+
+    assert repositorio.apagar_conta(id_usuario)
+    assert not repositorio.email_cadastrado('maria@exemplo.com')
+    contar = lambda tabela: repositorio.conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+    assert (contar('usuarios'), contar('veiculos'), contar('problemas')) == (1, 1, 1)
+    assert len(repositorio.problemas_usuario(outro)) == 1
+    assert not repositorio.apagar_conta(id_usuario)
+
+
+#A placa Mercosul equivalente é procurada pelas variantes (servicos.validar_veiculos)
+def test_identificadores_existentes(repositorio, novo_usuario, novo_veiculo):
+    novo_veiculo(novo_usuario())
+    chassis, placas = repositorio.identificadores_existentes(['9BWZZZ377VT004251', '9BWZZZ377VT004252'],
+                                                             [*variantes_placa('ABC1C34'), 'XYZ9876'])
+    assert chassis == {'9BWZZZ377VT004251'}
+    assert placas == {'ABC1234'}
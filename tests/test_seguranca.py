@@ -0,0 +1,65 @@
+import servicos
+from seguranca import CacheSessoes, SCRYPT_N, gerar_hash_senha, precisa_novo_hash, verificar_senha
+
+
+def test_hash_e_verificacao():
+    guardado = gerar_hash_senha('segredo')
+    assert guardado.startswith(f'scrypt${SCRYPT_N}$')
+    assert guardado != gerar_hash_senha('segredo')
+    assert verificar_senha('segredo', guardado)
+    assert not verificar_senha('Segredo', guardado)
+    assert not verificar_senha('segredo', guardado[:-4])
+    assert not verificar_senha('segredo', '')
+    assert not precisa_novo_hash(guardado)
+    #Custo diferente do atual: vale, mas deve ser regravado
+    antigo = gerar_hash_senha('segredo', n=SCRYPT_N * 2)
+    assert verificar_senha('segredo', antigo)
+    assert precisa_novo_hash(antigo)
+
+
+def test_senha_em_texto_puro_regravada(repositorio, novo_usuario):
+    id_usuario = novo_usuario(senha='senha antiga')
+    assert verificar_senha('senha antiga', 'senha antiga')
+    assert precisa_novo_hash('senha antiga')
+
+    assert servicos.autenticar(repositorio, 'maria@exemplo.com', 'errada') is None
+    assert repositorio.buscar_credenciais('maria@exemplo.com')['senha'] == 'senha antiga'
+
+    usuario = servicos.autenticar(repositorio, 'maria@exemplo.com', 'senha antiga')
+    assert usuario['id'] == id_usuario
+    guardado = repositorio.buscar_credenciais('maria@exemplo.com')['senha']
+    assert guardado.startswith('scrypt$') and not precisa_novo_hash(guardado)
+    assert servicos.autenticar(repositorio, 'maria@exemplo.com', 'senha antiga')['id'] == id_usuario
+
+
+def test_token_alterado():
+    sessoes = CacheSessoes(segredo='teste')
+    usuario = {'id': 1, 'nome': 'Maria', 'email': 'maria@exemplo.com'}
+    token = sessoes.criar(usuario)
+    assert sessoes.validar(token) == usuario
+
+    id_sessao, expira_em, assinatura = token.split('.')
+    assert sessoes.validar(f'{id_sessao}.{int(expira_em) + 3600}.{assinatura}') is None
+    assert sessoes.validar(f'{id_sessao}.{expira_em}.{assinatura[:-1]}A') is None
+    assert sessoes.validar(token + '.') is None
+    assert sessoes.validar(None) is None
+    #Assinado com outro segredo
+    assert CacheSessoes(segredo='outro').validar(token) is None
+
+
+def test_token_expirado():
+    sessoes = CacheSessoes(duracao=-1, segredo='teste')
+    token = sessoes.criar({'id': 1, 'nome': 'Maria', 'email': 'maria@exemplo.com'})
+    assert sessoes.validar(token) is None
+    assert sessoes.sessoes == {}
+
+
+def test_encerrar_sessoes():
+    sessoes = CacheSessoes(segredo='teste')
+    primeiro = sessoes.criar({'id': 1, 'nome': 'Maria', 'email': 'maria@exemplo.com'})
+    segundo = sessoes.criar({'id': 1, 'nome': 'Maria', 'email': 'maria@exemplo.com'})
+    outro = sessoes.criar({'id': 2, 'nome': 'João', 'email': 'joao@exemplo.com'})
+    sessoes.encerrar(primeiro)
+    assert sessoes.validar(primeiro) is None and sessoes.validar(segundo)
+    sessoes.encerrar_usuario(1)
+    assert sessoes.validar(segundo) is None and sessoes.validar(outro)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import tarefas
+
+
+#Seis contas com um veículo cada, e a tarefa de duplicados anotando as faixas de IDs processadas
+@pytest.fixture
+def particao(repositorio, novo_usuario, novo_veiculo, monkeypatch):
+    ids = []
+    for numero in range(6):
+        ids.append(novo_usuario(email=f'conta{numero}@exemplo.com'))
+        novo_veiculo(ids[-1], chassi=f'9BWZZZ377VT00{numero:04d}', placa=f'ABC{numero:04d}')
+    processadas = []
+    processar, juntar, finalizar = tarefas.TAREFAS['duplicados']
+
+    def processar_anotando(conn, primeiro, ultimo):
+        processadas.append((primeiro, ultimo))
+        return processar(conn, primeiro, ultimo)
+
+    monkeypatch.setitem(tarefas.TAREFAS, 'duplicados', (processar_anotando, juntar, finalizar))
+    monkeypatch.setattr(tarefas, '_conn', repositorio)
+    return ids, processadas
+
+
+def test_particao_em_lotes(particao, tmp_path):
+    ids, processadas = particao
+    caminho = tmp_path / 'particao_0000.jsonl'
+    resultado = tarefas._executar_particao('duplicados', 0, 0, ids[-1], str(caminho), 2)
+    assert processadas == [(1, ids[1]), (ids[1] + 1, ids[3]), (ids[3] + 1, ids[5])]
+    assert sorted(resultado['placa']) == [f'ABC{numero:04d}' for numero in range(6)]
+    assert [json.loads(linha)['ultimo_id'] for linha in caminho.read_text(encoding='utf-8').splitlines()] == [
+        ids[1], ids[3], ids[5]]
+
+
+#Queda no meio da escrita do segundo lote: o primeiro não é refeito, a linha incompleta é cortada
+#e o segundo lote é processado de novo
+def test_retoma_depois_de_linha_incompleta(particao, tmp_path):
+    ids, processadas = particao
+    caminho = tmp_path / 'particao_0000.jsonl'
+    completo = tarefas._executar_particao('duplicados', 0, 0, ids[-1], str(caminho), 2)
+    linhas = caminho.read_text(encoding='utf-8').splitlines(keepends=True)
+    caminho.write_text(linhas[0] + linhas[1][:len(linhas[1]) // 2], encoding='utf-8')
+    processadas.clear()
+
+    assert tarefas._ler_progresso(str(caminho)) == (ids[1], [json.loads(linhas[0])['resultado']])
+    assert caminho.read_text(encoding='utf-8') == linhas[0]
+
+    resultado = tarefas._executar_particao('duplicados', 0, 0, ids[-1], str(caminho), 2)
+    assert processadas == [(ids[1] + 1, ids[3]), (ids[3] + 1, ids[5])]
+    assert resultado == completo
+    assert caminho.read_text(encoding='utf-8') == ''.join(linhas)
+
+
+def test_ler_progresso_sem_arquivo(tmp_path):
+    assert tarefas._ler_progresso(str(tmp_path / 'particao_0000.jsonl')) == (None, [])
+
+
+#Uma linha de JSON válido sem o '\n' também pode ter sido cortada no meio (ex. um número)
+def test_ler_progresso_ultima_linha_sem_quebra(tmp_path):
+    caminho = tmp_path / 'particao_0000.jsonl'
+    caminho.write_text('{"ultimo_id": 5, "resultado": {"atualizadas": 1}}\n'
+                       '{"ultimo_id": 10, "resultado": {"atualizadas": 2}}', encoding='utf-8')
+    assert tarefas._ler_progresso(str(caminho)) == (5, [{'atualizadas': 1}])
+    assert caminho.read_text(encoding='utf-8') == '{"ultimo_id": 5, "resultado": {"atualizadas": 1}}\n'
@@ -0,0 +1,47 @@
+import pytest
+
+from validacao import FiltroBloom, digito_verificador, validar_chassi, variantes_placa
+
+
+@pytest.mark.parametrize('chassi, digito', [
+    ('1HGCM82633A004352', '3'),
+    ('11111111111111111', '1'),
+    #Resto 10
+    ('1M8GDM9AXKP042788', 'X'),
+])
+def test_digito_verificador(chassi, digito):
+    assert digito_verificador(chassi) == digito
+
+
+def test_validar_chassi():
+    assert validar_chassi('1HGCM82633A004352')
+    assert validar_chassi('1hgcm8263-3a004352')
+    #Fabricado na América do Norte com o dígito errado
+    assert not validar_chassi('1HGCM82643A004352')
+    #Fora da América do Norte o dígito verificador não é obrigatório
+    assert digito_verificador('9BWZZZ377VT004251') != '7'
+    assert validar_chassi('9BWZZZ377VT004251')
+    assert not validar_chassi('9BWZZZ377VT00425')
+    assert not validar_chassi('9BWZZZ377VT00425I')
+
+
+@pytest.mark.parametrize('placa, variantes', [
+    ('ABC1234', ['ABC1234', 'ABC1C34']),
+    ('abc-1c34', ['ABC1C34', 'ABC1234']),
+    #Letra que não vem de uma placa antiga: sem equivalente
+    ('ABC1Z34', ['ABC1Z34']),
+    ('ABC12', ['ABC12']),
+])
+def test_variantes_placa(placa, variantes):
+    assert variantes_placa(placa) == variantes
+
+
+#Um filtro de Bloom pode dar falso positivo, mas nunca diz que um valor adicionado não está nele
+def test_filtro_bloom_sem_falso_negativo():
+    filtro = FiltroBloom(1000, 0.01)
+    adicionados = [f'9BWZZZ377VT{numero:06d}' for numero in range(1000)]
+    for valor in adicionados:
+        filtro.adicionar(valor)
+    assert all(valor in filtro for valor in adicionados)
+    falsos_positivos = sum(f'ABC{numero:04d}' in filtro for numero in range(10000))
+    assert falsos_positivos < 500
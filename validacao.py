@@ -0,0 +1,232 @@
+#Validação de chassi (VIN, ISO 3779) e placa (antiga e Mercosul)
+#e filtro de Bloom em memória com os chassis e placas já cadastrados, para recusar duplicados sem ir ao banco
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+
+#Chassi: 17 letras e números, sem I, O e Q (que se confundem com 1 e 0)
+PADRAO_CHASSI = re.compile(r'[A-HJ-NPR-Z0-9]{17}')
+#Valor de cada caractere e peso de cada posição no cálculo do dígito verificador (9ª posição)
+VALORES_CHASSI = {**{str(digito): digito for digito in range(10)},
+                  **dict(zip('ABCDEFGH', range(1, 9))), **dict(zip('JKLMN', range(1, 6))),
+                  'P': 7, 'R': 9, **dict(zip('STUVWXYZ', range(2, 10)))}
+PESOS_CHASSI = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+#O dígito verificador só é obrigatório nos veículos fabricados na América do Norte
+REGIOES_DIGITO_OBRIGATORIO = '12345'
+
+#Região de fabricação pelo 1º caractere
+REGIOES_CHASSI = (('12345', 'América do Norte'), ('67', 'Oceania'), ('89', 'América do Sul'),
+                  ('ABCDEFGH', 'África'), ('JKLMNPR', 'Ásia'), ('STUVWXYZ', 'Europa'))
+
+#Fabricantes pelo WMI (3 primeiros caracteres, ou 2 quando o fabricante usa todo o prefixo)
+FABRICANTES_WMI = {
+    '9BW': 'Volkswagen (Brasil)', '9BG': 'Chevrolet (Brasil)', '9BD': 'Fiat (Brasil)', '9BF': 'Ford (Brasil)',
+    '9BR': 'Toyota (Brasil)', '93H': 'Honda (Brasil)', '93Y': 'Renault (Brasil)', '9BH': 'Hyundai (Brasil)',
+    '94D': 'Nissan (Brasil)', '988': 'Jeep (Brasil)', '935': 'Citroën (Brasil)', '936': 'Peugeot (Brasil)',
+    '9BM': 'Mercedes-Benz (Brasil)', '93X': 'Mitsubishi (Brasil)', '9C2': 'Honda Motos (Brasil)',
+    '9C6': 'Yamaha (Brasil)', '8AP': 'Fiat (Argentina)', '8AG': 'Chevrolet (Argentina)',
+    '8AF': 'Ford (Argentina)', '8AJ': 'Toyota (Argentina)', '8AW': 'Volkswagen (Argentina)',
+    '3VW': 'Volkswagen (México)', '3N1': 'Nissan (México)', '1HG': 'Honda (EUA)', '1FA': 'Ford (EUA)',
+    '1G1': 'Chevrolet (EUA)', '5YJ': 'Tesla (EUA)', 'WVW': 'Volkswagen (Alemanha)', 'WBA': 'BMW (Alemanha)',
+    'WDB': 'Mercedes-Benz (Alemanha)', 'WDD': 'Mercedes-Benz (Alemanha)', 'WAU': 'Audi (Alemanha)',
+    'VF1': 'Renault (França)', 'VF3': 'Peugeot (França)', 'ZFA': 'Fiat (Itália)', 'KMH': 'Hyundai (Coreia)',
+    'KNA': 'Kia (Coreia)', 'LSV': 'Volkswagen (China)', 'JT': 'Toyota (Japão)', 'JH': 'Honda (Japão)',
+    'JN': 'Nissan (Japão)',
+}
+
+#Placas: antiga (ABC1234) e Mercosul (ABC1D23), já sem hífen
+PADRAO_PLACA_ANTIGA = re.compile(r'[A-Z]{3}[0-9]{4}')
+PADRAO_PLACA_MERCOSUL = re.compile(r'[A-Z]{3}[0-9][A-Z][0-9]{2}')
+#Na conversão para o Mercosul, o segundo dígito (5º caractere) vira a letra de mesma posição
+LETRAS_MERCOSUL = 'ABCDEFGHIJ'
+
+#Filtro de chassis e placas cadastrados: recarregado do banco a cada TTL_FILTRO segundos, para incluir
+#os veículos cadastrados por outros processos
+TTL_FILTRO = int(os.environ.get('LINKCAR_FILTRO_VEICULOS_TTL', 600))
+TAXA_FALSOS_POSITIVOS = 0.001
+CAPACIDADE_MINIMA_FILTRO = 100000
+#Até esta quantidade de chassis e placas (um veículo: o chassi e as duas formas da placa), a conferência vai
+#direto ao banco, em uma consulta pelos índices; o filtro só é usado nas validações em lote
+MAXIMO_CONSULTA_DIRETA = 3
+
+
+#Chassi sem espaços, pontos e hífens, em maiúsculas
+def normalizar_chassi(chassi):
+    return re.sub(r'[\s.\-]', '', chassi).upper()
+
+
+def digito_verificador(chassi):
+    resto = sum(VALORES_CHASSI[caractere] * peso for caractere, peso in zip(chassi, PESOS_CHASSI)) % 11
+    return 'X' if resto == 10 else str(resto)
+
+
+#Confere o chassi e identifica região e fabricante. Retorna um dicionário com 'valido' e a lista de 'erros'
+def analisar_chassi(chassi):
+    chassi = normalizar_chassi(chassi)
+    erros = []
+    regiao = fabricante = digito_ok = None
+    if len(chassi) != 17:
+        erros.append('Número do chassi inválido! Verifique a quantidade de caracteres...')
+    elif not PADRAO_CHASSI.fullmatch(chassi):
+        erros.append('Número do chassi inválido! Use apenas letras e números, sem as letras I, O e Q.')
+    else:
+        digito_ok = chassi[8] == digito_verificador(chassi)
+        if not digito_ok and chassi[0] in REGIOES_DIGITO_OBRIGATORIO:
+            erros.append('Número do chassi inválido! O dígito verificador (9º caractere) não confere.')
+        regiao = next(nome for inicio, nome in REGIOES_CHASSI if chassi[0] in inicio)
+        fabricante = FABRICANTES_WMI.get(chassi[:3]) or FABRICANTES_WMI.get(chassi[:2])
+    return {'chassi': chassi, 'valido': not erros, 'erros': erros, 'regiao': regiao,
+            'fabricante': fabricante, 'digito_verificador_ok': digito_ok}
+
+
+def validar_chassi(chassi):
+    return analisar_chassi(chassi)['valido']
+
+
+#Placa só com letras e números, em maiúsculas (ex. abc-1234 -> ABC1234)
+def normalizar_placa(placa):
+    return re.sub(r'[^A-Za-z0-9]', '', placa).upper()
+
+
+#Confere a placa. Retorna um dicionário com a placa normalizada, o formato ('antiga' ou 'mercosul') e os erros
+def analisar_placa(placa):
+    placa = normalizar_placa(placa)
+    if PADRAO_PLACA_ANTIGA.fullmatch(placa):
+        formato = 'antiga'
+    elif PADRAO_PLACA_MERCOSUL.fullmatch(placa):
+        formato = 'mercosul'
+    else:
+        formato = None
+    erros = [] if formato else ['Placa inválida! Use o formato ABC1D23 ou ABC-1234.']
+    return {'placa': placa, 'valido': not erros, 'erros': erros, 'formato': formato}
+
+
+def validar_placa(placa):
+    return analisar_placa(placa)['valido']
+
+
+#Formas equivalentes da placa: a antiga (ABC1234) e a convertida para o Mercosul (ABC1C34) são o mesmo carro
+def variantes_placa(placa):
+    placa = normalizar_placa(placa)
+    if PADRAO_PLACA_ANTIGA.fullmatch(placa):
+        return [placa, placa[:4] + LETRAS_MERCOSUL[int(placa[4])] + placa[5:]]
+    if PADRAO_PLACA_MERCOSUL.fullmatch(placa) and placa[4] in LETRAS_MERCOSUL:
+        return [placa, placa[:4] + str(LETRAS_MERCOSUL.index(placa[4])) + placa[5:]]
+    return [placa]
+
+
+#Filtro de Bloom: responde "com certeza não está" ou "talvez esteja" usando poucos bits por item
+class FiltroBloom:
+    def __init__(self, capacidade, taxa_falsos_positivos=TAXA_FALSOS_POSITIVOS):
+        self.capacidade = capacidade
+        self.total_bits = max(64, int(-capacidade * math.log(taxa_falsos_positivos) / math.log(2) ** 2))
+        self.quantidade_hashes = max(1, round(self.total_bits / capacidade * math.log(2)))
+        self.bits = bytearray((self.total_bits + 7) // 8)
+        self.quantidade = 0
+
+    #Posições dos bits do valor: duas metades de um único hash combinadas (double hashing)
+    def _posicoes(self, valor):
+        resumo = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(resumo[:8], 'little')
+        h2 = int.from_bytes(resumo[8:], 'little') | 1
+        return [(h1 + i * h2) % self.total_bits for i in range(self.quantidade_hashes)]
+
+    def adicionar(self, valor):
+        for posicao in self._posicoes(valor):
+            self.bits[posicao >> 3] |= 1 << (posicao & 7)
+        self.quantidade += 1
+
+    def __contains__(self, valor):
+        return all(self.bits[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(valor))
+
+
+#Chassis e placas (normalizados) de todos os veículos, carregados do banco na primeira validação em lote
+#A carga percorre a tabela veiculos inteira, então é feita fora da trava: as recargas rodam em uma thread
+#separada, com os filtros antigos em uso até os novos ficarem prontos e serem trocados de uma vez
+class IdentificadoresVeiculos:
+    def __init__(self, ttl=TTL_FILTRO):
+        self.ttl = ttl
+        self.trava = threading.Lock()
+        self.filtros = None #(chassis, placas)
+        self.expira_em = 0
+        self.carregando = False
+        #Veículos adicionados durante uma carga, que a leitura da tabela pode não ter visto
+        self.adicionados_na_carga = []
+
+    def _carregar(self, repositorio):
+        try:
+            capacidade = max(CAPACIDADE_MINIMA_FILTRO, 2 * repositorio.contar_veiculos())
+            chassis = FiltroBloom(capacidade)
+            placas = FiltroBloom(capacidade)
+            for chassi, placa in repositorio.iterar_identificadores_veiculos():
+                if chassi:
+                    chassis.adicionar(chassi)
+                if placa:
+                    placas.adicionar(placa)
+            with self.trava:
+                for chassi, variantes in self.adicionados_na_carga:
+                    chassis.adicionar(chassi)
+                    for placa in variantes:
+                        placas.adicionar(placa)
+                self.filtros = (chassis, placas)
+                self.expira_em = time.monotonic() + self.ttl
+        finally:
+            with self.trava:
+                self.carregando = False
+                self.adicionados_na_carga = []
+
+    def _recarregar(self, repositorio):
+        try:
+            self._carregar(repositorio)
+        except Exception as e:
+            print(f'Erro ao recarregar o filtro de veículos: {e}')
+
+    #Filtros em uso. Vencidos, são recarregados em segundo plano e continuam valendo até a troca
+    #A primeira carga é feita por quem pediu; retorna None se outra thread já estiver fazendo essa carga
+    def _filtros(self, repositorio):
+        with self.trava:
+            filtros = self.filtros
+            vencidos = filtros is None or time.monotonic() > self.expira_em or \
+                filtros[0].quantidade > filtros[0].capacidade
+            if not vencidos or self.carregando:
+                return filtros
+            self.carregando = True
+        if filtros is None:
+            self._carregar(repositorio)
+            return self.filtros
+        threading.Thread(target=self._recarregar, args=(repositorio,), name='linkcar-filtro-veiculos',
+                         daemon=True).start()
+        return filtros
+
+    #Retorna (chassis, placas) que já estão cadastrados, entre os informados (já normalizados)
+    #Em lote, só os que o filtro indica como "talvez cadastrados" são conferidos no banco
+    def existentes(self, repositorio, chassis, placas):
+        if not chassis and not placas:
+            return set(), set()
+        if len(chassis) + len(placas) <= MAXIMO_CONSULTA_DIRETA:
+            return repositorio.identificadores_existentes(chassis, placas)
+        filtros = self._filtros(repositorio)
+        if filtros is None:
+            return repositorio.identificadores_existentes(chassis, placas)
+        with self.trava:
+            talvez_chassis = [chassi for chassi in chassis if chassi in filtros[0]]
+            talvez_placas = [placa for placa in placas if placa in filtros[1]]
+        if not talvez_chassis and not talvez_placas:
+            return set(), set()
+        return repositorio.identificadores_existentes(talvez_chassis, talvez_placas)
+
+    def adicionar(self, chassi, placas):
+        with self.trava:
+            if self.carregando:
+                self.adicionados_na_carga.append((chassi, list(placas)))
+            if self.filtros is None:
+                return
+            self.filtros[0].adicionar(chassi)
+            for placa in placas:
+                self.filtros[1].adicionar(placa)
+
+
+identificadores_veiculos = IdentificadoresVeiculos()